@@ -1,23 +1,30 @@
 import json
-import openai
-from app.config import OPENAI_BASE_URL, OPENAI_API_KEY, MODEL_NAME
-
-client = openai.AzureOpenAI(
-    azure_endpoint=OPENAI_BASE_URL,
-    api_key=OPENAI_API_KEY,
-    api_version="2024-05-01-preview"
-)
+import time
+import asyncio
+from typing import AsyncGenerator, Dict
+from app.config import MODEL_NAME, AGENT_MAX_STEPS, AGENT_MAX_PROMPT_TOKENS, AGENT_DEADLINE_S
+from app.tools import ToolRegistry
+from app.scratchpad import AgentContext
+from app.utils import count_tokens, calculate_cost
+from app import llm
 
 # Task 3.3a: External Tools
+registry = ToolRegistry()
+
+# Fares move, forecasts less so: cache results briefly, across runs and users
+@registry.register(cache_ttl=300)
 def search_flights(origin: str, destination: str, date: str):
-    """Mock flight search API."""
+    """Search for flights between cities."""
+    # Mock flight search API
     return json.dumps([
         {"airline": "AirNZ", "flight": "NZ101", "price": 150, "currency": "NZD", "time": "08:00"},
         {"airline": "JetStar", "flight": "JQ202", "price": 120, "currency": "NZD", "time": "14:00"}
     ])
 
+@registry.register(cache_ttl=900)
 def get_weather(location: str, date: str):
-    """Mock weather API."""
+    """Get weather forecast for a location."""
+    # Mock weather API
     return json.dumps({
         "location": location,
         "date": date,
@@ -25,82 +32,164 @@ def get_weather(location: str, date: str):
         "temperature": 18
     })
 
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "search_flights",
-            "description": "Search for flights between cities.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "origin": {"type": "string"},
-                    "destination": {"type": "string"},
-                    "date": {"type": "string"}
-                },
-                "required": ["origin", "destination", "date"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_weather",
-            "description": "Get weather forecast for a location.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "location": {"type": "string"},
-                    "date": {"type": "string"}
-                },
-                "required": ["location", "date"]
-            }
+tools = registry.schemas()
+
+class BudgetExhausted(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+SYSTEM_PROMPT = "You are a travel planner. You must plan within budget. Output the final result as a JSON itinerary.dont ask extra questions"
+
+async def stream_planning_agent(prompt: str, max_steps: int = AGENT_MAX_STEPS,
+                                max_prompt_tokens: int = AGENT_MAX_PROMPT_TOKENS,
+                                deadline_s: float = AGENT_DEADLINE_S) -> AsyncGenerator[Dict, None]:
+    """
+    Task 3.3: Autonomous Planning Agent with Tool Calling, as an event stream.
+    Events, as they happen:
+      "step"  - one LLM call: latency, token usage, context size (see
+                app.scratchpad), the tool calls it requested
+      "tool"  - one tool result (status, cache, latency), in completion order
+      "tools" - a step's tool calls finished: wall time vs. their sequential sum
+      "plan"  - the final plan, usage totals and whether the run completed
+    The run is bounded by LLM calls, total prompt tokens and wall time. The
+    call expected to be the last one the budgets allow may not call tools, so
+    the model answers with what it has; if a budget still runs out the loop
+    stops and the plan is partial: the latest assistant text, or the tool
+    results so far.
+    """
+    # Old tool results are compacted into a scratch-pad, so prompts stay bounded as the run grows
+    context = AgentContext(SYSTEM_PROMPT, prompt)
+    start = time.perf_counter()
+    deadline = start + deadline_s
+    steps = prompt_tokens = completion_tokens = last_prompt = 0
+    tool_results = []
+    plan, stop_reason = None, None
+
+    def remaining() -> float:
+        left = deadline - time.perf_counter()
+        if left <= 0:
+            raise BudgetExhausted("deadline")
+        return left
+
+    # Loop for multi-step reasoning
+    try:
+        while True:
+            if steps >= max_steps:
+                raise BudgetExhausted("max_steps")
+            if prompt_tokens >= max_prompt_tokens:
+                raise BudgetExhausted("max_prompt_tokens")
+            # Prompts only grow: if this call and one like it would exceed the token budget, make this the last
+            last_step = steps == max_steps - 1 or prompt_tokens + 2 * last_prompt > max_prompt_tokens
+            step_start = time.perf_counter()
+            context_stats = context.stats()
+            try:
+                response = await asyncio.wait_for(llm.chat_completion(
+                    model=MODEL_NAME,
+                    messages=context.messages(),
+                    tools=tools,
+                    # Out of budget: the model has to answer with what it has
+                    tool_choice="none" if last_step else "auto"
+                ), remaining())
+            except asyncio.TimeoutError:
+                raise BudgetExhausted("deadline")
+            steps += 1
+
+            msg = response.choices[0].message
+            usage = response.usage
+            step_prompt = usage.prompt_tokens if usage else context_stats["context_tokens"]
+            step_completion = usage.completion_tokens if usage else count_tokens(msg.content or "")
+            prompt_tokens += step_prompt
+            last_prompt = step_prompt
+            completion_tokens += step_completion
+            if msg.content:
+                plan = msg.content
+            yield {"type": "step", "data": {
+                "step": steps,
+                "latency_ms": round((time.perf_counter() - step_start) * 1000),
+                "prompt_tokens": step_prompt,
+                "completion_tokens": step_completion,
+                "usage_source": "provider" if usage else "local",
+                **context_stats,
+                "tool_calls": [
+                    {"id": tc.id, "name": tc.function.name, "arguments": tc.function.arguments}
+                    for tc in msg.tool_calls or []
+                ]
+            }}
+
+            if not msg.tool_calls:
+                # Final response
+                break
+            if last_step:
+                # Asked to answer but called tools anyway
+                raise BudgetExhausted("max_steps" if steps >= max_steps else "max_prompt_tokens")
+
+            # The step's tool calls are independent: run them concurrently, reporting each as it finishes
+            tools_start = time.perf_counter()
+            tasks = [asyncio.ensure_future(registry.call(tc.function.name, tc.function.arguments, tc.id)) for tc in msg.tool_calls]
+            try:
+                for next_result in asyncio.as_completed(tasks, timeout=remaining()):
+                    result = await next_result
+                    # Recorded as it's streamed, so a partial plan includes everything the client saw
+                    tool_results.append(result)
+                    yield {"type": "tool", "data": {"step": steps, **result}}
+            except asyncio.TimeoutError:
+                raise BudgetExhausted("deadline")
+            finally:
+                for task in tasks:
+                    task.cancel()
+            results = [task.result() for task in tasks]
+            yield {"type": "tools", "data": {
+                "step": steps,
+                "calls": len(results),
+                "wall_ms": round((time.perf_counter() - tools_start) * 1000, 1),
+                "sequential_ms": round(sum(r["latency_ms"] for r in results), 1)
+            }}
+            context.add_turn(msg, results)
+    except BudgetExhausted as e:
+        stop_reason = e.reason
+        if plan is None:
+            plan = json.dumps({"status": "partial", "stop_reason": stop_reason, "tool_results": [
+                {"name": r["name"], "args": r["args"], "content": r["content"]} for r in tool_results if r["status"] == "ok"
+            ]})
+
+    cached = [r["cache"] for r in tool_results if r["cache"]]
+    yield {"type": "plan", "data": {
+        "plan": plan,
+        "status": "partial" if stop_reason else "complete",
+        "stop_reason": stop_reason,
+        "steps": steps,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": calculate_cost(prompt_tokens, completion_tokens),
+        "latency_ms": round((time.perf_counter() - start) * 1000),
+        "tool_cache": {
+            "calls": len(cached),
+            "served": sum(c != "miss" for c in cached),
+            "hit_rates": {name: stats["hit_rate"] for name, stats in registry.cache_stats().items()}
         }
-    }
-]
+    }}
 
-def run_planning_agent(prompt: str):
-    """Task 3.3: Autonomous Planning Agent with Tool Calling."""
-    messages = [
-        {"role": "system", "content": "You are a travel planner. You must plan within budget. Output the final result as a JSON itinerary.dont ask extra questions"},
-        {"role": "user", "content": prompt}
-    ]
-    
+async def run_planning_agent(prompt: str):
+    """Task 3.3: runs the agent to completion. Returns (plan, reasoning logs)."""
     logs = []
-    
-    # Loop for multi-step reasoning
-    while True:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=messages,
-            tools=tools,
-            tool_choice="auto"
-        )
-        
-        msg = response.choices[0].message
-        messages.append(msg)
-        
-        if msg.tool_calls:
-            for tc in msg.tool_calls:
-                func_name = tc.function.name
-                args = json.loads(tc.function.arguments)
-                
-                # Task 3.3b: Reasoning visible in logs
-                log_entry = f"🛠 Tool Call: {func_name} | Args: {args}"
-                logs.append(log_entry)
-                
-                if func_name == "search_flights":
-                    result = search_flights(**args)
-                elif func_name == "get_weather":
-                    result = get_weather(args.get("location"), args.get("date"))
-                else:
-                    result = "Error: Tool not found"
-                
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tc.id,
-                    "content": result
-                })
-        else:
-            # Final response
-            return msg.content, logs
+    async for event in stream_planning_agent(prompt):
+        data = event["data"]
+        if event["type"] == "step":
+            compacted = f", {data['compacted_turns']} turns compacted" if data["compacted_turns"] else ""
+            logs.append(f"🧠 Step {data['step']}: {data['latency_ms']} ms | {data['prompt_tokens']} prompt + {data['completion_tokens']} completion tokens | context {data['context_tokens']} tokens{compacted}")
+        elif event["type"] == "tool":
+            # Task 3.3b: Reasoning visible in logs
+            status = "" if data["status"] == "ok" else f" | {data['status']}"
+            status += {"hit": " | cached", "shared": " | joined in-flight call"}.get(data["cache"], "")
+            logs.append(f"🛠 Tool Call: {data['name']} | Args: {data['args']} | {data['latency_ms']:.0f} ms{status}")
+        elif event["type"] == "tools" and data["calls"] > 1:
+            logs.append(f"⏱ {data['calls']} tools in parallel: {data['wall_ms']:.0f} ms (sequential: {data['sequential_ms']:.0f} ms)")
+        elif event["type"] == "plan":
+            cache = data["tool_cache"]
+            if cache["calls"]:
+                overall = ", ".join(f"{name} {rate:.0%}" for name, rate in cache["hit_rates"].items())
+                logs.append(f"📦 Tool cache: {cache['served']}/{cache['calls']} calls served from cache (overall hit rate: {overall})")
+            if data["stop_reason"]:
+                logs.append(f"⚠ Stopped after {data['steps']} steps: {data['stop_reason']} budget exhausted, returning a partial result")
+            return data["plan"], logs
@@ -0,0 +1,276 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timezone
+from itertools import product
+from typing import Dict, List, Optional, Sequence
+
+from app.config import DATA_DIR, RAG_RETRIEVAL_MODE, CHUNK_STRATEGY, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, RAG_CONTEXT_TOKENS, INGEST_BATCH_SIZE
+from app.chunking import chunk_pages
+from app.context import assemble_context
+from app.ingest import chunk_ids, batched
+from app.lexical import BM25Index
+from app.vectorstore import BACKENDS, ChromaStore, NumpyStore
+from app.utils import percentile
+
+# Retrieval benchmark: recall@k, MRR and latency percentiles of the retriever
+# over QA sets, optionally sweeping vector backends, chunking, HNSW and
+# retrieval settings on throwaway stores built from a local corpus. Nothing
+# here calls the LLM, so it runs offline. app.rag is imported by the
+# functions that need it, so importing this module for its scoring helpers
+# doesn't pull in the vector store and embedder stack. HNSW settings are
+# passed as a collection `configuration`, which needs chromadb>=1.0.
+#
+# A QA file is JSONL: {"question", "answer", "source"?}. A retrieved chunk is
+# relevant when it contains the answer text (and comes from `source`, if given).
+
+QA_PATH = os.path.join(DATA_DIR, "eval", "lotr_qa.jsonl")
+KS = (1, 5, 10)
+PERCENTILES = (50, 95, 99)
+LATENCY_TARGET_MS = 300  # retrieval p95 promised by /rag/query
+# Metrics compared against a baseline, and whether higher is better
+TRACKED = {"recall@1": True, "recall@5": True, "recall@10": True, "mrr": True,
+           "retrieval_ms.p95": False, "end_to_end_ms.p95": False}
+
+def load_qa(paths: Sequence[str]) -> List[Dict]:
+    qa = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            qa.extend(json.loads(line) for line in f if line.strip())
+    return qa
+
+def is_relevant(hit: Dict, item: Dict) -> bool:
+    if item.get("source") and hit["metadata"].get("source") != item["source"]:
+        return False
+    return item["answer"].lower() in hit["document"].lower()
+
+def first_relevant_ranks(qa: List[Dict], rankings: List[List[Dict]]) -> List[Optional[int]]:
+    """1-based rank of the first relevant hit for each question (None if nothing relevant was retrieved)."""
+    return [
+        next((rank for rank, hit in enumerate(hits, start=1) if is_relevant(hit, item)), None)
+        for item, hits in zip(qa, rankings)
+    ]
+
+def score(ranks: List[Optional[int]], ks: Sequence[int] = KS) -> Dict:
+    """recall@k (share of questions with a relevant hit in the top k) and mean reciprocal rank."""
+    n = len(ranks) or 1
+    metrics = {f"recall@{k}": round(sum(1 for r in ranks if r and r <= k) / n, 4) for k in ks}
+    metrics["mrr"] = round(sum(1 / r for r in ranks if r) / n, 4)
+    return metrics
+
+def latency_summary(values_ms: List[float]) -> Dict:
+    return {f"p{p}": round(percentile(values_ms, p), 2) for p in PERCENTILES}
+
+def evaluate(qa: List[Dict], mode: str, n_results: int, store=None, index: BM25Index = None) -> Dict:
+    """
+    Quality and latency of one retrieval configuration. Quality comes from
+    one batched pass (one forward pass, one vector search); latency from
+    replaying the questions one at a time, as /rag/query serves them:
+    retrieval alone, and end to end up to the prompt (embedding, retrieval,
+    context assembly; no LLM call).
+    """
+    from app import rag
+
+    questions = [item["question"] for item in qa]
+    normalized = [rag.normalize_query(q) for q in questions]
+
+    start = time.perf_counter()
+    embeddings = rag.get_embed_fn()(normalized)
+    rankings = rag.retrieve_many(questions, embeddings, n_results, mode, store, index)
+    batch_ms = (time.perf_counter() - start) * 1000
+    ranks = first_relevant_ranks(qa, rankings)
+
+    retrieval_ms, end_to_end_ms = [], []
+    for question, query in zip(questions, normalized):
+        start = time.perf_counter()
+        embedding = rag.get_embed_fn()([query])[0]
+        retrieval_start = time.perf_counter()
+        hits = rag.retrieve(question, embedding, n_results, mode, store, index)
+        retrieval_ms.append((time.perf_counter() - retrieval_start) * 1000)
+        assemble_context(hits, RAG_CONTEXT_TOKENS)
+        end_to_end_ms.append((time.perf_counter() - start) * 1000)
+
+    return {
+        **score(ranks),
+        "retrieval_ms": latency_summary(retrieval_ms),
+        "end_to_end_ms": latency_summary(end_to_end_ms),
+        "meets_latency_target": percentile(retrieval_ms, 95) <= LATENCY_TARGET_MS,
+        "batch_ms": round(batch_ms, 2),
+        "batch_qps": round(len(qa) / (batch_ms / 1000), 1) if batch_ms else None,
+        "details": [{"question": q, "first_relevant_rank": r} for q, r in zip(questions, ranks)]
+    }
+
+def run_automated_eval(mode: str = RAG_RETRIEVAL_MODE, n_results: int = 10, qa_path: str = QA_PATH) -> Dict:
+    """Task 3.2d: Automated Eval Script (QA set from data/eval, against the live knowledge base)."""
+    results = evaluate(load_qa([qa_path]), mode, n_results)
+    # accuracy: a relevant chunk anywhere in the retrieved set
+    ranks = [d["first_relevant_rank"] for d in results["details"]]
+    accuracy = sum(1 for r in ranks if r) / (len(ranks) or 1)
+    return {"accuracy": accuracy, "retrieval_mode": mode, "n_results": n_results, **results}
+
+def load_corpus(paths: Sequence[str]) -> Dict[str, List[str]]:
+    """Page texts of local files, by source name (file name without extension). Text files split pages on form feeds."""
+    corpus = {}
+    for path in paths:
+        source = os.path.splitext(os.path.basename(path))[0]
+        if path.lower().endswith(".pdf"):
+            from app.ingest import extract_pages
+            corpus[source] = list(extract_pages(path))
+        else:
+            with open(path, encoding="utf-8") as f:
+                corpus[source] = f.read().split("\f")
+    return corpus
+
+def build_store(backend: str, name: str, corpus: Dict[str, List[str]], strategy: str, chunk_size: int, hnsw: Dict, client=None):
+    """
+    Chunk and embed a corpus into a new vector store the way ingest_document
+    does, plus its BM25 index. Overlap keeps the configured overlap/size ratio.
+    Chroma stores live in `client` (in memory); numpy ones in a temp dir.
+    Returns (store, index, build stats).
+    """
+    from app import rag
+
+    start = time.perf_counter()
+    if backend == "numpy":
+        store = NumpyStore(tempfile.mkdtemp(prefix=f"{name}-"))
+    else:
+        store = ChromaStore(client.create_collection(
+            name, embedding_function=None, configuration={"hnsw": dict(hnsw)} if hnsw else None
+        ))
+    overlap = chunk_size * CHUNK_OVERLAP_TOKENS // CHUNK_TOKENS
+    all_ids, all_texts = [], []
+    for source, pages in corpus.items():
+        seen = {}
+        for batch in batched(chunk_pages(pages, strategy, size=chunk_size, overlap=overlap), INGEST_BATCH_SIZE):
+            ids = chunk_ids(source, (chunk.text for chunk in batch), seen)
+            documents = [chunk.text for chunk in batch]
+            store.add(
+                ids=ids,
+                embeddings=rag.get_embed_fn()(documents),
+                documents=documents,
+                metadatas=[
+                    {"source": source, "index": chunk.start, "end": chunk.end, "token_count": chunk.token_count, "chunking": strategy}
+                    for chunk in batch
+                ]
+            )
+            all_ids.extend(ids)
+            all_texts.extend(documents)
+    index = BM25Index(all_ids, all_texts)
+    return store, index, {"chunks": len(all_ids), "build_s": round(time.perf_counter() - start, 2)}
+
+def _drop_store(store, client):
+    if isinstance(store, NumpyStore):
+        store.db.close()
+        shutil.rmtree(store.path)
+    else:
+        client.delete_collection(store.collection.name)
+
+def parse_hnsw(spec: str) -> Dict:
+    """'max_neighbors=16,ef_search=100' -> {"max_neighbors": 16, "ef_search": 100}; 'default' -> {}."""
+    if spec in ("", "default"):
+        return {}
+    return {key.strip(): int(value) for key, value in (item.split("=") for item in spec.split(","))}
+
+def _format_hnsw(hnsw: Dict) -> str:
+    return ",".join(f"{k}={v}" for k, v in sorted(hnsw.items())) or "default"
+
+def sweep(qa: List[Dict], modes: Sequence[str], n_results: Sequence[int], corpus: Dict[str, List[str]] = None,
+          strategy: str = CHUNK_STRATEGY, chunk_sizes: Sequence[int] = (CHUNK_TOKENS,), hnsw: Sequence[Dict] = ({},),
+          backends: Sequence[str] = ("chroma",)) -> Dict:
+    """
+    Evaluate every configuration. With a corpus, one throwaway store is
+    built per (backend, chunk size, HNSW params; numpy search is exact, so
+    HNSW params don't apply to it) and searched with every mode and
+    n_results; without one, the live knowledge base is used and only modes
+    and n_results are swept.
+    Runs are keyed by configuration so two result files can be diffed.
+    """
+    runs = {}
+    if corpus is None:
+        for mode, n in product(modes, n_results):
+            runs[f"live/{mode}/n{n}"] = {"config": {"mode": mode, "n_results": n}, **evaluate(qa, mode, n)}
+    else:
+        client = None
+        if "chroma" in backends:
+            import chromadb
+            client = chromadb.EphemeralClient()
+        builds = [(b, size, params) for b in backends for size in chunk_sizes for params in (hnsw if b == "chroma" else [{}])]
+        for i, (backend, size, params) in enumerate(builds):
+            store, index, build = build_store(backend, f"bench-{os.getpid()}-{i}", corpus, strategy, size, params, client)
+            hnsw_key = _format_hnsw(params) if backend == "chroma" else "exact"
+            for mode, n in product(modes, n_results):
+                config = {"backend": backend, "chunking": strategy, "chunk_size": size, "hnsw": params, "mode": mode, "n_results": n}
+                key = f"{backend}/{strategy}-{size}/{hnsw_key}/{mode}/n{n}"
+                runs[key] = {"config": config, "index": build, **evaluate(qa, mode, n, store, index)}
+            _drop_store(store, client)
+    return {"created_at": datetime.now(timezone.utc).isoformat(), "questions": len(qa), "runs": runs}
+
+def _metric(run: Dict, name: str) -> float:
+    value = run
+    for part in name.split("."):
+        value = value[part]
+    return value
+
+def compare(current: Dict, baseline: Dict, max_recall_drop: float = 0.02, max_latency_increase: float = 0.25) -> Dict:
+    """
+    Per-run deltas of the tracked metrics against a baseline result file.
+    A regression is a quality metric dropping by more than `max_recall_drop`
+    or a latency p95 growing by more than `max_latency_increase` (relative).
+    """
+    deltas, regressions = {}, []
+    for key, run in current["runs"].items():
+        base = baseline["runs"].get(key)
+        if base is None:
+            continue
+        deltas[key] = {}
+        for name, higher_is_better in TRACKED.items():
+            now, before = _metric(run, name), _metric(base, name)
+            deltas[key][name] = round(now - before, 4)
+            if higher_is_better:
+                regressed = before - now > max_recall_drop
+            else:
+                regressed = before > 0 and (now - before) / before > max_latency_increase
+            if regressed:
+                regressions.append({"run": key, "metric": name, "baseline": before, "current": now})
+    return {"deltas": deltas, "regressions": regressions}
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench", description="Retrieval benchmark (offline, no LLM calls).")
+    parser.add_argument("--qa", nargs="+", default=[QA_PATH], help="QA JSONL files")
+    parser.add_argument("--corpus", nargs="+", help="local PDF/text files; omit to benchmark the live knowledge base")
+    parser.add_argument("--modes", nargs="+", default=["dense", "sparse", "hybrid"], choices=["dense", "sparse", "hybrid"])
+    parser.add_argument("--n-results", nargs="+", type=int, default=[10])
+    parser.add_argument("--strategy", default=CHUNK_STRATEGY)
+    parser.add_argument("--chunk-sizes", nargs="+", type=int, default=[CHUNK_TOKENS], help="in the strategy's unit (tokens, or chars for 'char')")
+    parser.add_argument("--backends", nargs="+", default=["chroma"], choices=list(BACKENDS))
+    parser.add_argument("--hnsw", nargs="+", default=["default"], help="e.g. max_neighbors=16,ef_construction=100,ef_search=50")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="earlier results JSON to diff against; exit status 1 on regression")
+    parser.add_argument("--max-recall-drop", type=float, default=0.02)
+    parser.add_argument("--max-latency-increase", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = sweep(
+        load_qa(args.qa), args.modes, args.n_results,
+        corpus=load_corpus(args.corpus) if args.corpus else None,
+        strategy=args.strategy, chunk_sizes=args.chunk_sizes, hnsw=[parse_hnsw(h) for h in args.hnsw],
+        backends=args.backends
+    )
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            results["comparison"] = compare(results, json.load(f), args.max_recall_drop, args.max_latency_increase)
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 1 if results.get("comparison", {}).get("regressions") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+class LRUCache:
+    """Thread-safe LRU cache with optional TTL and hit/miss counters."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl is not None and time.monotonic() - item[1] > self.ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self._data)
+        }
+
+class SemanticCache:
+    """
+    Caches values by embedding. A lookup hits when a stored embedding is
+    within `threshold` cosine similarity of the query embedding. Entries
+    expire after `ttl` seconds, the oldest are evicted beyond `maxsize`, and
+    everything is dropped when the `version` passed to lookup/store changes
+    (e.g. the corpus was re-ingested). Entries stored under a `scope` (e.g.
+    the retrieval settings that produced them) only match lookups in the
+    same scope, without evicting the others.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, threshold: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._keys = []
+        self._vectors = np.empty((0, 0), dtype=np.float32)  # normalized, one row per entry
+        self._values = []
+        self._scopes = []
+        self._stored_at = []
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _sync_version(self, version: Hashable):
+        if version != self._version:
+            self._keys, self._values, self._scopes, self._stored_at = [], [], [], []
+            self._vectors = np.empty((0, 0), dtype=np.float32)
+            self._version = version
+
+    def _evict(self, keep):
+        self._keys = [self._keys[i] for i in keep]
+        self._values = [self._values[i] for i in keep]
+        self._scopes = [self._scopes[i] for i in keep]
+        self._stored_at = [self._stored_at[i] for i in keep]
+        self._vectors = self._vectors[keep]
+
+    def lookup(self, embedding, version: Hashable = None, scope: Hashable = None) -> Optional[Tuple[Any, float]]:
+        """Return (value, similarity) of the closest fresh entry of `scope` above the threshold, or None."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._sync_version(version)
+            if self._keys:
+                now = time.monotonic()
+                fresh = [i for i, t in enumerate(self._stored_at) if now - t <= self.ttl]
+                if len(fresh) < len(self._keys):
+                    self._evict(fresh)
+            if self._keys:
+                similarities = np.where([s == scope for s in self._scopes], self._vectors @ vector, -np.inf)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    return self._values[best], float(similarities[best])
+            self.misses += 1
+            return None
+
+    def store(self, key: Hashable, embedding, value: Any, version: Hashable = None, scope: Hashable = None):
+        vector = self._normalize(embedding)
+        key = (scope, key)
+        with self._lock:
+            self._sync_version(version)
+            if key in self._keys:
+                self._evict([i for i, k in enumerate(self._keys) if k != key])
+            self._keys.append(key)
+            self._values.append(value)
+            self._scopes.append(scope)
+            self._stored_at.append(time.monotonic())
+            self._vectors = vector[None, :] if not len(self._vectors) else np.vstack([self._vectors, vector])
+            if len(self._keys) > self.maxsize:
+                self._evict(list(range(len(self._keys) - self.maxsize, len(self._keys))))
+
+    def clear(self):
+        with self._lock:
+            self._sync_version(object())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self._keys)
+        }
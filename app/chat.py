@@ -1,100 +1,151 @@
-import sqlite3
-import json
-import openai
-from typing import List, Dict, Generator
-from app.config import OPENAI_BASE_URL, OPENAI_API_KEY, MODEL_NAME, SQLITE_PATH
-from app.utils import count_tokens, calculate_cost, Timer
+from typing import List, Dict, AsyncGenerator
+from app.config import MODEL_NAME, CHAT_HISTORY_LIMIT, CHAT_RETENTION, CHAT_CONTEXT_TOKENS, CHAT_WINDOW_SCAN
+from app import llm
+from app.db import connection
+from app.utils import count_tokens, calculate_cost, StreamTimer, run_blocking
 
-client = openai.AzureOpenAI(
-    azure_endpoint=OPENAI_BASE_URL,
-    api_key=OPENAI_API_KEY,
-    api_version="2024-05-01-preview"
-)
+DEFAULT_SESSION = "default"
 
-def init_db():
-    """Initialize SQLite database for chat history."""
-    with sqlite3.connect(SQLITE_PATH) as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                role TEXT,
-                content TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+# Approximate per-message framing overhead of the chat format (role, separators)
+MESSAGE_TOKEN_OVERHEAD = 4
 
-def save_message(role: str, content: str):
-    """Save message and prune to keep last 10."""
-    with sqlite3.connect(SQLITE_PATH) as conn:
-        conn.execute("INSERT INTO messages (role, content) VALUES (?, ?)", (role, content))
-        # Prune: Keep only last 10 rows
-        conn.execute("""
-            DELETE FROM messages WHERE id NOT IN (
-                SELECT id FROM messages ORDER BY id DESC LIMIT 10
-            )
-        """)
+def save_message(role: str, content: str, session_id: str = DEFAULT_SESSION, token_count: int = None) -> int:
+    """Append a message to a session's conversation, storing its token count alongside it."""
+    if token_count is None:
+        token_count = count_tokens(content)
+    with connection() as conn:
+        conn.execute(
+            "INSERT INTO messages (session_id, role, content, token_count) VALUES (?, ?, ?, ?)",
+            (session_id, role, content, token_count)
+        )
+    return token_count
 
-def get_history() -> List[Dict[str, str]]:
-    """Retrieve last 10 messages."""
+def get_history(session_id: str = DEFAULT_SESSION, limit: int = CHAT_HISTORY_LIMIT) -> List[Dict[str, str]]:
+    """Retrieve the last `limit` messages of a session (indexed on session_id, id)."""
     try:
-        with sqlite3.connect(SQLITE_PATH) as conn:
-            cursor = conn.execute("SELECT role, content FROM messages ORDER BY id ASC")
+        with connection() as conn:
+            cursor = conn.execute("""
+                SELECT role, content FROM (
+                    SELECT id, role, content FROM messages
+                    WHERE session_id = ? ORDER BY id DESC LIMIT ?
+                ) ORDER BY id ASC
+            """, (session_id, limit))
             return [{"role": row[0], "content": row[1]} for row in cursor.fetchall()]
     except Exception:
         return []
 
-def stream_chat(user_message: str) -> Generator[str, None, None]:
+def get_context_window(session_id: str = DEFAULT_SESSION, max_tokens: int = CHAT_CONTEXT_TOKENS) -> List[Dict]:
+    """
+    Newest messages of a session whose stored token counts fit in `max_tokens`.
+    The latest message is always included. Cost is bounded by CHAT_WINDOW_SCAN,
+    independent of how long the conversation is.
+    """
+    with connection() as conn:
+        cursor = conn.execute("""
+            SELECT role, content, tokens FROM (
+                SELECT id, role, content, tokens,
+                       SUM(tokens + ?) OVER (ORDER BY id DESC ROWS UNBOUNDED PRECEDING) AS running,
+                       ROW_NUMBER() OVER (ORDER BY id DESC) AS rn
+                FROM (
+                    SELECT id, role, content, COALESCE(token_count, LENGTH(content) / 4) AS tokens
+                    FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?
+                )
+            ) WHERE running <= ? OR rn = 1
+            ORDER BY id ASC
+        """, (MESSAGE_TOKEN_OVERHEAD, session_id, CHAT_WINDOW_SCAN, max_tokens))
+        return [{"role": row[0], "content": row[1], "token_count": row[2]} for row in cursor.fetchall()]
+
+def backfill_token_counts(batch_size: int = 500) -> int:
+    """Compute token counts for messages stored before they were tracked."""
+    total = 0
+    while True:
+        with connection() as conn:
+            rows = conn.execute(
+                "SELECT id, content FROM messages WHERE token_count IS NULL LIMIT ?", (batch_size,)
+            ).fetchall()
+            if not rows:
+                return total
+            conn.executemany(
+                "UPDATE messages SET token_count = ? WHERE id = ?",
+                [(count_tokens(content or ""), id_) for id_, content in rows]
+            )
+        total += len(rows)
+
+def prune_history(keep: int = CHAT_RETENTION) -> int:
+    """Delete all but the newest `keep` messages of every session. Run periodically, not per insert."""
+    with connection() as conn:
+        cursor = conn.execute("""
+            DELETE FROM messages WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY id DESC) AS rn
+                    FROM messages
+                ) WHERE rn > ?
+            )
+        """, (keep,))
+        return cursor.rowcount
+
+async def stream_chat(user_message: str, session_id: str = DEFAULT_SESSION) -> AsyncGenerator[Dict, None]:
     """
     Task 3.1: Conversational Core
     - Streams response
-    - Persists N=10 messages
+    - Persists the conversation per session, sends the newest messages that fit the token budget
     - Calculates telemetry (latency, tokens, cost)
     """
-    init_db()
-    
-    # 1. Save User Message
-    save_message("user", user_message)
-    
-    # 2. Prepare Context
-    history = get_history()
-    
-    # 3. Metrics Setup
-    timer = Timer()
-    timer.start()
-    
-    # 4. Call LLM
+    # Storage and tokenizer failures are reported in the stream too: the response has already started
     try:
-        stream = client.chat.completions.create(
+        # 1. Save User Message (tokenized once, here)
+        await run_blocking(save_message, "user", user_message, session_id)
+        
+        # 2. Prepare Context
+        window = await run_blocking(get_context_window, session_id)
+        history = [{"role": m["role"], "content": m["content"]} for m in window]
+        
+        # 3. Metrics Setup
+        timer = StreamTimer()
+        timer.start()
+        
+        # 4. Call LLM (ask the provider to report billed usage in the final chunk)
+        stream = llm.stream_chat_completion(
             model=MODEL_NAME,
             messages=history,
-            stream=True
+            stream_options={"include_usage": True}
         )
         
-        full_content = ""
+        parts = []
+        usage = None
         
-        for chunk in stream:
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
             if chunk.choices and chunk.choices[0].delta.content:
+                timer.mark_chunk()
                 content = chunk.choices[0].delta.content
-                full_content += content
-                # Yield partial content for streaming UI
-                yield json.dumps({"type": "content", "data": content}) + "\n"
+                parts.append(content)
+                # Yield partial content for streaming UI (coalesced into frames by app.streaming)
+                yield {"type": "content", "data": content}
         
-        # 5. Finalize Metrics
+        # 5. Finalize Metrics (provider usage; local counts only as a fallback)
         latency_ms = timer.stop()
-        save_message("assistant", full_content)
-        
-        prompt_tokens = sum(count_tokens(m['content']) for m in history)
-        completion_tokens = count_tokens(full_content)
+        full_content = "".join(parts)
+        if usage:
+            prompt_tokens = usage.prompt_tokens
+            completion_tokens = usage.completion_tokens
+            await run_blocking(save_message, "assistant", full_content, session_id, completion_tokens)
+        else:
+            completion_tokens = await run_blocking(save_message, "assistant", full_content, session_id)
+            prompt_tokens = sum(m["token_count"] + MESSAGE_TOKEN_OVERHEAD for m in window)
         cost = calculate_cost(prompt_tokens, completion_tokens)
         
         metrics = {
             "prompt_tokens": prompt_tokens,
             "completion_tokens": completion_tokens,
+            "usage_source": "provider" if usage else "local",
             "cost_usd": cost,
-            "latency_ms": round(latency_ms)
+            "latency_ms": round(latency_ms),
+            **timer.stream_metrics(completion_tokens)
         }
         
-        yield json.dumps({"type": "metrics", "data": metrics}) + "\n"
+        yield {"type": "metrics", "data": metrics}
         
     except Exception as e:
-        yield json.dumps({"type": "error", "data": str(e)}) + "\n"
+        yield {"type": "error", "data": str(e)}
@@ -0,0 +1,255 @@
+import re
+import sys
+import json
+import time
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+import tiktoken
+from app.config import CHUNK_STRATEGY, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_BLOCK_CHARS
+from app.utils import get_encoding
+
+# Chunking strategies. All of them consume a stream of page texts (joined with
+# newlines, as the ingestion pipeline produces them) and yield chunks with char
+# offsets into that joined text plus their token count.
+#   char      - fixed char window with overlap (the original chunker)
+#   token     - fixed token window with overlap; streaming and vectorized, the fastest token-aware one
+#   sentence  - whole sentences packed up to the token budget
+#   recursive - paragraphs, then lines, sentences and words, packed up to the token budget
+STRATEGIES = ("char", "token", "sentence", "recursive")
+
+class Chunk(NamedTuple):
+    text: str
+    start: int  # char offset of the chunk in the document
+    end: int
+    token_count: int
+
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+|\n\s*\n')
+_SEPARATORS = ["\n\n", "\n", ". ", " "]
+
+def _blocks(pages: Iterable[str], block_chars: int, cut: str) -> Iterator[Tuple[str, bool]]:
+    """
+    Re-block a page stream into (text, is_last) blocks of about `block_chars`,
+    each ending right after the last `cut` character so words aren't split.
+    """
+    buffer = ""
+    pending = None
+    for page in pages:
+        buffer += page + "\n"
+        if len(buffer) >= block_chars:
+            cut_at = max(buffer.rfind(c) for c in cut)
+            if cut_at > 0:
+                if pending is not None:
+                    yield pending, False
+                pending, buffer = buffer[:cut_at + 1], buffer[cut_at + 1:]
+    if buffer:
+        if pending is not None:
+            yield pending, False
+        pending = buffer
+    if pending is not None:
+        yield pending, True
+
+def _token_char_offsets(text: str, tokens: List[int], encoding: tiktoken.Encoding) -> np.ndarray:
+    """Char offset of every token boundary (len(tokens) + 1 entries), computed with array ops."""
+    lengths = np.fromiter(map(len, encoding.decode_tokens_bytes(tokens)), dtype=np.int64, count=len(tokens))
+    byte_offsets = np.concatenate(([0], np.cumsum(lengths)))
+    raw = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    # Number of UTF-8 lead bytes before each byte offset = char offset
+    leads = np.concatenate(([0], np.cumsum((raw & 0xC0) != 0x80)))
+    return leads[byte_offsets]
+
+def char_windows(pages: Iterable[str], size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP,
+                 encoding: tiktoken.Encoding = None) -> Iterator[Chunk]:
+    """
+    Sliding char window. Yields exactly the chunks slicing the joined text
+    would, while only buffering about one chunk plus one page.
+    """
+    encoding = encoding or get_encoding()
+    step = size - overlap
+    buffer = ""
+    buffer_start = 0  # char offset of buffer[0] in the full text
+    next_offset = 0
+
+    def emit(local):
+        text = buffer[local:local + size]
+        return Chunk(text, next_offset, next_offset + len(text), len(encoding.encode_ordinary(text)))
+
+    for page in pages:
+        buffer += page + "\n"
+        while next_offset + size <= buffer_start + len(buffer):
+            yield emit(next_offset - buffer_start)
+            next_offset += step
+        # Drop text no future chunk can reach
+        drop = next_offset - buffer_start
+        if drop > 0:
+            buffer = buffer[drop:]
+            buffer_start = next_offset
+
+    total = buffer_start + len(buffer)
+    while next_offset < total:
+        yield emit(next_offset - buffer_start)
+        next_offset += step
+
+def token_windows(pages: Iterable[str], size: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS,
+                  encoding: tiktoken.Encoding = None, block_chars: int = CHUNK_BLOCK_CHARS) -> Iterator[Chunk]:
+    """
+    Sliding token window. Text is tokenized a block at a time and token
+    boundaries are mapped back to char offsets with numpy, so chunks are
+    cut on token boundaries and carry exact token counts.
+    """
+    encoding = encoding or get_encoding()
+    step = size - overlap
+    carry = ""
+    carry_start = 0
+
+    for block, last in _blocks(pages, block_chars, " \n"):
+        text = carry + block
+        tokens = encoding.encode_ordinary(text)
+        n = len(tokens)
+        offsets = _token_char_offsets(text, tokens, encoding)
+        s = 0
+        while s < n and (s + size <= n or last):
+            e = min(s + size, n)
+            yield Chunk(text[offsets[s]:offsets[e]], carry_start + int(offsets[s]), carry_start + int(offsets[e]), e - s)
+            if e == n:
+                s = n
+                break
+            s += step
+        # Carry the text of the first window that isn't complete yet
+        cut = int(offsets[s]) if s < n else len(text)
+        carry_start += cut
+        carry = text[cut:]
+
+def _split_long(text: str, spans: List[Tuple[int, int]], counts: List[int], size: int,
+                encoding: tiktoken.Encoding) -> Tuple[List[Tuple[int, int]], List[int]]:
+    """Split pieces longer than `size` tokens into token windows."""
+    out_spans, out_counts = [], []
+    for (start, end), count in zip(spans, counts):
+        if count <= size:
+            out_spans.append((start, end))
+            out_counts.append(count)
+            continue
+        tokens = encoding.encode_ordinary(text[start:end])
+        offsets = _token_char_offsets(text[start:end], tokens, encoding)
+        for s in range(0, len(tokens), size):
+            e = min(s + size, len(tokens))
+            out_spans.append((start + int(offsets[s]), start + int(offsets[e])))
+            out_counts.append(e - s)
+    return out_spans, out_counts
+
+def _pack(text: str, spans: List[Tuple[int, int]], counts: List[int], size: int, overlap: int, base: int) -> Iterator[Chunk]:
+    """
+    Greedily pack contiguous pieces into chunks of at most `size` tokens.
+    Each chunk after the first starts with the trailing pieces of the
+    previous one, up to `overlap` tokens.
+    """
+    i, n = 0, len(spans)
+    while i < n:
+        j, total = i, 0
+        while j < n and (total + counts[j] <= size or j == i):
+            total += counts[j]
+            j += 1
+        start, end = spans[i][0], spans[j - 1][1]
+        yield Chunk(text[start:end], base + start, base + end, total)
+        if j >= n:
+            break
+        k, back = j, 0
+        while k - 1 > i and back + counts[k - 1] <= overlap:
+            k -= 1
+            back += counts[k]
+        i = k
+
+def _split_on(text: str, start: int, end: int, separator: str) -> List[Tuple[int, int]]:
+    """Split text[start:end] after each occurrence of `separator`."""
+    spans = []
+    pos = start
+    while True:
+        found = text.find(separator, pos, end)
+        if found == -1:
+            break
+        spans.append((pos, found + len(separator)))
+        pos = found + len(separator)
+    if pos < end:
+        spans.append((pos, end))
+    return spans
+
+def sentence_chunks(pages: Iterable[str], size: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS,
+                    encoding: tiktoken.Encoding = None, block_chars: int = CHUNK_BLOCK_CHARS) -> Iterator[Chunk]:
+    """Pack whole sentences into chunks of up to `size` tokens (overlap in whole sentences)."""
+    encoding = encoding or get_encoding()
+    base = 0
+    for block, _ in _blocks(pages, block_chars, "\n"):
+        spans = []
+        start = 0
+        for match in _SENTENCE_END.finditer(block):
+            spans.append((start, match.end()))
+            start = match.end()
+        if start < len(block):
+            spans.append((start, len(block)))
+        counts = [len(t) for t in encoding.encode_ordinary_batch([block[s:e] for s, e in spans])]
+        spans, counts = _split_long(block, spans, counts, size, encoding)
+        yield from _pack(block, spans, counts, size, overlap, base)
+        base += len(block)
+
+def recursive_chunks(pages: Iterable[str], size: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS,
+                     encoding: tiktoken.Encoding = None, block_chars: int = CHUNK_BLOCK_CHARS) -> Iterator[Chunk]:
+    """Split by paragraphs, then lines, sentences and words until pieces fit; then pack them."""
+    encoding = encoding or get_encoding()
+    base = 0
+    for block, _ in _blocks(pages, block_chars, "\n"):
+        spans = [(0, len(block))]
+        counts = [len(encoding.encode_ordinary(block))]
+        for separator in _SEPARATORS:
+            if all(c <= size for c in counts):
+                break
+            new_spans = []
+            for (s, e), count in zip(spans, counts):
+                new_spans.extend([(s, e)] if count <= size else _split_on(block, s, e, separator))
+            spans = new_spans
+            counts = [len(t) for t in encoding.encode_ordinary_batch([block[s:e] for s, e in spans])]
+        spans, counts = _split_long(block, spans, counts, size, encoding)
+        yield from _pack(block, spans, counts, size, overlap, base)
+        base += len(block)
+
+_CHUNKERS = {
+    "char": char_windows,
+    "token": token_windows,
+    "sentence": sentence_chunks,
+    "recursive": recursive_chunks,
+}
+
+def chunk_pages(pages: Iterable[str], strategy: str = CHUNK_STRATEGY, **kwargs) -> Iterator[Chunk]:
+    """Chunk a stream of page texts with the given strategy (see STRATEGIES)."""
+    if strategy not in _CHUNKERS:
+        raise ValueError(f"Unknown chunking strategy '{strategy}', expected one of {STRATEGIES}")
+    return _CHUNKERS[strategy](pages, **kwargs)
+
+def benchmark(pages: List[str], strategies=STRATEGIES) -> dict:
+    """Chunking throughput and chunk-size statistics of each strategy over the same pages."""
+    total_chars = sum(len(p) + 1 for p in pages)
+    results = {}
+    for strategy in strategies:
+        start = time.perf_counter()
+        chunks = list(chunk_pages(pages, strategy))
+        elapsed = time.perf_counter() - start
+        tokens = np.array([c.token_count for c in chunks]) if chunks else np.zeros(1)
+        results[strategy] = {
+            "chunks": len(chunks),
+            "seconds": round(elapsed, 4),
+            "chars_per_sec": round(total_chars / elapsed) if elapsed else None,
+            "tokens_mean": round(float(tokens.mean()), 1),
+            "tokens_std": round(float(tokens.std()), 1),
+            "tokens_max": int(tokens.max())
+        }
+    return results
+
+if __name__ == "__main__":
+    # Usage: python -m app.chunking <file.pdf|file.txt> [strategy ...]
+    path = sys.argv[1]
+    if path.lower().endswith(".pdf"):
+        from app.ingest import extract_pages
+        pages = list(extract_pages(path))
+    else:
+        with open(path, encoding="utf-8") as f:
+            pages = f.read().split("\f")
+    print(json.dumps(benchmark(pages, sys.argv[2:] or STRATEGIES), indent=2))
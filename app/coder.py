@@ -1,16 +1,17 @@
-import os
-import subprocess
-import openai
-import unittest
-from app.config import OPENAI_BASE_URL, OPENAI_API_KEY, MODEL_NAME, CODE_ENV_PATH
+from app.config import MODEL_NAME
+from app import llm, sandbox
 
-client = openai.AzureOpenAI(
-    azure_endpoint=OPENAI_BASE_URL,
-    api_key=OPENAI_API_KEY,
-    api_version="2024-05-01-preview"
-)
+def _describe_failure(result) -> str:
+    """Why a sandboxed run failed, in words the model can act on."""
+    if result["status"] == "timeout":
+        return f"Timed out after {result['duration_ms'] / 1000:.1f}s (infinite loop or blocking call?)"
+    if result["status"] == "killed":
+        reason = {"SIGXCPU": "CPU time limit", "SIGKILL": "killed, likely over a resource limit",
+                  "SIGXFSZ": "file size limit", "SIGSEGV": "segmentation fault"}.get(result["signal"])
+        return f"Killed by {result['signal']}" + (f" ({reason})" if reason else "")
+    return f"Exited with code {result['returncode']}"
 
-def generate_and_heal_code(task_description: str):
+async def generate_and_heal_code(task_description: str):
     """Task 3.4: Self-Healing Code Assistant."""
     
     system_prompt = """
@@ -32,7 +33,7 @@ def generate_and_heal_code(task_description: str):
         yield f"🔄 Attempt {attempt + 1}/{max_attempts}: Generating code..."
         
         # 1. Generate Code
-        response = client.chat.completions.create(
+        response = await llm.chat_completion(
             model=MODEL_NAME,
             messages=messages
         )
@@ -41,29 +42,27 @@ def generate_and_heal_code(task_description: str):
         # Clean markdown if present
         code = code.replace("```python", "").replace("```", "").strip()
         
-        # 2. Write to Disk
-        file_path = os.path.join(CODE_ENV_PATH, "solution.py")
-        with open(file_path, "w") as f:
-            f.write(code)
-            
-        # 3. Execute Tests
+        # 2. Execute Tests in a fresh sandbox (own temp dir, resource limits, wall-clock timeout)
         yield f"🧪 Running tests..."
-        proc = subprocess.run(
-            ["python", file_path],
-            capture_output=True,
-            text=True
-        )
+        try:
+            result = await sandbox.pool.run_python(code)
+        except sandbox.SandboxBusyError as e:
+            yield f"⚠️ {e}"
+            return
+        stderr = result["stderr"]
+        if result["stderr_truncated"]:
+            stderr += "\n[output truncated]"
         
-        if proc.returncode == 0:
-            yield "✅ Success! All tests passed."
-            yield f"\nCode Output:\n{proc.stderr}" # unittest output usually goes to stderr
+        if result["status"] == "passed":
+            yield f"✅ Success! All tests passed ({result['duration_ms']:.0f} ms)."
+            yield f"\nCode Output:\n{stderr}" # unittest output usually goes to stderr
             yield f"\nFinal Code:\n{code}"
             return
         else:
-            error_msg = proc.stderr
+            error_msg = f"{_describe_failure(result)}\n{stderr}".strip()
             yield f"❌ Tests Failed:\n{error_msg}"
             
-            # 4. Feed back errors
+            # 3. Feed back errors
             messages.append({"role": "assistant", "content": code})
             messages.append({"role": "user", "content": f"The code failed with this error. Fix it:\n{error_msg}"})
             
@@ -6,14 +6,135 @@ load_dotenv()
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME", "Gpt4o")
+OPENAI_API_VERSION = os.getenv("OPENAI_API_VERSION", "2024-05-01-preview")
+
+# Concurrency
+# Threads used to run blocking / CPU-bound work (embedding, tiktoken, SQLite)
+# off the event loop.
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+# LLM Gateway
+# Shared keep-alive HTTP pool
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "50"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+# Max in-flight requests per deployment, e.g. LLM_DEPLOYMENT_CONCURRENCY="Gpt4o=32,gpt-35=8"
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))
+LLM_DEPLOYMENT_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, limit in (
+        item.split("=", 1) for item in os.getenv("LLM_DEPLOYMENT_CONCURRENCY", "").split(",") if "=" in item
+    )
+}
+# Backpressure: callers waiting for a slot beyond these limits get a 503
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "500"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# Retry with jittered exponential backoff (honours Retry-After)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+
+# Streaming: coalesce token deltas into frames every N ms or N bytes, whichever comes first
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "30"))
+STREAM_FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", "256"))
+
+# Embeddings (see app/embedder.py)
+# Local lightweight model for speed (<=300ms target); all-MiniLM-L6-v2 is fast and effective for English text
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+# Concurrent requests are coalesced into micro-batches of up to EMBED_MAX_BATCH texts;
+# a request waits at most EMBED_MAX_WAIT_MS for its batch to fill
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "2"))
+# Unix socket of the shared embedding service (python -m app.embedder); unset = each process loads the model
+EMBED_SOCKET = os.getenv("EMBED_SOCKET", "")
+
+# RAG ingestion
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "token")  # char | token | sentence | recursive (see app/chunking.py)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))  # chars, "char" strategy
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))  # tokens, token-aware strategies
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
+CHUNK_BLOCK_CHARS = int(os.getenv("CHUNK_BLOCK_CHARS", "65536"))  # text tokenized per step when streaming
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))  # page-extraction processes
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "16"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))  # chunks embedded + stored per batch
+INGEST_DOWNLOAD_CHUNK = int(os.getenv("INGEST_DOWNLOAD_CHUNK", str(1024 * 1024)))
+INGEST_TIMEOUT = float(os.getenv("INGEST_TIMEOUT", "60"))
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "1"))  # ingestion jobs run concurrently
+# A running job's process renews its lease every third of this; a job whose lease expired (its process died) is requeued
+INGEST_JOB_LEASE_S = int(os.getenv("INGEST_JOB_LEASE_S", "60"))
+INGEST_NICE = int(os.getenv("INGEST_NICE", "10"))  # CPU niceness of ingestion threads/processes, so queries win
+
+# RAG retrieval
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # chroma | numpy (exact search over a memory-mapped matrix)
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")  # numpy backend storage: float32 | float16
+RAG_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")  # dense | sparse | hybrid
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "5"))  # chunks put in the prompt
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", "20"))  # per-retriever candidates fused in hybrid mode
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "3000"))  # token budget of the assembled context
+RAG_BATCH_MAX = int(os.getenv("RAG_BATCH_MAX", "100"))  # queries per /rag/query/batch request
+RAG_BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", "8"))  # concurrent generations per batch
+
+# RAG caches
+RAG_EMBED_CACHE_SIZE = int(os.getenv("RAG_EMBED_CACHE_SIZE", "4096"))  # query embeddings (LRU)
+RAG_ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "1024"))  # semantic answer cache
+RAG_ANSWER_CACHE_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600"))  # seconds
+RAG_ANSWER_CACHE_THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95"))  # cosine similarity
+
+# Agent
+# Budgets of one planning-agent run; when one runs out the run stops with a partial result
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "8"))  # LLM calls
+AGENT_MAX_PROMPT_TOKENS = int(os.getenv("AGENT_MAX_PROMPT_TOKENS", "50000"))  # summed over all LLM calls
+AGENT_DEADLINE_S = float(os.getenv("AGENT_DEADLINE_S", "60"))  # wall time
+# Agent context: past this many tokens the oldest turns are compacted into a scratch-pad of
+# tool-result summaries (AGENT_SUMMARY_TOKENS each); the newest AGENT_KEEP_TURNS stay verbatim
+AGENT_CONTEXT_TOKENS = int(os.getenv("AGENT_CONTEXT_TOKENS", "3000"))
+AGENT_KEEP_TURNS = int(os.getenv("AGENT_KEEP_TURNS", "2"))
+AGENT_SUMMARY_TOKENS = int(os.getenv("AGENT_SUMMARY_TOKENS", "120"))
+AGENT_TOOL_TIMEOUT = float(os.getenv("AGENT_TOOL_TIMEOUT", "10"))  # seconds per tool call (tools may override)
+# Tool result cache, per tool: TTL in seconds (0 = not cached) and max entries, overriding the
+# tool's registered defaults, e.g. AGENT_TOOL_CACHE_TTL="search_flights=300,get_weather=900"
+AGENT_TOOL_CACHE_TTL = {
+    name.strip(): float(ttl)
+    for name, ttl in (item.split("=", 1) for item in os.getenv("AGENT_TOOL_CACHE_TTL", "").split(",") if "=" in item)
+}
+AGENT_TOOL_CACHE_SIZE = {
+    name.strip(): int(size)
+    for name, size in (item.split("=", 1) for item in os.getenv("AGENT_TOOL_CACHE_SIZE", "").split(",") if "=" in item)
+}
+
+# Code sandbox (see app/sandbox.py): limits of one run of generated code
+SANDBOX_TIMEOUT_S = float(os.getenv("SANDBOX_TIMEOUT_S", "15"))  # wall clock
+SANDBOX_CPU_S = int(os.getenv("SANDBOX_CPU_S", "10"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "512"))  # address space
+SANDBOX_FILE_MB = int(os.getenv("SANDBOX_FILE_MB", "16"))  # largest file it may write
+SANDBOX_MAX_PROCS = int(os.getenv("SANDBOX_MAX_PROCS", "64"))  # per user (not enforced for root)
+SANDBOX_OUTPUT_BYTES = int(os.getenv("SANDBOX_OUTPUT_BYTES", "65536"))  # captured per stream
+# Concurrent runs per process; callers beyond SANDBOX_MAX_QUEUE waiting are turned away
+SANDBOX_CONCURRENCY = int(os.getenv("SANDBOX_CONCURRENCY", str(os.cpu_count() or 1)))
+SANDBOX_MAX_QUEUE = int(os.getenv("SANDBOX_MAX_QUEUE", "32"))
 
 # Paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 CHROMA_PATH = os.path.join(DATA_DIR, "chroma")
+VECTOR_STORE_PATH = os.path.join(DATA_DIR, "vectors")  # numpy backend
 SQLITE_PATH = os.path.join(DATA_DIR, "chat_history.db")
+LEXICAL_INDEX_PATH = os.path.join(DATA_DIR, "bm25.joblib")
 CODE_ENV_PATH = os.path.join(DATA_DIR, "code_env")
 
+# Chat store
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "10"))  # messages returned by /chat/history
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "4000"))  # token budget of history sent to the model
+CHAT_WINDOW_SCAN = int(os.getenv("CHAT_WINDOW_SCAN", "200"))  # newest messages considered for the window
+CHAT_RETENTION = int(os.getenv("CHAT_RETENTION", "1000"))  # messages kept per session
+
+# Startup: subsystems that must be ready before /readyz reports ready (see app.health);
+# RAG loads in the background and its routes initialize it on demand
+READY_SUBSYSTEMS = [s for s in os.getenv("READY_SUBSYSTEMS", "db").split(",") if s]
+
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(CHROMA_PATH, exist_ok=True)
 os.makedirs(CODE_ENV_PATH, exist_ok=True)
@@ -0,0 +1,96 @@
+from typing import Callable, Dict, List
+from app.utils import count_tokens, get_encoding
+
+# Retrieved chunks overlap (sliding-window chunking) and neighbours are often
+# retrieved together. Pasting them verbatim repeats text the model already
+# has, so hits from the same source are merged into contiguous spans first.
+
+def _span_end(hit: Dict) -> int:
+    metadata = hit["metadata"]
+    return metadata.get("end", metadata["index"] + len(hit["document"]))
+
+def merge_spans(hits: List[Dict]) -> List[Dict]:
+    """
+    Merge overlapping or adjacent chunks of the same source into spans,
+    using each chunk's char offset (`index` metadata). Each span keeps the
+    best (lowest) rank of the chunks it absorbed.
+    """
+    by_source: Dict[str, List[Dict]] = {}
+    for rank, hit in enumerate(hits):
+        start = hit["metadata"].get("index")
+        if start is None:
+            # No offset information: the chunk stands alone
+            by_source.setdefault(object(), []).append(
+                {"source": hit["metadata"]["source"], "start": 0, "end": len(hit["document"]), "text": hit["document"], "rank": rank, "chunks": 1}
+            )
+            continue
+        by_source.setdefault(hit["metadata"]["source"], []).append(
+            {"source": hit["metadata"]["source"], "start": start, "end": _span_end(hit), "text": hit["document"], "rank": rank, "chunks": 1}
+        )
+
+    spans = []
+    for pieces in by_source.values():
+        pieces.sort(key=lambda p: p["start"])
+        current = pieces[0]
+        for piece in pieces[1:]:
+            if piece["start"] <= current["end"]:
+                if piece["end"] > current["end"]:
+                    current["text"] += piece["text"][current["end"] - piece["start"]:]
+                    current["end"] = piece["end"]
+                current["rank"] = min(current["rank"], piece["rank"])
+                current["chunks"] += 1
+            else:
+                spans.append(current)
+                current = piece
+        spans.append(current)
+    return sorted(spans, key=lambda s: s["rank"])
+
+def _truncate(text: str, max_tokens: int) -> str:
+    encoding = get_encoding()
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+def assemble_context(hits: List[Dict], max_tokens: int, count: Callable[[str], int] = count_tokens,
+                     min_fragment_tokens: int = 64) -> Dict:
+    """
+    Build the prompt context from ranked hits: merge overlapping chunks,
+    drop repeated text, then add spans in score order until `max_tokens`.
+    A span that doesn't fit is truncated if at least `min_fragment_tokens`
+    remain, otherwise skipped.
+    """
+    naive_tokens = sum(count(hit["document"]) for hit in hits)
+
+    seen = set()
+    parts = []
+    citations = []
+    used = 0
+    for span in merge_spans(hits):
+        key = " ".join(span["text"].split())
+        if not key or key in seen:
+            continue
+        seen.add(key)
+
+        text = span["text"]
+        tokens = count(text)
+        remaining = max_tokens - used
+        if tokens > remaining:
+            if remaining < min_fragment_tokens:
+                continue
+            text = _truncate(text, remaining)
+            tokens = count(text)
+
+        parts.append(f"[Citation {len(parts) + 1}, Source: {span['source']}]: {text}\n\n")
+        used += tokens
+
+        # Create a snippet for the citation
+        snippet = text.replace('\n', ' ').strip()[:80] + '...'
+        citation_with_snippet = f"{span['source']}: \"{snippet}\""
+        if citation_with_snippet not in citations:
+            citations.append(citation_with_snippet)
+
+    return {
+        "context": "".join(parts),
+        "citations": citations,
+        "spans": len(parts),
+        "context_tokens": used,
+        "tokens_saved": max(0, naive_tokens - used)
+    }
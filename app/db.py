@@ -0,0 +1,196 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+from app.config import SQLITE_PATH, SQLITE_POOL_SIZE
+
+# Schema migrations, applied in order. PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    # 1: original chat history table
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        role TEXT,
+        content TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # 2: per-session conversations
+    """
+    ALTER TABLE messages ADD COLUMN session_id TEXT NOT NULL DEFAULT 'default';
+    CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+    """,
+    # 3: token count computed once at insert time (NULL for legacy rows until backfilled)
+    """
+    ALTER TABLE messages ADD COLUMN token_count INTEGER;
+    """,
+    # 4: fingerprints of ingested documents, for idempotent re-ingestion
+    """
+    CREATE TABLE IF NOT EXISTS documents (
+        source TEXT PRIMARY KEY,
+        url TEXT,
+        fingerprint TEXT,
+        etag TEXT,
+        last_modified TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    # 5: documents becomes the registry of ingested sources
+    """
+    ALTER TABLE documents ADD COLUMN status TEXT NOT NULL DEFAULT 'ready';
+    ALTER TABLE documents ADD COLUMN chunk_count INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE documents ADD COLUMN byte_size INTEGER;
+    ALTER TABLE documents ADD COLUMN ingested_at DATETIME;
+    """,
+    # 6: key/value metadata (corpus_version is bumped on every corpus change)
+    """
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('corpus_version', 0);
+    """,
+    # 7: chunking strategy used for each document
+    """
+    ALTER TABLE documents ADD COLUMN chunking TEXT;
+    """,
+    # 8: ingestion jobs (queued -> running -> succeeded | failed | cancelled)
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        url TEXT NOT NULL,
+        chunking TEXT,
+        priority INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'queued',
+        pages INTEGER NOT NULL DEFAULT 0,
+        chunks INTEGER NOT NULL DEFAULT 0,
+        result TEXT,
+        error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        started_at DATETIME,
+        finished_at DATETIME
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+    """,
+    # 9: process running each job, and when it last renewed its lease
+    """
+    ALTER TABLE jobs ADD COLUMN owner TEXT;
+    ALTER TABLE jobs ADD COLUMN heartbeat_at DATETIME;
+    """,
+    # 10: at most one active job per document (older duplicates are cancelled first)
+    """
+    UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+    WHERE status IN ('queued', 'running') AND rowid NOT IN (
+        SELECT MIN(rowid) FROM jobs WHERE status IN ('queued', 'running') GROUP BY source, url, chunking
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active ON jobs (source, url, chunking) WHERE status IN ('queued', 'running');
+    """,
+    # 11: a job being cancelled is still active (its ingestion hasn't stopped yet)
+    """
+    DROP INDEX IF EXISTS idx_jobs_active;
+    UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+    WHERE status IN ('queued', 'running', 'cancelling') AND rowid NOT IN (
+        SELECT MIN(rowid) FROM jobs WHERE status IN ('queued', 'running', 'cancelling') GROUP BY source, url, chunking
+    );
+    CREATE UNIQUE INDEX idx_jobs_active ON jobs (source, url, chunking) WHERE status IN ('queued', 'running', 'cancelling');
+    """,
+]
+
+class ConnectionPool:
+    """
+    Fixed-size pool of long-lived SQLite connections in WAL mode.
+    WAL lets readers proceed while a writer commits, so concurrent chat
+    sessions don't serialize on the database file lock.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; the block runs in a transaction that commits on success."""
+        conn = self._acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+def _statements(script: str):
+    """Split a migration script into statements (executescript would commit the open transaction first)."""
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ""
+
+def migrate(conn: sqlite3.Connection):
+    """
+    Apply any migrations newer than the database's user_version. The version
+    is read and the migrations applied under one write lock, so processes
+    starting together don't both apply the same migration.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for i, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in _statements(script):
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {i}")
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def init_db(path: str = SQLITE_PATH, pool_size: int = SQLITE_POOL_SIZE) -> ConnectionPool:
+    """Open the connection pool and migrate the schema. Runs once per process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.path != path:
+            if _pool is not None:
+                _pool.close()
+            pool = ConnectionPool(path, pool_size)
+            with pool.connection() as conn:
+                migrate(conn)
+            _pool = pool
+    return _pool
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection, initializing the pool on first use."""
+    pool = _pool or init_db()
+    with pool.connection() as conn:
+        yield conn
@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+from bisect import bisect_left
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from app.config import EMBED_MODEL, EMBED_MAX_BATCH, EMBED_MAX_WAIT_MS, EMBED_SOCKET
+
+# Embedding service. Concurrent embedding requests are coalesced into
+# micro-batches (at most EMBED_MAX_BATCH texts, waiting at most
+# EMBED_MAX_WAIT_MS for a batch to fill) and run one forward pass at a time,
+# so throughput grows with concurrency instead of requests fighting over
+# the CPU. app.rag batches in-process by default; with EMBED_SOCKET set,
+# every uvicorn worker and ingestion job shares one model served by
+#   python -m app.embedder [--socket PATH]
+#
+# Wire format (Unix stream socket): frames of a 4-byte big-endian length and
+# a payload. A request is a JSON frame, {"op": "embed", "texts": [...]} or
+# {"op": "stats"}; the reply is a JSON frame ({"shape": [n, dim]} is followed
+# by a frame of float32 embeddings, {"error": ...} reports a failure).
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+WAIT_MS_BUCKETS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+class Histogram:
+    """Counts of observations per bucket (upper bounds, plus an overflow bucket), with count, mean and max."""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            labels = [f"<={b:g}" for b in self.bounds] + [f">{self.bounds[-1]:g}"]
+            return {
+                "count": self.count,
+                "mean": round(self.total / self.count, 2) if self.count else 0.0,
+                "max": round(self.max, 2),
+                "buckets": dict(zip(labels, self.counts))
+            }
+
+class _Request:
+    __slots__ = ("texts", "future", "enqueued")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+class MicroBatcher:
+    """
+    Embedding function (texts -> embeddings) that coalesces concurrent calls
+    into batches for `embed`, run by a single thread. Calls larger than
+    max_batch are split and queued one slice at a time (the next once the
+    previous is embedded), so a query waits behind at most one of an
+    ingestion's forward passes.
+    """
+
+    def __init__(self, embed: Callable[[List[str]], List], max_batch: int = EMBED_MAX_BATCH,
+                 max_wait_ms: float = EMBED_MAX_WAIT_MS):
+        self.embed = embed
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(WAIT_MS_BUCKETS)
+        self.embed_ms = Histogram(WAIT_MS_BUCKETS)
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._carry: Optional[_Request] = None
+        threading.Thread(target=self._loop, name="embed-batcher", daemon=True).start()
+
+    def __call__(self, texts: List[str]) -> List:
+        texts = list(texts)
+        self.requests += 1
+        embeddings = []
+        for i in range(0, len(texts), self.max_batch):
+            part = _Request(texts[i:i + self.max_batch])
+            self._queue.put(part)
+            embeddings.extend(part.future.result())
+        return embeddings
+
+    def _next_batch(self) -> List[_Request]:
+        """Block for a request, then gather more until the batch is full or the first one has waited max_wait."""
+        first, self._carry = self._carry or self._queue.get(), None
+        batch, size = [first], len(first.texts)
+        deadline = first.enqueued + self.max_wait
+        while size < self.max_batch:
+            try:
+                request = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if size + len(request.texts) > self.max_batch:
+                self._carry = request
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            start = time.perf_counter()
+            for request in batch:
+                self.queue_wait_ms.observe((start - request.enqueued) * 1000)
+            texts = [text for request in batch for text in request.texts]
+            self.batch_sizes.observe(len(texts))
+            try:
+                embeddings = self.embed(texts)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            self.embed_ms.observe((time.perf_counter() - start) * 1000)
+            offset = 0
+            for request in batch:
+                request.future.set_result(embeddings[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "requests": self.requests,
+            "queue_depth": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "embed_ms": self.embed_ms.snapshot()
+        }
+
+def load_model(model_name: str = EMBED_MODEL):
+    """The sentence-transformer embedding function (loads the model)."""
+    from chromadb.utils import embedding_functions
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
+
+def _send(sock: socket.socket, *frames: bytes):
+    sock.sendall(b"".join(struct.pack(">I", len(frame)) + frame for frame in frames))
+
+def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        block = sock.recv(n - len(buf))
+        if not block:
+            raise ConnectionError("Embedding service connection closed")
+        buf += block
+    return bytes(buf)
+
+def _recv(sock: socket.socket) -> bytes:
+    (length,) = struct.unpack(">I", _recv_exactly(sock, 4))
+    return _recv_exactly(sock, length)
+
+class _Handler(socketserver.BaseRequestHandler):
+    """One thread per client connection; requests on it are answered in order."""
+
+    def handle(self):
+        batcher = self.server.batcher
+        while True:
+            try:
+                request = json.loads(_recv(self.request))
+            except ConnectionError:
+                return
+            try:
+                if request.get("op") == "stats":
+                    _send(self.request, json.dumps(batcher.stats()).encode())
+                    continue
+                embeddings = np.asarray(batcher(request["texts"]), dtype=np.float32).reshape(len(request["texts"]), -1)
+            except Exception as e:
+                _send(self.request, json.dumps({"error": str(e)}).encode())
+                continue
+            _send(self.request, json.dumps({"shape": embeddings.shape}).encode(), embeddings.tobytes())
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(path: str, batcher: MicroBatcher) -> socketserver.UnixStreamServer:
+    """Bind the service to a Unix socket (replacing a stale socket file); call serve_forever() to run it."""
+    if os.path.exists(path):
+        os.remove(path)
+    server = _Server(path, _Handler)
+    server.batcher = batcher
+    return server
+
+class RemoteEmbedder:
+    """
+    Embedding function backed by the embedding service. Thread-safe: each
+    concurrent call uses its own connection, kept open for reuse.
+    """
+
+    def __init__(self, path: str = EMBED_SOCKET):
+        self.path = path
+        self._idle = queue.LifoQueue()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _call(self, request: Dict):
+        """Send a request and return its reply (header, body); retried once on a fresh connection if a reused one went stale."""
+        for attempt in range(2):
+            try:
+                sock, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                sock, reused = self._connect(), False
+            try:
+                _send(sock, json.dumps(request).encode())
+                header = json.loads(_recv(sock))
+                body = _recv(sock) if "shape" in header else None
+            except OSError:
+                sock.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            self._idle.put(sock)
+            if "error" in header:
+                raise RuntimeError(f"Embedding service error: {header['error']}")
+            return header, body
+
+    def __call__(self, texts: List[str]) -> List[np.ndarray]:
+        texts = list(texts)
+        if not texts:
+            return []
+        header, body = self._call({"op": "embed", "texts": texts})
+        return list(np.frombuffer(body, dtype=np.float32).reshape(header["shape"]))
+
+    def stats(self) -> Dict:
+        return self._call({"op": "stats"})[0]
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Shared micro-batching embedding service")
+    parser.add_argument("--socket", default=EMBED_SOCKET or "/tmp/embedder.sock")
+    parser.add_argument("--ping", action="store_true", help="exit 0 if a service answers on the socket (health check)")
+    args = parser.parse_args(argv)
+
+    if args.ping:
+        try:
+            RemoteEmbedder(args.socket).stats()
+        except OSError as e:
+            print(f"Embedding service unavailable: {e}", file=sys.stderr)
+            return 1
+        return 0
+
+    batcher = MicroBatcher(load_model())
+    batcher(["warm up"])
+    server = make_server(args.socket, batcher)
+    print(f"Embedding service ({EMBED_MODEL}) listening on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
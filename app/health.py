@@ -0,0 +1,44 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable
+
+# Readiness of each subsystem, reported by /readyz. States move
+# pending -> starting -> ready, or -> failed (with the error).
+#   db            - chat store migrated and maintained
+#   embeddings    - sentence-transformer model loaded and warmed up
+#   vector_store  - vector backend (Chroma collection or NumPy index) open
+#   lexical_index - BM25 index loaded or rebuilt
+#   corpus        - default documents ingested
+SUBSYSTEMS = ("db", "embeddings", "vector_store", "lexical_index", "corpus")
+
+_lock = threading.Lock()
+_states: Dict[str, Dict] = {name: {"state": "pending"} for name in SUBSYSTEMS}
+_boot = time.monotonic()
+
+def set_state(name: str, state: str, **details):
+    with _lock:
+        _states[name] = {"state": state, **details}
+
+@contextmanager
+def track(name: str):
+    """Mark a subsystem starting, then ready (with its start-up time) or failed."""
+    set_state(name, "starting")
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        set_state(name, "failed", error=str(e))
+        raise
+    set_state(name, "ready", startup_ms=round((time.perf_counter() - start) * 1000))
+
+def is_ready(names: Iterable[str]) -> bool:
+    with _lock:
+        return all(_states[name]["state"] == "ready" for name in names)
+
+def snapshot() -> Dict:
+    with _lock:
+        return {
+            "uptime_s": round(time.monotonic() - _boot, 1),
+            "subsystems": {name: dict(state) for name, state in _states.items()}
+        }
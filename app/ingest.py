@@ -0,0 +1,114 @@
+import os
+import hashlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+import requests
+from pypdf import PdfReader
+from app.config import DATA_DIR, INGEST_WORKERS, INGEST_NICE, INGEST_PAGES_PER_TASK, INGEST_DOWNLOAD_CHUNK, INGEST_TIMEOUT
+
+# This module is imported by the extraction worker processes, so keep its
+# imports light (no embedding models, no Chroma).
+
+_pool = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    Shared page-extraction pool. Spawned (not forked) so workers don't
+    inherit server threads, and niced so extraction yields to queries.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=os.nice, initargs=(INGEST_NICE,))
+    return _pool
+
+class Download(NamedTuple):
+    path: str
+    sha256: str  # content fingerprint
+    size: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+def download(url: str, etag: str = None, last_modified: str = None) -> Optional[Download]:
+    """
+    Stream a URL to a unique temp file in DATA_DIR, hashing it on the way.
+    Sends a conditional request when validators from a previous download are
+    given; returns None if the server reports the document unchanged (304).
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    fd, path = tempfile.mkstemp(prefix="ingest-", suffix=".pdf", dir=DATA_DIR)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f, requests.get(url, stream=True, timeout=INGEST_TIMEOUT, headers=headers) as response:
+            if response.status_code == 304:
+                os.remove(path)
+                return None
+            response.raise_for_status()
+            for block in response.iter_content(chunk_size=INGEST_DOWNLOAD_CHUNK):
+                f.write(block)
+                digest.update(block)
+                size += len(block)
+    except Exception:
+        os.remove(path)
+        raise
+    return Download(path, digest.hexdigest(), size, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+def _extract_range(path: str, start: int, stop: int) -> List[str]:
+    """Worker: extract the text of pages [start, stop)."""
+    reader = PdfReader(path)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+def extract_pages(path: str) -> Iterator[str]:
+    """
+    Yield page texts in order. Page ranges are extracted in the process pool
+    with a bounded number of ranges in flight, so memory stays flat.
+    """
+    num_pages = len(PdfReader(path).pages)
+    ranges = [(s, min(s + INGEST_PAGES_PER_TASK, num_pages)) for s in range(0, num_pages, INGEST_PAGES_PER_TASK)]
+
+    # Small documents aren't worth the inter-process round trip
+    if len(ranges) <= 1 or INGEST_WORKERS <= 1:
+        for start, stop in ranges:
+            yield from _extract_range(path, start, stop)
+        return
+
+    pool = _get_pool()
+    max_in_flight = INGEST_WORKERS * 2
+    pending = []
+    remaining = iter(ranges)
+    for start, stop in islice(remaining, max_in_flight):
+        pending.append(pool.submit(_extract_range, path, start, stop))
+    while pending:
+        future = pending.pop(0)
+        yield from future.result()
+        for start, stop in islice(remaining, 1):
+            pending.append(pool.submit(_extract_range, path, start, stop))
+
+def chunk_ids(source: str, texts: Iterable[str], seen: dict) -> List[str]:
+    """
+    Content-addressed chunk IDs: a hash of the source and the chunk text.
+    `seen` counts earlier occurrences of the same text in this document so
+    repeated passages still get distinct, stable IDs.
+    """
+    ids = []
+    for text in texts:
+        key = hashlib.sha256(f"{source}\x00{text}".encode()).hexdigest()
+        n = seen.get(key, 0)
+        seen[key] = n + 1
+        ids.append(key[:32] if n == 0 else f"{key[:32]}-{n}")
+    return ids
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
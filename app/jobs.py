@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import socket
+import asyncio
+import itertools
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from app.config import CHUNK_STRATEGY, INGEST_JOB_WORKERS, INGEST_JOB_LEASE_S, INGEST_NICE
+from app.db import connection
+
+# Ingestion job queue. Jobs are rows in the `jobs` table, so queued and
+# finished jobs survive restarts. A bounded pool of worker threads runs them,
+# highest priority first, at a lower CPU priority than request handling.
+# Several processes (uvicorn workers) can share the table: a job is claimed
+# by one process, which holds a lease on it while it runs. Jobs whose lease
+# expired (their process died mid-run) are queued again; ingestion is
+# idempotent.
+# Statuses: queued -> running (-> cancelling) -> succeeded | failed | cancelled
+
+COLUMNS = ("id", "source", "url", "chunking", "priority", "status", "pages", "chunks",
+           "result", "error", "created_at", "started_at", "finished_at")
+FINISHED = ("succeeded", "failed", "cancelled")
+
+_queue = queue.PriorityQueue()  # (-priority, submission order, job id)
+_order = itertools.count()
+_workers: List[threading.Thread] = []
+_lock = threading.Lock()
+# Identifies this process as the owner of the jobs it runs (the suffix tells apart restarts reusing a pid)
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_SELECT = f"""
+    SELECT {', '.join(COLUMNS)},
+           (julianday(COALESCE(finished_at, CURRENT_TIMESTAMP)) - julianday(started_at)) * 86400
+    FROM jobs
+"""
+
+def _row_to_dict(row) -> Dict:
+    job = dict(zip(COLUMNS, row))
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    elapsed = row[len(COLUMNS)]
+    job["elapsed_s"] = round(elapsed, 1) if elapsed is not None else None
+    job["pages_per_sec"] = round(job["pages"] / elapsed, 1) if elapsed else None
+    job["chunks_per_sec"] = round(job["chunks"] / elapsed, 1) if elapsed else None
+    return job
+
+def get_job(job_id: str) -> Optional[Dict]:
+    with connection() as conn:
+        row = conn.execute(f"{_SELECT} WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_dict(row) if row else None
+
+def get_jobs(job_ids: Iterable[str]) -> List[Dict]:
+    return [job for job in map(get_job, job_ids) if job]
+
+def list_jobs(status: str = None, limit: int = 50) -> List[Dict]:
+    """Most recent jobs first, optionally only those with `status`."""
+    with connection() as conn:
+        if status:
+            rows = conn.execute(f"{_SELECT} WHERE status = ? ORDER BY created_at DESC, rowid DESC LIMIT ?", (status, limit)).fetchall()
+        else:
+            rows = conn.execute(f"{_SELECT} ORDER BY created_at DESC, rowid DESC LIMIT ?", (limit,)).fetchall()
+    return [_row_to_dict(row) for row in rows]
+
+def submit(url: str, source: str, chunking: str = CHUNK_STRATEGY, priority: int = 0) -> Dict:
+    """
+    Queue an ingestion and return its job. If the same document is already
+    queued, running or being cancelled, that job is returned instead of
+    queueing a duplicate (a unique index on active jobs settles concurrent
+    submits, from any process).
+    """
+    job_id = uuid.uuid4().hex
+    with connection() as conn:
+        inserted = conn.execute(
+            "INSERT INTO jobs (id, source, url, chunking, priority) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (source, url, chunking) WHERE status IN ('queued', 'running', 'cancelling') DO NOTHING",
+            (job_id, source, url, chunking, priority)
+        ).rowcount
+        if not inserted:
+            # Same transaction as the insert attempt, which holds the write lock: the active job can't finish in between
+            job_id = conn.execute(
+                "SELECT id FROM jobs WHERE source = ? AND url = ? AND chunking = ? AND status IN ('queued', 'running', 'cancelling')",
+                (source, url, chunking)
+            ).fetchone()[0]
+    if inserted:
+        _queue.put((-priority, next(_order), job_id))
+    return get_job(job_id)
+
+def cancel(job_id: str) -> Optional[Dict]:
+    """
+    Cancel a job: a queued job is cancelled at once; a running one is marked
+    cancelling and stops after its current batch, whichever process runs it.
+    Returns the job (None if unknown).
+    """
+    with connection() as conn:
+        conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'queued'", (job_id,))
+        conn.execute("UPDATE jobs SET status = 'cancelling' WHERE id = ? AND status = 'running'", (job_id,))
+    return get_job(job_id)
+
+async def wait(job_ids: Iterable[str], poll_interval: float = 1.0) -> List[Dict]:
+    """Wait until every job has finished; returns the final jobs."""
+    from app.utils import run_blocking
+    job_ids = list(job_ids)
+    while True:
+        jobs = await run_blocking(get_jobs, job_ids)
+        if all(job["status"] in FINISHED for job in jobs):
+            return jobs
+        await asyncio.sleep(poll_interval)
+
+def _lower_priority():
+    """
+    Renice the calling thread (Linux schedules threads individually), so
+    ingestion yields the CPU to queries. This covers the job's own work; its
+    embedding runs on the embedder's thread, which serves queries too and so
+    keeps its priority (a thread can't renice itself back without privileges):
+    there, ingestion yields by queueing one slice at a time.
+    """
+    if sys.platform.startswith("linux") and INGEST_NICE > 0:
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), INGEST_NICE)
+        except OSError:
+            pass
+
+class _CancelFlag(threading.Event):
+    """ingest_document's cancel flag, set by a cancel from any process: reads the job row when checked."""
+
+    def __init__(self, job_id: str):
+        super().__init__()
+        self.job_id = job_id
+
+    def is_set(self) -> bool:
+        if not super().is_set():
+            with connection() as conn:
+                row = conn.execute("SELECT status FROM jobs WHERE id = ?", (self.job_id,)).fetchone()
+            if row and row[0] == "cancelling":
+                self.set()
+        return super().is_set()
+
+def _run(job_id: str):
+    # app.rag pulls in the embedding model and Chroma; only workers need it
+    from app.rag import ingest_document
+
+    with connection() as conn:
+        claimed = conn.execute(
+            "UPDATE jobs SET status = 'running', owner = ?, started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP "
+            "WHERE id = ? AND status = 'queued'", (_OWNER, job_id)
+        ).rowcount
+    if not claimed:
+        # Cancelled while queued, or a second queue entry of a job that already ran (or runs elsewhere)
+        return
+    job = get_job(job_id)
+
+    def progress(pages: int, chunks: int):
+        with connection() as conn:
+            conn.execute("UPDATE jobs SET pages = ?, chunks = ?, heartbeat_at = CURRENT_TIMESTAMP WHERE id = ? AND owner = ?",
+                         (pages, chunks, job_id, _OWNER))
+
+    try:
+        result = ingest_document(job["url"], job["source"], job["chunking"], progress=progress, cancel=_CancelFlag(job_id))
+    except Exception as e:
+        result = {"status": "error", "message": str(e)}
+
+    status = {"error": "failed", "cancelled": "cancelled"}.get(result["status"], "succeeded")
+    with connection() as conn:
+        # Unless the lease was lost (and the job requeued) while this process stalled
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ? AND owner = ? AND status IN ('running', 'cancelling')",
+            (status, json.dumps(result), result.get("message"), job_id, _OWNER)
+        )
+
+def _worker():
+    _lower_priority()
+    while True:
+        _, _, job_id = _queue.get()
+        try:
+            _run(job_id)
+        except Exception as e:
+            print(f"Ingestion job {job_id} crashed: {e}")
+
+def reclaim_expired(lease_s: float = INGEST_JOB_LEASE_S) -> List[str]:
+    """
+    Queue again the running jobs whose owner stopped renewing their lease
+    (it died mid-run), and put them on this process's queue; orphaned
+    cancelling jobs are marked cancelled. Returns the requeued IDs.
+    """
+    expired = "(heartbeat_at IS NULL OR heartbeat_at < datetime('now', ?))"
+    with connection() as conn:
+        rows = conn.execute(
+            "UPDATE jobs SET status = 'queued', owner = NULL, started_at = NULL, heartbeat_at = NULL "
+            f"WHERE status = 'running' AND {expired} RETURNING id, priority",
+            (f"{-lease_s} seconds",)
+        ).fetchall()
+        # Orphaned while being cancelled: nothing left to stop
+        conn.execute(f"UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP WHERE status = 'cancelling' AND {expired}",
+                     (f"{-lease_s} seconds",))
+    for job_id, priority in rows:
+        _queue.put((-priority, next(_order), job_id))
+    return [job_id for job_id, _ in rows]
+
+def _heartbeat(lease_s: float = INGEST_JOB_LEASE_S):
+    """Renew the leases of this process's running jobs, and reclaim jobs orphaned by other processes."""
+    while True:
+        time.sleep(lease_s / 3)
+        try:
+            with connection() as conn:
+                conn.execute("UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE owner = ? AND status IN ('running', 'cancelling')", (_OWNER,))
+            reclaim_expired(lease_s)
+        except Exception as e:
+            print(f"Ingestion job heartbeat failed: {e}")
+
+def start_workers(workers: int = INGEST_JOB_WORKERS):
+    """
+    Start the worker threads and the lease heartbeat (once per process) and
+    queue the pending jobs, including ones orphaned mid-run. Jobs other live
+    processes are running keep their lease and are left alone.
+    """
+    with _lock:
+        if _workers:
+            return
+        reclaimed = set(reclaim_expired())
+        with connection() as conn:
+            rows = conn.execute("SELECT id, priority FROM jobs WHERE status = 'queued' ORDER BY created_at, rowid").fetchall()
+        for job_id, priority in rows:
+            if job_id not in reclaimed:
+                _queue.put((-priority, next(_order), job_id))
+        for i in range(workers):
+            thread = threading.Thread(target=_worker, name=f"ingest-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+        threading.Thread(target=_heartbeat, name="ingest-heartbeat", daemon=True).start()
@@ -0,0 +1,110 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+from scipy import sparse
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+# Constant of reciprocal rank fusion; 60 is the value from the original RRF paper
+RRF_K = 60
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed set of chunks. Per-(chunk, term) BM25 weights are
+    precomputed into a sparse matrix, so scoring a query is one column
+    slice and a row sum.
+    """
+
+    def __init__(self, ids: List[str], texts: Iterable[str], version: int = None):
+        self.ids = list(ids)
+        self.version = version
+        # sklearn is slow to import; only pay for it once an index is built or loaded
+        from sklearn.feature_extraction.text import CountVectorizer
+        self.vectorizer = CountVectorizer(lowercase=True, stop_words="english", token_pattern=r"(?u)\b\w+\b")
+        if not self.ids:
+            self.weights = sparse.csc_matrix((0, 0), dtype=np.float32)
+            return
+
+        tf = self.vectorizer.fit_transform(texts).tocsr().astype(np.float32)
+        doc_len = np.asarray(tf.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() or 1.0
+        df = np.bincount(tf.indices, minlength=tf.shape[1])
+        n = tf.shape[0]
+        idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        # tf * (k1 + 1) / (tf + k1 * (1 - b + b * len/avg)) * idf, on non-zeros only
+        norm = K1 * (1 - B + B * doc_len / avg_len)
+        rows = np.repeat(np.arange(n), np.diff(tf.indptr))
+        data = tf.data * (K1 + 1) / (tf.data + norm[rows]) * idf[tf.indices]
+        self.weights = sparse.csr_matrix((data, tf.indices, tf.indptr), shape=tf.shape).tocsc()
+
+    def search(self, query: str, n_results: int) -> List[Tuple[str, float]]:
+        """Top `n_results` (chunk_id, score) pairs with a non-zero score."""
+        if not self.ids:
+            return []
+        vocabulary = self.vectorizer.vocabulary_
+        columns = [vocabulary[t] for t in set(self.vectorizer.build_analyzer()(query)) if t in vocabulary]
+        if not columns:
+            return []
+        scores = np.asarray(self.weights[:, columns].sum(axis=1)).ravel()
+        k = min(n_results, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Merge ranked ID lists: score(id) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+class LexicalStore:
+    """
+    A BM25 index persisted next to the vector store. It is rebuilt after
+    each ingestion/deletion; other workers reload it when the file changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._index: Optional[BM25Index] = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def save(self, index: BM25Index):
+        tmp_path = f"{self.path}.tmp"
+        joblib.dump(index, tmp_path)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._index = index
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+    def _refresh(self):
+        """Reload the index if the file was saved since it was last read (by another worker). Caller holds the lock."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            self._index = joblib.load(self.path)
+            self._mtime = mtime
+
+    def load(self, version: int) -> Optional[BM25Index]:
+        """The index for `version`, from memory or disk; None if it has to be rebuilt."""
+        with self._lock:
+            if self._index is None or self._index.version != version:
+                self._refresh()
+            if self._index is not None and self._index.version == version:
+                return self._index
+        return None
+
+    def latest(self) -> Optional[BM25Index]:
+        """The last index built, whatever its corpus version; None if there is none yet."""
+        with self._lock:
+            self._refresh()
+            return self._index
@@ -0,0 +1,198 @@
+import time
+import random
+import asyncio
+import email.utils
+from contextlib import asynccontextmanager
+from typing import Dict, AsyncIterator
+
+import httpx
+import openai
+from app.config import (
+    OPENAI_BASE_URL, OPENAI_API_KEY, OPENAI_API_VERSION, MODEL_NAME,
+    LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE, LLM_KEEPALIVE_EXPIRY, LLM_TIMEOUT,
+    LLM_CONCURRENCY, LLM_DEPLOYMENT_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT,
+    LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX
+)
+from app.utils import logger
+
+# Errors worth retrying: throttling, transient network failures and 5xx.
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+class LLMOverloadedError(Exception):
+    """Raised when a deployment's queue is full or a slot can't be acquired in time."""
+
+    def __init__(self, deployment: str, retry_after: float = 1.0):
+        super().__init__(f"LLM deployment '{deployment}' is overloaded, retry later")
+        self.deployment = deployment
+        self.retry_after = retry_after
+
+_client = None
+
+def get_client() -> openai.AsyncAzureOpenAI:
+    """Return the process-wide async client, creating it (and its keep-alive pool) on first use."""
+    global _client
+    if _client is None:
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+            ),
+            timeout=LLM_TIMEOUT
+        )
+        _client = openai.AsyncAzureOpenAI(
+            azure_endpoint=OPENAI_BASE_URL,
+            api_key=OPENAI_API_KEY,
+            api_version=OPENAI_API_VERSION,
+            http_client=http_client,
+            max_retries=0  # Retries are handled by the gateway (see _create)
+        )
+    return _client
+
+class _Deployment:
+    """Concurrency slot pool and counters for a single model deployment."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.errors = 0
+        self.queue_wait_total_ms = 0.0
+        self.queue_wait_max_ms = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        start = time.perf_counter()
+        if self.semaphore.locked():
+            # All slots busy: wait in the queue, or shed load if it is already full
+            if self.queued >= LLM_MAX_QUEUE:
+                self.rejected += 1
+                raise LLMOverloadedError(self.name)
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), LLM_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise LLMOverloadedError(self.name)
+            finally:
+                self.queued -= 1
+        else:
+            await self.semaphore.acquire()
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        self.queue_wait_total_ms += wait_ms
+        self.queue_wait_max_ms = max(self.queue_wait_max_ms, wait_ms)
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+
+    def metrics(self) -> Dict:
+        return {
+            "concurrency_limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "max_queue_depth": self.max_queued,
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "avg_queue_wait_ms": round(self.queue_wait_total_ms / self.requests, 2) if self.requests else 0.0,
+            "max_queue_wait_ms": round(self.queue_wait_max_ms, 2)
+        }
+
+_deployments: Dict[str, _Deployment] = {}
+
+def _deployment(name: str) -> _Deployment:
+    if name not in _deployments:
+        limit = LLM_DEPLOYMENT_CONCURRENCY.get(name, LLM_CONCURRENCY)
+        _deployments[name] = _Deployment(name, limit)
+    return _deployments[name]
+
+def _retry_after(error: Exception):
+    """Seconds the server asked us to wait, from `retry-after-ms` / `retry-after` headers."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                parsed = email.utils.parsedate_to_datetime(value)
+                return max(0.0, parsed.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+    return None
+
+def _backoff(attempt: int, error: Exception) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, LLM_BACKOFF_MAX) + random.uniform(0, LLM_BACKOFF_BASE))
+    return delay
+
+async def _create(deployment: _Deployment, **kwargs):
+    """Issue a chat completion request, retrying throttled/transient failures."""
+    attempt = 0
+    while True:
+        try:
+            return await get_client().chat.completions.create(**kwargs)
+        except RETRYABLE_ERRORS as e:
+            if isinstance(e, openai.RateLimitError):
+                deployment.throttled += 1
+            if attempt >= LLM_MAX_RETRIES:
+                deployment.errors += 1
+                raise
+            delay = _backoff(attempt, e)
+            attempt += 1
+            deployment.retries += 1
+            logger.warning(f"LLM call to '{deployment.name}' failed ({type(e).__name__}), retry {attempt}/{LLM_MAX_RETRIES} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        except Exception:
+            deployment.errors += 1
+            raise
+
+async def chat_completion(**kwargs):
+    """Non-streaming chat completion through the gateway."""
+    kwargs.setdefault("model", MODEL_NAME)
+    deployment = _deployment(kwargs["model"])
+    async with deployment.slot():
+        return await _create(deployment, **kwargs)
+
+async def stream_chat_completion(**kwargs) -> AsyncIterator:
+    """
+    Streaming chat completion through the gateway.
+    Retries only apply to opening the stream; the slot is held until it is consumed.
+    """
+    kwargs.setdefault("model", MODEL_NAME)
+    deployment = _deployment(kwargs["model"])
+    async with deployment.slot():
+        stream = await _create(deployment, stream=True, **kwargs)
+        async for chunk in stream:
+            yield chunk
+
+def get_metrics() -> Dict:
+    """Queue depth, in-flight and retry counters for every deployment seen so far."""
+    return {name: d.metrics() for name, d in _deployments.items()}
@@ -1,32 +1,106 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from fastapi.responses import StreamingResponse
-from typing import List, Optional
-
-from app.chat import stream_chat, get_history
-from app.rag import ingest_document, query_knowledge_base, run_automated_eval, pre_populate_docs, get_ingested_documents
-from app.agent import run_planning_agent
+import asyncio
+from fastapi import FastAPI, HTTPException, Query, Request
+from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse
+from typing import List, Literal, Optional
+
+from app.chat import stream_chat, get_history, prune_history, backfill_token_counts, DEFAULT_SESSION
+from app.db import init_db
+from app import health
+from app import jobs
+from app import sandbox
+from app.rag import warm_up as warm_up_rag, query_knowledge_base, query_knowledge_base_batch, stream_query_knowledge_base, pre_populate_docs, get_ingested_documents, backfill_registry, delete_document, embedding_metrics
+from app.registry import list_documents
+from app.bench import run_automated_eval
+from app.agent import run_planning_agent, stream_planning_agent
 from app.coder import generate_and_heal_code
+from app.streaming import streaming_response, negotiate_format
+from app.llm import LLMOverloadedError, get_metrics as get_llm_metrics
+from app.utils import run_blocking
+from app.config import READY_SUBSYSTEMS, RAG_RETRIEVAL_MODE, RAG_TOP_K, RAG_BATCH_MAX, CHUNK_STRATEGY
 
 app = FastAPI(title="AI Platform")
 
 @app.on_event("startup")
 async def startup_event():
-    """Pre-populates the document database on application startup."""
-    print("Pre-populating documents...")
-    pre_populate_docs()
-    print("Documents pre-populated.")
+    """
+    Migrates the chat store, then loads RAG and pre-populates the document
+    database in the background so chat and agent routes serve immediately.
+    """
+    with health.track("db"):
+        await run_blocking(init_db)
+        await run_blocking(prune_history)
+    jobs.start_workers()
+    app.state.warm_up = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.warm_up.cancel()
+
+async def warm_up():
+    """Background start-up work; failures are reported by /readyz instead of blocking boot."""
+    try:
+        # Token counts of legacy messages need the tokenizer; chat works without them (estimated)
+        await run_blocking(backfill_token_counts)
+    except Exception as e:
+        print(f"Token count backfill failed: {e}")
+    try:
+        await run_blocking(warm_up_rag)
+        with health.track("corpus"):
+            await run_blocking(backfill_registry)
+            # Ingestion runs on the job queue; the corpus is ready once its jobs succeed
+            finished = await jobs.wait(await run_blocking(pre_populate_docs))
+            failed = [f"{job['source']}: {job['error']}" for job in finished if job["status"] != "succeeded"]
+            if failed:
+                raise RuntimeError("; ".join(failed))
+            print("Documents pre-populated.")
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloadedError):
+    """Shed load with a 503 instead of queueing unbounded work on the LLM gateway."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after))}
+    )
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness of each subsystem; 503 until the required ones (READY_SUBSYSTEMS) are ready."""
+    ready = health.is_ready(READY_SUBSYSTEMS)
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, **health.snapshot()})
 
 # --- Models ---
 class ChatRequest(BaseModel):
     message: str
+    session_id: str = DEFAULT_SESSION
 
 class IngestRequest(BaseModel):
     url: str
     name: str
+    chunking: Literal["char", "token", "sentence", "recursive"] = CHUNK_STRATEGY
+    priority: int = 0  # higher runs first
+
+JobStatus = Literal["queued", "running", "cancelling", "succeeded", "failed", "cancelled"]
+
+RetrievalMode = Literal["dense", "sparse", "hybrid"]
 
 class QueryRequest(BaseModel):
     query: str
+    mode: RetrievalMode = RAG_RETRIEVAL_MODE
+    n_results: int = Field(RAG_TOP_K, ge=1, le=50)
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=RAG_BATCH_MAX)
+    mode: RetrievalMode = RAG_RETRIEVAL_MODE
+    n_results: int = Field(RAG_TOP_K, ge=1, le=50)
 
 class AgentRequest(BaseModel):
     prompt: str
@@ -34,48 +108,119 @@ class AgentRequest(BaseModel):
 # --- Routes ---
 
 @app.post("/chat")
-async def chat_endpoint(req: ChatRequest):
-    """Task 3.1: Streaming Chat"""
-    return StreamingResponse(stream_chat(req.message), media_type="application/x-ndjson")
+async def chat_endpoint(req: ChatRequest, request: Request, stream_format: Optional[str] = None):
+    """Task 3.1: Streaming Chat (NDJSON by default, SSE with ?stream_format=sse or Accept: text/event-stream)"""
+    fmt = negotiate_format(stream_format, request.headers.get("accept"))
+    return streaming_response(stream_chat(req.message, req.session_id), fmt)
 
 @app.get("/chat/history")
-async def chat_history_endpoint():
-    """Returns the last 10 chat messages."""
-    return {"history": get_history()}
+async def chat_history_endpoint(session_id: str = DEFAULT_SESSION):
+    """Returns the last 10 chat messages of a session."""
+    return {"history": await run_blocking(get_history, session_id)}
 
-@app.post("/rag/ingest")
+@app.post("/rag/ingest", status_code=202)
 async def rag_ingest(req: IngestRequest):
-    """Task 3.2a: Ingest"""
-    result = ingest_document(req.url, req.name)
-    if result["status"] == "error":
-        raise HTTPException(status_code=500, detail=result["message"])
-    return result
+    """Task 3.2a: Ingest. Queues an ingestion job and returns it; poll /rag/jobs/{id} for progress."""
+    return await run_blocking(jobs.submit, req.url, req.name, req.chunking, req.priority)
+
+@app.get("/rag/jobs")
+async def rag_jobs(status: Optional[JobStatus] = None, limit: int = Query(50, ge=1, le=500)):
+    """Recent ingestion jobs, newest first."""
+    return {"jobs": await run_blocking(jobs.list_jobs, status, limit)}
+
+@app.get("/rag/jobs/{job_id}")
+async def rag_job(job_id: str):
+    """Job status and progress: pages extracted, chunks embedded, throughput."""
+    job = await run_blocking(jobs.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+@app.delete("/rag/jobs/{job_id}")
+async def rag_cancel_job(job_id: str):
+    """Cancel a queued job, or stop a running one (in any worker process) after its current batch."""
+    job = await run_blocking(jobs.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
 
 @app.post("/rag/query")
 async def rag_query(req: QueryRequest):
     """Task 3.2c: Query"""
-    return query_knowledge_base(req.query)
+    return await query_knowledge_base(req.query, req.mode, req.n_results)
+
+@app.post("/rag/query/stream")
+async def rag_query_stream(req: QueryRequest, request: Request, stream_format: Optional[str] = None):
+    """Citations first, then answer tokens, then a metrics frame (NDJSON by default, or SSE)"""
+    fmt = negotiate_format(stream_format, request.headers.get("accept"))
+    return streaming_response(stream_query_knowledge_base(req.query, req.mode, req.n_results), fmt)
+
+@app.post("/rag/query/batch")
+async def rag_query_batch(req: BatchQueryRequest, request: Request, stream_format: Optional[str] = None):
+    """Answer many queries at once; results stream back as each finishes (NDJSON by default, or SSE)"""
+    fmt = negotiate_format(stream_format, request.headers.get("accept"))
+    return streaming_response(query_knowledge_base_batch(req.queries, req.mode, req.n_results), fmt)
 
 @app.post("/rag/eval")
-async def rag_eval():
+async def rag_eval(mode: RetrievalMode = RAG_RETRIEVAL_MODE, n_results: int = 10):
     """Task 3.2d: Eval"""
-    return run_automated_eval()
+    return await run_blocking(run_automated_eval, mode, n_results)
 
 @app.get("/rag/ingested-docs")
 async def rag_ingested_docs():
     """Returns the list of ingested documents."""
-    return {"documents": get_ingested_documents()}
+    return {"documents": await run_blocking(get_ingested_documents)}
+
+@app.get("/rag/documents")
+async def rag_documents():
+    """Returns the document registry: source, URL, fingerprint, chunk count, size, ingestion time."""
+    return {"documents": await run_blocking(list_documents)}
+
+@app.delete("/rag/documents/{name}")
+async def rag_delete_document(name: str):
+    """Deletes a document's chunks and registry entry."""
+    if not await run_blocking(delete_document, name):
+        raise HTTPException(status_code=404, detail=f"Document '{name}' not found")
+    return {"status": "deleted", "source": name}
 
 @app.post("/agent")
 async def agent_endpoint(req: AgentRequest):
     """Task 3.3: Agent"""
-    plan, logs = run_planning_agent(req.prompt)
+    plan, logs = await run_planning_agent(req.prompt)
     return {"plan": plan, "logs": logs}
 
+@app.post("/agent/stream")
+async def agent_stream_endpoint(req: AgentRequest, request: Request, stream_format: Optional[str] = None):
+    """Agent steps, tool calls and results (with latency and token usage), then the plan, as they happen (NDJSON by default, or SSE)"""
+    async def events():
+        try:
+            async for event in stream_planning_agent(req.prompt):
+                yield event
+        except Exception as e:
+            yield {"type": "error", "data": str(e)}
+    fmt = negotiate_format(stream_format, request.headers.get("accept"))
+    return streaming_response(events(), fmt)
+
+@app.get("/llm/metrics")
+async def llm_metrics_endpoint():
+    """Returns LLM gateway queue depth, in-flight, retry and throttling counters."""
+    return {"deployments": get_llm_metrics()}
+
+@app.get("/embeddings/metrics")
+async def embedding_metrics_endpoint():
+    """Returns the embedder's micro-batch size, queue-wait and forward-pass histograms."""
+    return await run_blocking(embedding_metrics)
+
+@app.get("/sandbox/metrics")
+async def sandbox_metrics_endpoint():
+    """Returns code sandbox concurrency, queue depth and run outcome counters."""
+    return sandbox.pool.metrics()
+
 @app.post("/coder")
-async def coder_endpoint(req: AgentRequest):
-    """Task 3.4: Coder Stream"""
-    def generator():
-        for update in generate_and_heal_code(req.prompt):
-            yield update + "\n"
-    return StreamingResponse(generator(), media_type="text/plain")
+async def coder_endpoint(req: AgentRequest, request: Request, stream_format: Optional[str] = None):
+    """Task 3.4: Coder Stream (plain text by default, SSE/NDJSON on request)"""
+    async def events():
+        async for update in generate_and_heal_code(req.prompt):
+            yield {"type": "content", "data": update + "\n"}
+    fmt = negotiate_format(stream_format, request.headers.get("accept"), default="text")
+    return streaming_response(events(), fmt)
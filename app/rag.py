@@ -1,134 +1,344 @@
 import os
-import uuid
-import requests
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
-from pypdf import PdfReader
-from app.config import CHROMA_PATH
-from app.utils import Timer
-import openai
-from app.config import OPENAI_BASE_URL, OPENAI_API_KEY, MODEL_NAME
-
-# Setup ChromaDB
-client = chromadb.PersistentClient(path=CHROMA_PATH)
-
-# Use a local lightweight embedding model for speed (<=300ms target)
-# all-MiniLM-L6-v2 is fast and effective for standard English text
-EMBED_MODEL = "all-MiniLM-L6-v2"
-embed_fn = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBED_MODEL)
-
-collection = client.get_or_create_collection(
-    name="data_knowledge",
-    embedding_function=embed_fn
+import asyncio
+import threading
+from typing import AsyncGenerator, Callable, Dict, List
+from app.config import (
+    CHROMA_PATH, VECTOR_BACKEND, VECTOR_STORE_PATH, VECTOR_DTYPE, MODEL_NAME, CHUNK_STRATEGY, INGEST_BATCH_SIZE,
+    EMBED_SOCKET, LEXICAL_INDEX_PATH, RAG_RETRIEVAL_MODE, RAG_TOP_K, RAG_CANDIDATES,
+    RAG_CONTEXT_TOKENS, RAG_BATCH_CONCURRENCY, RAG_EMBED_CACHE_SIZE, RAG_ANSWER_CACHE_SIZE, RAG_ANSWER_CACHE_TTL, RAG_ANSWER_CACHE_THRESHOLD
 )
+from app.cache import LRUCache, SemanticCache
+from app.lexical import BM25Index, LexicalStore, reciprocal_rank_fusion
+from app.context import assemble_context
+from app.embedder import MicroBatcher, RemoteEmbedder, load_model
+from app.vectorstore import BACKENDS, ChromaStore, NumpyStore
+from app.ingest import download, extract_pages, chunk_ids, batched
+from app.chunking import chunk_pages
+from app import registry
+from app import health
+from app import jobs
+from app import llm
+from app.utils import Timer, StreamTimer, count_tokens, calculate_cost, run_blocking
 
-def pre_populate_docs():
-    """Pre-populate the vector database with the required documents."""
+COLLECTION_NAME = "data_knowledge"
+
+# The model and the vector store (VECTOR_BACKEND, see app.vectorstore) are
+# created on first use (or by warm_up() in the background at startup), so
+# importing this module stays cheap and the chat and agent routes don't
+# wait for RAG.
+_embed_fn = None
+_store = None
+_init_lock = threading.Lock()
+
+def get_embed_fn():
+    """
+    The micro-batching embedding function, created on first use: a client of
+    the shared embedding service if EMBED_SOCKET is set, otherwise the model
+    loaded in this process.
+    """
+    global _embed_fn
+    if _embed_fn is None:
+        with _init_lock:
+            if _embed_fn is None:
+                _embed_fn = RemoteEmbedder(EMBED_SOCKET) if EMBED_SOCKET else MicroBatcher(load_model())
+    return _embed_fn
+
+def embedding_metrics() -> Dict:
+    """Batch-size, queue-wait and forward-pass histograms of the embedder (the shared service's, if used)."""
+    return get_embed_fn().stats()
+
+def get_store():
+    """The knowledge-base vector store, opened on first use."""
+    global _store
+    if _store is None:
+        if VECTOR_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown vector backend '{VECTOR_BACKEND}', expected one of {BACKENDS}")
+        with _init_lock:
+            if _store is None:
+                if VECTOR_BACKEND == "numpy":
+                    _store = NumpyStore(VECTOR_STORE_PATH, VECTOR_DTYPE)
+                else:
+                    import chromadb
+                    client = chromadb.PersistentClient(path=CHROMA_PATH)
+                    # Embeddings are always computed by get_embed_fn(), never by Chroma
+                    _store = ChromaStore(client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=None))
+    return _store
+
+def warm_up():
+    """Load the model (and run one embedding), open the vector store and load the BM25 index, tracking readiness."""
+    with health.track("embeddings"):
+        get_embed_fn()(["warm up"])
+    with health.track("vector_store"):
+        get_store().count()
+    with health.track("lexical_index"):
+        # Off the request path: bring a stale index up to date (e.g. the process died before rebuilding it)
+        rebuild_lexical_index()
+
+# BM25 index kept alongside the vector store for exact-term (sparse) retrieval
+lexical_store = LexicalStore(LEXICAL_INDEX_PATH)
+_lexical_lock = threading.Lock()
+
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+
+# Query caches (see query_knowledge_base)
+embedding_cache = LRUCache(maxsize=RAG_EMBED_CACHE_SIZE)
+answer_cache = SemanticCache(maxsize=RAG_ANSWER_CACHE_SIZE, ttl=RAG_ANSWER_CACHE_TTL, threshold=RAG_ANSWER_CACHE_THRESHOLD)
+
+def pre_populate_docs() -> List[str]:
+    """Queue ingestion jobs for the required documents that aren't ingested yet. Returns the job IDs."""
     documents = {
         "Lord of the Rings — Fellowship": "https://www.mrsmuellersworld.com/uploads/1/3/0/5/13054185/lord-of-the-rings-01-the-fellowship-of-the-ring_full_text.pdf",
         "Star Wars — Revenge of the Sith": "https://www.scribd.com/document/346643809/Revenge-Of-The-Sith-pdf"
     }
 
-    # Get the list of already ingested documents
-    ingested_docs = get_ingested_documents()
+    # Get the list of already ingested documents (registry lookup, no embedding)
+    ingested_docs = set(get_ingested_documents())
     
+    job_ids = []
     for name, url in documents.items():
         if name not in ingested_docs:
-            print(f"Ingesting {name}...")
-            ingest_document(url, name)
+            print(f"Queueing ingestion of {name}...")
+            job_ids.append(jobs.submit(url, name)["id"])
         else:
             print(f"'{name}' already ingested. Skipping.")
+    return job_ids
 
 def get_ingested_documents():
-    """Retrieve the list of ingested documents."""
-    # Since we can't get a simple list of unique sources, we query for a common term
-    # and extract the sources from the metadata. This is a workaround.
-    try:
-        results = collection.query(query_texts=["the"], n_results=100)
-        sources = set()
-        if results['metadatas']:
-            for metadata in results['metadatas'][0]:
-                sources.add(metadata['source'])
-        return list(sources)
-    except Exception:
-        # This will happen if the collection is empty
-        return []
-
-llm_client = openai.AzureOpenAI(
-    azure_endpoint=OPENAI_BASE_URL,
-    api_key=OPENAI_API_KEY,
-    api_version="2024-05-01-preview"
-)
+    """Retrieve the list of ingested documents from the document registry."""
+    return registry.document_names()
+
+def backfill_registry(page_size: int = 5000):
+    """
+    One-time registration of documents ingested before the registry existed.
+    Reads chunk metadata only; no embedding or vector search is involved.
+    """
+    if not registry.is_empty():
+        return
+    counts = {}
+    for _, _, metadatas in get_store().scan(page_size):
+        for metadata in metadatas:
+            counts[metadata["source"]] = counts.get(metadata["source"], 0) + 1
+    for source, chunk_count in counts.items():
+        registry.record_ingestion(source, None, None, None, None, chunk_count, None)
+
+def delete_document(source_name: str) -> bool:
+    """Remove a document's chunks and its registry entry."""
+    if registry.get_document(source_name) is None:
+        return False
+    get_store().delete_source(source_name)
+    registry.delete_document(source_name)
+    rebuild_lexical_index()
+    return True
+
+def rebuild_lexical_index(page_size: int = 5000) -> BM25Index:
+    """Rebuild the BM25 index from every chunk in the vector store and persist it, unless it is already current."""
+    with _lexical_lock:
+        version = registry.corpus_version()
+        # Another thread (or worker) may have rebuilt it while this one waited for the lock
+        index = lexical_store.load(version)
+        if index is not None:
+            return index
+        ids, texts = [], []
+        for page_ids, documents, _ in get_store().scan(page_size):
+            ids.extend(page_ids)
+            texts.extend(documents)
+        index = BM25Index(ids, texts, version)
+        lexical_store.save(index)
+        return index
 
-def ingest_document(url: str, source_name: str):
-    """Task 3.2a: Ingest PDF, chunk, and store."""
+def get_lexical_index() -> BM25Index:
+    """
+    The BM25 index queries search. Ingestion and deletion rebuild it; while
+    that is pending the last index built is served, so queries never pay for
+    a rebuild. Built here only if there is none at all.
+    """
+    return lexical_store.load(registry.corpus_version()) or lexical_store.latest() or rebuild_lexical_index()
+
+def ingest_document(url: str, source_name: str, chunking: str = CHUNK_STRATEGY,
+                    progress: Callable[[int, int], None] = None, cancel: threading.Event = None):
+    """
+    Task 3.2a: Ingest PDF, chunk, and store.
+    Streaming pipeline: chunked download to a unique temp file -> page
+    extraction in a process pool -> chunk generator -> bounded embed/add batches.
+    Idempotent: chunk IDs are content hashes, so re-ingesting only embeds new
+    chunks and deletes the ones that disappeared; an unchanged document
+    (same ETag or content hash, same chunking strategy) is a no-op.
+    Work is proportional to the edit only with the sentence and recursive
+    strategies, whose chunks end on content boundaries and realign a few
+    chunks after a change. The char and token windows sit at fixed offsets,
+    so an insertion or deletion re-embeds every chunk after it (appending
+    only touches the tail).
+    `progress(pages, chunks)` is called after every batch; setting `cancel`
+    stops at the next batch. A cancelled or failed run removes the chunks it
+    added and restores the metadata it changed, so a previously ingested
+    version is left as it was.
+    """
+    doc = store = previous = None
+    pages_done = 0
+    added_ids, overwritten = [], []  # this run's writes, undone if it doesn't finish
+    
+    def roll_back():
+        for batch in batched(added_ids, INGEST_BATCH_SIZE):
+            store.delete(batch)
+        for batch in batched(overwritten, INGEST_BATCH_SIZE):
+            store.update_metadatas([c[0] for c in batch], [c[1] for c in batch])
+        if previous and previous["status"] == "ready":
+            registry.record_ingestion(previous["source"], previous["url"], previous["fingerprint"], previous["etag"],
+                                      previous["last_modified"], previous["chunk_count"], previous["byte_size"],
+                                      previous["chunking"])
+    
+    def count_pages(pages):
+        nonlocal pages_done
+        for page in pages:
+            pages_done += 1
+            yield page
+    
     try:
-        # Download
-        response = requests.get(url)
-        response.raise_for_status()
-        temp_path = os.path.join("data", "temp.pdf")
-        with open(temp_path, "wb") as f:
-            f.write(response.content)
+        # Download (conditional on the validators from the last ingestion)
+        previous = registry.get_document(source_name)
+        if previous and previous["status"] == "ready" and previous["url"] == url and previous["chunking"] == chunking:
+            doc = download(url, previous["etag"], previous["last_modified"])
+            if doc is None or doc.sha256 == previous["fingerprint"]:
+                return {"status": "unchanged", "chunks_count": previous["chunk_count"]}
+        else:
+            doc = download(url)
+        
+        registry.begin_ingestion(source_name, url)
+        store = get_store()
+        
+        # Chunk IDs already stored for this source (IDs + metadata only, no embeddings)
+        stale = store.source_metadatas(source_name)
             
-        # Extract Text
-        reader = PdfReader(temp_path)
-        full_text = ""
-        for page in reader.pages:
-            full_text += page.extract_text() + "\n"
+        # Extract Text (streamed page by page) and chunk (strategy from app.chunking)
+        pages = count_pages(extract_pages(doc.path))
+        chunks = chunk_pages(pages, chunking)
         
-        os.remove(temp_path)
+        # Embed + store only new chunks, in bounded batches so memory stays flat
+        seen = {}
+        chunks_count = added = moved = 0
+        for batch in batched(chunks, INGEST_BATCH_SIZE):
+            ids = chunk_ids(source_name, (chunk.text for chunk in batch), seen)
+            new, shifted = [], []
+            for chunk_id, chunk in zip(ids, batch):
+                metadata = {
+                    "source": source_name,
+                    "index": chunk.start,
+                    "end": chunk.end,
+                    "token_count": chunk.token_count,
+                    "chunking": chunking
+                }
+                old = stale.pop(chunk_id, None)
+                if old is None:
+                    new.append((chunk_id, chunk.text, metadata))
+                elif old != metadata:
+                    shifted.append((chunk_id, metadata, old))
+            if new:
+                documents = [c[1] for c in new]
+                store.add(
+                    ids=[c[0] for c in new],
+                    embeddings=get_embed_fn()(documents),
+                    documents=documents,
+                    metadatas=[c[2] for c in new]
+                )
+                added_ids.extend(c[0] for c in new)
+            if shifted:
+                store.update_metadatas([c[0] for c in shifted], [c[1] for c in shifted])
+                overwritten.extend((c[0], c[2]) for c in shifted)
+            chunks_count += len(batch)
+            added += len(new)
+            moved += len(shifted)
+            if progress:
+                progress(pages_done, chunks_count)
+            if cancel is not None and cancel.is_set():
+                roll_back()
+                return {"status": "cancelled", "chunks_count": chunks_count, "added": added, "updated": moved}
         
-        # Chunking (Recursive-like sliding window)
-        chunk_size = 1000 # chars
-        overlap = 200
-        chunks = []
-        metadatas = []
-        ids = []
+        # Remove chunks that no longer exist in the document (past this point the old version is gone)
+        added_ids = None
+        for batch in batched(stale, INGEST_BATCH_SIZE):
+            store.delete(batch)
         
-        for i in range(0, len(full_text), chunk_size - overlap):
-            chunk_text = full_text[i:i + chunk_size]
-            chunks.append(chunk_text)
-            metadatas.append({"source": source_name, "index": i})
-            ids.append(str(uuid.uuid4()))
-            
-        # Store
-        collection.add(documents=chunks, metadatas=metadatas, ids=ids)
-        return {"status": "success", "chunks_count": len(chunks)}
+        registry.record_ingestion(source_name, url, doc.sha256, doc.etag, doc.last_modified, chunks_count, doc.size, chunking)
+        rebuild_lexical_index()
+        return {"status": "success", "chunks_count": chunks_count, "added": added, "updated": moved, "deleted": len(stale)}
         
     except Exception as e:
+        if store is not None and added_ids is not None:
+            try:
+                roll_back()
+            except Exception:
+                pass  # keep reporting the original error; re-ingesting cleans up
         return {"status": "error", "message": str(e)}
+    finally:
+        if doc and os.path.exists(doc.path):
+            os.remove(doc.path)
 
-def query_knowledge_base(query: str):
-    """Task 3.2c: QA Endpoint with <300ms retrieval."""
-    timer = Timer()
-    timer.start()
-    
-    # 1. Retrieval (Fast local embedding + HNSW search)
-    results = collection.query(
-        query_texts=[query],
-        n_results=10 # Increased n_results for better context
-    )
-    
-    retrieval_latency = timer.stop()
-    
-    context = ""
-    citations = []
-    
-    if results['documents']:
-        for i, doc in enumerate(results['documents'][0]):
-            source = results['metadatas'][0][i]['source']
-            context += f"[Citation {i+1}, Source: {source}]: {doc}\n\n"
-            
-            # Create a snippet for the citation
-            snippet = doc.replace('\n', ' ').strip()[:80] + '...'
-            citation_with_snippet = f"{source}: \"{snippet}\""
-            
-            if citation_with_snippet not in citations:
-                citations.append(citation_with_snippet)
-            
-    # 2. Generation
-    prompt = f"""
+def normalize_query(query: str) -> str:
+    """Cache key for a query: case- and whitespace-insensitive."""
+    return " ".join(query.lower().split())
+
+def embed_query(query: str):
+    """Embed a (normalized) query, reusing cached embeddings. Returns (embedding, cache_hit)."""
+    embeddings, hits = embed_queries([query])
+    return embeddings[0], hits[0]
+
+def embed_queries(queries: List[str]):
+    """
+    Embed (normalized) queries, reusing cached embeddings; all misses are
+    embedded in a single batched forward pass. Returns (embeddings, cache_hits).
+    """
+    embeddings = [embedding_cache.get(q) for q in queries]
+    hits = [e is not None for e in embeddings]
+    missing = list(dict.fromkeys(q for q, e in zip(queries, embeddings) if e is None))
+    if missing:
+        computed = dict(zip(missing, get_embed_fn()(missing)))
+        for q, embedding in computed.items():
+            embedding_cache.set(q, embedding)
+        embeddings = [computed[q] if e is None else e for q, e in zip(queries, embeddings)]
+    return embeddings, hits
+
+def _fetch(rankings: List[List], known: Dict = None, store=None) -> List[List[Dict]]:
+    """Resolve ranked (id, score) lists to hits, fetching missing chunk text from the vector store in one call."""
+    known = known or {}
+    missing = list({id_ for ranked in rankings for id_, _ in ranked if id_ not in known})
+    if missing:
+        known.update((store or get_store()).get(missing))
+    return [[{**known[id_], "score": score} for id_, score in ranked if id_ in known] for ranked in rankings]
+
+def retrieve_many(queries: List[str], embeddings: List, n_results: int = RAG_TOP_K, mode: str = RAG_RETRIEVAL_MODE,
+                  store=None, index: BM25Index = None) -> List[List[Dict]]:
+    """
+    Retrieve chunks for a batch of queries by dense (MiniLM embeddings), sparse
+    (BM25) or hybrid search. Hybrid fuses both candidate lists with
+    reciprocal rank fusion. Dense search is a single batched vector-store query.
+    Searches the knowledge base unless another vector store and its BM25
+    index are given (the benchmark's throwaway stores).
+    Returns one best-first hit list per query: {"id", "document", "metadata", "score"}.
+    """
+    if mode == "dense":
+        return (store or get_store()).query(embeddings, n_results)
+    if mode == "sparse":
+        index = index or get_lexical_index()
+        return _fetch([index.search(q, n_results) for q in queries], store=store)
+    if mode != "hybrid":
+        raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+
+    candidates = max(n_results, RAG_CANDIDATES)
+    index = index or get_lexical_index()
+    dense = (store or get_store()).query(embeddings, candidates)
+    fused = [
+        reciprocal_rank_fusion([[hit["id"] for hit in d], [id_ for id_, _ in index.search(q, candidates)]])[:n_results]
+        for q, d in zip(queries, dense)
+    ]
+    return _fetch(fused, {hit["id"]: hit for d in dense for hit in d}, store)
+
+def retrieve(query: str, embedding, n_results: int = RAG_TOP_K, mode: str = RAG_RETRIEVAL_MODE,
+             store=None, index: BM25Index = None) -> List[Dict]:
+    """Retrieve chunks for a single query (see retrieve_many)."""
+    return retrieve_many([query], [embedding], n_results, mode, store, index)[0]
+
+def build_prompt(query: str, context: str) -> str:
+    return f"""
     You are a helpful assistant. Answer the user's question based on the context below.
     Provide a detailed answer and include inline citations for each piece of information.
     For example, if you use information from Source 'Book A', you should write '... (Citation: Book A)'.
@@ -139,48 +349,235 @@ def query_knowledge_base(query: str):
     
     User Question: {query}
     """
+
+def cache_stats():
+    return {"embedding": embedding_cache.stats(), "answer": answer_cache.stats()}
+
+async def query_knowledge_base(query: str, mode: str = RAG_RETRIEVAL_MODE, n_results: int = RAG_TOP_K):
+    """Task 3.2c: QA Endpoint with <300ms retrieval."""
+    timer = Timer()
+    timer.start()
     
-    response = llm_client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[{"role": "user", "content": prompt}]
-    )
+    # 0. Caches: query embedding (exact, LRU) then answer (semantic, per corpus version and retrieval config)
+    normalized = normalize_query(query)
+    # Embedding is CPU-bound, so it runs in the executor instead of the event loop
+    embedding, embedding_hit = await run_blocking(embed_query, normalized)
+    version, scope = await run_blocking(registry.corpus_version), (mode, n_results)
+    
+    cached = answer_cache.lookup(embedding, version, scope)
+    if cached:
+        answer, citations = cached[0]
+        return {
+            "answer": answer,
+            "retrieval_latency_ms": timer.stop(),
+            "citations": citations,
+            "retrieval_mode": mode,
+            "cache": {"embedding_hit": embedding_hit, "answer_hit": True, "similarity": round(cached[1], 4), **cache_stats()}
+        }
+    
+    # 1. Retrieval (local embedding + vector search and/or BM25)
+    hits = await run_blocking(retrieve, query, embedding, n_results, mode)
+    
+    retrieval_latency = timer.stop()
     
-    answer = response.choices[0].message.content
+    # 2-3. Context assembly and generation
+    answer, assembled = await _generate(query, hits)
+    answer_cache.store(normalized, embedding, (answer, assembled["citations"]), version, scope)
     
     return {
         "answer": answer,
         "retrieval_latency_ms": retrieval_latency,
-        "citations": citations
+        "citations": assembled["citations"],
+        "retrieval_mode": mode,
+        "context_tokens": assembled["context_tokens"],
+        "tokens_saved": assembled["tokens_saved"],
+        "cache": {"embedding_hit": embedding_hit, "answer_hit": False, **cache_stats()}
     }
 
-def run_automated_eval():
-    """Task 3.2d: Automated Eval Script."""
-    # Answer Key (Subset for demonstration)
-    qa_pairs = [
-        ("Who made the One Ring?", "Sauron"),
-        ("Where was the One Ring made?", "Mount Doom"),
-        ("Who is the bearer of the One Ring?", "Frodo"),
-        ("What is the name of the wizard?", "Gandalf"),
-        ("Who is Frodo's companion?", "Sam"),
-        ("What is Sting?", "sword"),
-        ("Where is Rivendell?", "valley"),
-        ("Who is Aragorn?", "Ranger"),
-        ("What is Legolas?", "Elf"),
-        ("What is Gimli?", "Dwarf")
-    ]
+async def stream_query_knowledge_base(query: str, mode: str = RAG_RETRIEVAL_MODE, n_results: int = RAG_TOP_K) -> AsyncGenerator[Dict, None]:
+    """
+    Streaming variant of query_knowledge_base. Yields a "retrieval" event
+    (citations, hits, retrieval latency) as soon as the search finishes,
+    then "content" events as answer tokens arrive, then a "metrics" event
+    (TTFT, tokens, cost); "error" if retrieval or generation fails.
+    """
+    # TTFT is measured from the request, so it includes embedding and retrieval
+    timer = StreamTimer()
+    timer.start()
     
-    hits = 0
-    results = []
+    # Embedding and search failures are reported in the stream too: the response has already started
+    try:
+        # 0. Caches (as in query_knowledge_base)
+        normalized = normalize_query(query)
+        embedding, embedding_hit = await run_blocking(embed_query, normalized)
+        version, scope = await run_blocking(registry.corpus_version), (mode, n_results)
+        
+        cached = answer_cache.lookup(embedding, version, scope)
+        if cached:
+            answer, citations = cached[0]
+            yield {"type": "retrieval", "data": {
+                "citations": citations,
+                "retrieval_latency_ms": timer.elapsed_ms(),
+                "retrieval_mode": mode,
+                "cache": {"embedding_hit": embedding_hit, "answer_hit": True, "similarity": round(cached[1], 4)}
+            }}
+            timer.mark_chunk()
+            yield {"type": "content", "data": answer}
+            yield {"type": "metrics", "data": {
+                "prompt_tokens": 0, "completion_tokens": 0, "usage_source": "cache", "cost_usd": 0.0,
+                "latency_ms": round(timer.stop()), **timer.stream_metrics(0)
+            }}
+            return
+        
+        # 1. Retrieval and context assembly, sent before generation starts
+        hits = await run_blocking(retrieve, query, embedding, n_results, mode)
+        retrieval_latency = timer.elapsed_ms()
+        assembled = await run_blocking(assemble_context, hits, RAG_CONTEXT_TOKENS)
+        yield {"type": "retrieval", "data": {
+            "citations": assembled["citations"],
+            "results": [
+                {"source": hit["metadata"]["source"], "index": hit["metadata"].get("index"), "score": round(hit["score"], 4)}
+                for hit in hits
+            ],
+            "retrieval_latency_ms": retrieval_latency,
+            "retrieval_mode": mode,
+            "context_tokens": assembled["context_tokens"],
+            "tokens_saved": assembled["tokens_saved"],
+            "cache": {"embedding_hit": embedding_hit, "answer_hit": False}
+        }}
+        
+        # 2. Generation, streamed (provider usage requested in the final chunk)
+        prompt = build_prompt(query, assembled["context"])
+        stream = llm.stream_chat_completion(
+            model=MODEL_NAME,
+            messages=[{"role": "user", "content": prompt}],
+            stream_options={"include_usage": True}
+        )
+        parts = []
+        usage = None
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                timer.mark_chunk()
+                parts.append(chunk.choices[0].delta.content)
+                yield {"type": "content", "data": chunk.choices[0].delta.content}
+        
+        # 3. Metrics (provider usage; local counts only as a fallback)
+        latency_ms = timer.stop()
+        answer = "".join(parts)
+        answer_cache.store(normalized, embedding, (answer, assembled["citations"]), version, scope)
+        if usage:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(answer)
+        yield {"type": "metrics", "data": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "usage_source": "provider" if usage else "local",
+            "cost_usd": calculate_cost(prompt_tokens, completion_tokens),
+            "latency_ms": round(latency_ms),
+            **timer.stream_metrics(completion_tokens)
+        }}
+    except Exception as e:
+        yield {"type": "error", "data": str(e)}
+
+async def _generate(query: str, hits: List[Dict]):
+    """Assemble the context from retrieved hits and generate the answer. Returns (answer, assembled)."""
+    # Context assembly: merge overlapping chunks, dedupe, fit the token budget
+    assembled = await run_blocking(assemble_context, hits, RAG_CONTEXT_TOKENS)
+    prompt = build_prompt(query, assembled["context"])
     
-    for q, expected in qa_pairs:
-        res = collection.query(query_texts=[q], n_results=10)
-        retrieved_docs = " ".join(res['documents'][0]).lower()
+    response = await llm.chat_completion(
+        model=MODEL_NAME,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    return response.choices[0].message.content, assembled
+
+async def query_knowledge_base_batch(queries: List[str], mode: str = RAG_RETRIEVAL_MODE, n_results: int = RAG_TOP_K,
+                                     concurrency: int = RAG_BATCH_CONCURRENCY):
+    """
+    Answer many questions in one pass. All queries are embedded in one
+    batched forward pass and searched with one vector-store query; answers are
+    generated concurrently (at most `concurrency` at a time) and yielded as
+    each finishes, as {"type": "result", "data": {...}} events tagged with
+    the query's index. If embedding or retrieval fails, an "error" event
+    reports the queries left unanswered. A final {"type": "metrics"} event
+    closes the stream.
+    """
+    timer = Timer()
+    timer.start()
+    
+    pending, retrieved = [], []
+    embedding_hits = []
+    answer_hits = errors = 0
+    retrieval_latency = None
+    try:
+        # 1. Embedding (one forward pass for every cache miss) and answer cache
+        normalized = [normalize_query(q) for q in queries]
+        embeddings, embedding_hits = await run_blocking(embed_queries, normalized)
+        version, scope = await run_blocking(registry.corpus_version), (mode, n_results)
         
-        # Rough check: if key concept word is in retrieved chunks
-        success = expected.lower() in retrieved_docs
-        if success:
-            hits += 1
-        results.append({"question": q, "success": success})
+        for i, (query, embedding) in enumerate(zip(queries, embeddings)):
+            cached = answer_cache.lookup(embedding, version, scope)
+            if cached:
+                answer_hits += 1
+                answer, citations = cached[0]
+                yield {"type": "result", "data": {
+                    "index": i, "query": query, "answer": answer, "citations": citations,
+                    "cache": {"embedding_hit": embedding_hits[i], "answer_hit": True, "similarity": round(cached[1], 4)}
+                }}
+            else:
+                pending.append(i)
         
-    accuracy = hits / len(qa_pairs)
-    return {"accuracy": accuracy, "details": results}
+        # 2. Retrieval for the remaining queries (one batched vector search)
+        if pending:
+            retrieval_timer = Timer()
+            retrieval_timer.start()
+            retrieved = await run_blocking(
+                retrieve_many, [queries[i] for i in pending], [embeddings[i] for i in pending], n_results, mode
+            )
+            retrieval_latency = retrieval_timer.stop()
+    except Exception as e:
+        # Embedding or the batched search failed: every unanswered query fails, the stream still closes with metrics
+        errors = len(queries) - answer_hits
+        pending = []
+        yield {"type": "error", "data": f"{errors} of {len(queries)} queries failed: {e}"}
+    
+    # 3. Concurrent generation, results streamed in completion order
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def answer_one(i: int, hits: List[Dict]) -> Dict:
+        async with semaphore:
+            try:
+                answer, assembled = await _generate(queries[i], hits)
+            except Exception as e:
+                return {"index": i, "query": queries[i], "error": str(e)}
+        answer_cache.store(normalized[i], embeddings[i], (answer, assembled["citations"]), version, scope)
+        return {
+            "index": i, "query": queries[i], "answer": answer, "citations": assembled["citations"],
+            "context_tokens": assembled["context_tokens"], "tokens_saved": assembled["tokens_saved"],
+            "cache": {"embedding_hit": embedding_hits[i], "answer_hit": False}
+        }
+    
+    tasks = [asyncio.create_task(answer_one(i, hits)) for i, hits in zip(pending, retrieved)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            errors += "error" in result
+            yield {"type": "result", "data": result}
+    finally:
+        # Client went away: don't keep generating answers nobody will read
+        for task in tasks:
+            task.cancel()
+    
+    yield {"type": "metrics", "data": {
+        "queries": len(queries),
+        "answer_cache_hits": answer_hits,
+        "embedding_cache_hits": sum(embedding_hits),
+        "errors": errors,
+        "retrieval_mode": mode,
+        "retrieval_latency_ms": retrieval_latency,
+        "total_ms": timer.stop(),
+        "cache": cache_stats()
+    }}
@@ -0,0 +1,78 @@
+from typing import Dict, List, Optional
+from app.db import connection
+
+# Registry of ingested documents (the `documents` table). It is the source of
+# truth for "what is in the knowledge base", so listing documents never has
+# to touch Chroma or the embedding model.
+
+COLUMNS = ("source", "url", "fingerprint", "etag", "last_modified", "status",
+           "chunk_count", "byte_size", "chunking", "ingested_at", "updated_at")
+
+def _bump_version(conn):
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'corpus_version'")
+
+def corpus_version() -> int:
+    """Counter that changes whenever documents are ingested or deleted (used to invalidate caches)."""
+    with connection() as conn:
+        return conn.execute("SELECT value FROM meta WHERE key = 'corpus_version'").fetchone()[0]
+
+def _row_to_dict(row) -> Dict:
+    return dict(zip(COLUMNS, row))
+
+def get_document(source: str) -> Optional[Dict]:
+    with connection() as conn:
+        row = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM documents WHERE source = ?", (source,)).fetchone()
+    return _row_to_dict(row) if row else None
+
+def list_documents() -> List[Dict]:
+    """All fully ingested documents, oldest first."""
+    with connection() as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM documents WHERE status = 'ready' ORDER BY ingested_at, source"
+        ).fetchall()
+    return [_row_to_dict(row) for row in rows]
+
+def document_names() -> List[str]:
+    return [doc["source"] for doc in list_documents()]
+
+def begin_ingestion(source: str, url: str):
+    """
+    Mark a document as being (re-)ingested. Its validators are cleared so
+    that an interrupted ingestion is redone rather than treated as unchanged.
+    """
+    with connection() as conn:
+        conn.execute("""
+            INSERT INTO documents (source, url, status, updated_at) VALUES (?, ?, 'ingesting', CURRENT_TIMESTAMP)
+            ON CONFLICT (source) DO UPDATE SET
+                url = excluded.url, status = 'ingesting', fingerprint = NULL, etag = NULL,
+                last_modified = NULL, updated_at = CURRENT_TIMESTAMP
+        """, (source, url))
+        _bump_version(conn)
+
+def record_ingestion(source: str, url: str, fingerprint: Optional[str], etag: Optional[str],
+                     last_modified: Optional[str], chunk_count: int, byte_size: Optional[int],
+                     chunking: Optional[str] = None):
+    """Atomically record a completed ingestion."""
+    with connection() as conn:
+        conn.execute("""
+            INSERT INTO documents (source, url, fingerprint, etag, last_modified, status,
+                                   chunk_count, byte_size, chunking, ingested_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, 'ready', ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            ON CONFLICT (source) DO UPDATE SET
+                url = excluded.url, fingerprint = excluded.fingerprint, etag = excluded.etag,
+                last_modified = excluded.last_modified, status = 'ready',
+                chunk_count = excluded.chunk_count, byte_size = excluded.byte_size,
+                chunking = excluded.chunking, ingested_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+        """, (source, url, fingerprint, etag, last_modified, chunk_count, byte_size, chunking))
+        _bump_version(conn)
+
+def delete_document(source: str) -> bool:
+    with connection() as conn:
+        deleted = conn.execute("DELETE FROM documents WHERE source = ?", (source,)).rowcount > 0
+        if deleted:
+            _bump_version(conn)
+        return deleted
+
+def is_empty() -> bool:
+    with connection() as conn:
+        return conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None
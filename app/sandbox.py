@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import signal
+import shutil
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+
+from app.config import (
+    CODE_ENV_PATH, SANDBOX_TIMEOUT_S, SANDBOX_CPU_S, SANDBOX_MEMORY_MB, SANDBOX_FILE_MB, SANDBOX_MAX_PROCS,
+    SANDBOX_OUTPUT_BYTES, SANDBOX_CONCURRENCY, SANDBOX_MAX_QUEUE
+)
+from app.utils import run_blocking
+
+# Sandbox for running generated code. Every run gets its own temp directory
+# (under CODE_ENV_PATH) and a fresh interpreter in its own session, started
+# with rlimits on CPU time, address space, file size and process count, and
+# killed with its whole process group at the wall-clock timeout. Output is
+# captured up to a cap per stream. A bounded pool limits concurrent runs;
+# callers wait in a bounded queue beyond it. POSIX only (uses `resource`).
+#
+# Run statuses: passed (exit 0) | failed (non-zero exit) | timeout |
+# killed (by a signal, e.g. SIGXCPU at the CPU limit)
+
+# Runs in the child: apply the limits, then exec the real interpreter (isolated mode), so they hold for the script
+_BOOTSTRAP = """
+import os, sys, json, resource
+for name, soft, hard in json.loads(sys.argv[1]):
+    limit = getattr(resource, name)
+    current = resource.getrlimit(limit)[1]
+    if current != resource.RLIM_INFINITY:
+        hard = min(hard, current)
+    resource.setrlimit(limit, (min(soft, hard), hard))
+os.execv(sys.executable, [sys.executable, "-I", *sys.argv[2:]])
+"""
+
+class SandboxBusyError(Exception):
+    """Raised when the sandbox queue is full."""
+
+def _limits(cpu_s: int, memory_mb: int, file_mb: int, max_procs: int):
+    return [
+        ("RLIMIT_CPU", cpu_s, cpu_s + 1),  # SIGXCPU at the soft limit, SIGKILL a second later
+        ("RLIMIT_AS", memory_mb * 1024 * 1024, memory_mb * 1024 * 1024),
+        ("RLIMIT_FSIZE", file_mb * 1024 * 1024, file_mb * 1024 * 1024),
+        ("RLIMIT_NPROC", max_procs, max_procs),
+        ("RLIMIT_CORE", 0, 0),
+    ]
+
+# After a timeout kill, how long the pipes get to close (a process that left the group can hold them open)
+_PIPE_GRACE_S = 5
+
+class _Capture(asyncio.Protocol):
+    """The first `limit` bytes read from a pipe; `closed` resolves at EOF (or when we close our end)."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.kept = bytearray()
+        self.total = 0
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def data_received(self, data: bytes):
+        self.total += len(data)
+        if len(self.kept) < self.limit:
+            self.kept += data[:self.limit - len(self.kept)]
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+    def result(self) -> Tuple[str, bool]:
+        """(text, truncated)"""
+        return self.kept.decode(errors="replace"), self.total > self.limit
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _write_file(path: str, content: str):
+    with open(path, "w") as f:
+        f.write(content)
+
+class SandboxPool:
+    """Bounded pool of sandboxed runs, with queue counters like the LLM gateway's."""
+
+    def __init__(self, concurrency: int = SANDBOX_CONCURRENCY, max_queue: int = SANDBOX_MAX_QUEUE):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.running = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.runs = 0
+        self.rejected = 0
+        self.statuses: Dict[str, int] = {}
+        self.queue_wait_total_ms = 0.0
+        self.queue_wait_max_ms = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        start = time.perf_counter()
+        if self.semaphore.locked():
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise SandboxBusyError("Code sandbox is busy, retry later")
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            try:
+                await self.semaphore.acquire()
+            finally:
+                self.queued -= 1
+        else:
+            await self.semaphore.acquire()
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        self.queue_wait_total_ms += wait_ms
+        self.queue_wait_max_ms = max(self.queue_wait_max_ms, wait_ms)
+        self.runs += 1
+        self.running += 1
+        try:
+            yield wait_ms
+        finally:
+            self.running -= 1
+            self.semaphore.release()
+
+    async def run_python(self, code: str, timeout: float = SANDBOX_TIMEOUT_S, cpu_s: int = SANDBOX_CPU_S,
+                         memory_mb: int = SANDBOX_MEMORY_MB, file_mb: int = SANDBOX_FILE_MB,
+                         max_procs: int = SANDBOX_MAX_PROCS, output_bytes: int = SANDBOX_OUTPUT_BYTES) -> Dict:
+        """
+        Run a Python script in a fresh sandbox once a slot is free. Returns
+        {"status", "returncode", "signal", "stdout", "stderr", "stdout_truncated",
+        "stderr_truncated", "duration_ms", "queue_ms"}.
+        """
+        async with self.slot() as queue_ms:
+            result = await _execute(code, timeout, _limits(cpu_s, memory_mb, file_mb, max_procs), output_bytes)
+        self.statuses[result["status"]] = self.statuses.get(result["status"], 0) + 1
+        return {**result, "queue_ms": round(queue_ms, 1)}
+
+    def metrics(self) -> Dict:
+        return {
+            "concurrency_limit": self.concurrency,
+            "running": self.running,
+            "queue_depth": self.queued,
+            "max_queue_depth": self.max_queued,
+            "runs": self.runs,
+            "rejected": self.rejected,
+            "statuses": dict(self.statuses),
+            "avg_queue_wait_ms": round(self.queue_wait_total_ms / self.runs, 2) if self.runs else 0.0,
+            "max_queue_wait_ms": round(self.queue_wait_max_ms, 2)
+        }
+
+async def _execute(code: str, timeout: float, limits, output_bytes: int) -> Dict:
+    workdir = await run_blocking(tempfile.mkdtemp, prefix="run-", dir=CODE_ENV_PATH)
+    proc = None
+    transports = []
+    try:
+        await run_blocking(_write_file, os.path.join(workdir, "solution.py"), code)
+        # Our own pipes rather than PIPE, read by transports we can close: the process is waited
+        # for on its own, and the pipes can be abandoned if something outside its group holds them
+        loop = asyncio.get_running_loop()
+        stdout, stderr = _Capture(output_bytes), _Capture(output_bytes)
+        write_fds = []
+        try:
+            for capture in (stdout, stderr):
+                read_fd, write_fd = os.pipe()
+                write_fds.append(write_fd)
+                transport, _ = await loop.connect_read_pipe(lambda capture=capture: capture, os.fdopen(read_fd, "rb", buffering=0))
+                transports.append(transport)
+            start = time.perf_counter()
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-I", "-c", _BOOTSTRAP, json.dumps(limits), "solution.py",
+                cwd=workdir,
+                env={"PATH": os.environ.get("PATH", "/usr/bin:/bin"), "HOME": workdir, "TMPDIR": workdir, "LANG": "C.UTF-8"},
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=write_fds[0],
+                stderr=write_fds[1],
+                start_new_session=True  # its own process group, killed as a whole
+            )
+        finally:
+            for fd in write_fds:
+                os.close(fd)  # the child has its own copies; EOF comes when the last holder exits
+        outputs = asyncio.gather(stdout.closed, stderr.closed, proc.wait())
+        timed_out = False
+        try:
+            await asyncio.wait_for(asyncio.shield(outputs), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            _kill_group(proc)
+            try:
+                # The pipes close once the group is dead
+                await asyncio.wait_for(outputs, _PIPE_GRACE_S)
+            except asyncio.TimeoutError:
+                # A process that left the group (setsid) holds them open. It is in its own
+                # session, out of reach of killpg, and we don't know its pid (a pid we'd guess
+                # from /proc could already belong to an unrelated process), so it can only be
+                # abandoned; its rlimits still bound it. Keep the output captured so far and
+                # close our ends of the pipes (in the finally below).
+                pass
+        duration_ms = (time.perf_counter() - start) * 1000
+    finally:
+        if proc is not None:
+            # Also reaps anything the script left running in the background
+            _kill_group(proc)
+        for transport in transports:
+            transport.close()
+        await run_blocking(shutil.rmtree, workdir, ignore_errors=True)
+
+    returncode = proc.returncode  # None if a timed-out run wasn't reaped yet
+    if timed_out:
+        status = "timeout"
+    elif returncode == 0:
+        status = "passed"
+    elif returncode < 0:
+        status = "killed"
+    else:
+        status = "failed"
+    (stdout, stdout_truncated), (stderr, stderr_truncated) = stdout.result(), stderr.result()
+    return {
+        "status": status,
+        "returncode": returncode,
+        "signal": signal.Signals(-returncode).name if returncode is not None and returncode < 0 else None,
+        "stdout": stdout,
+        "stderr": stderr,
+        "stdout_truncated": stdout_truncated,
+        "stderr_truncated": stderr_truncated,
+        "duration_ms": round(duration_ms, 1)
+    }
+
+# Shared by every coder session in this process
+pool = SandboxPool()
@@ -0,0 +1,125 @@
+import json
+from typing import Callable, Dict, List, Optional
+
+from app.config import AGENT_CONTEXT_TOKENS, AGENT_KEEP_TURNS, AGENT_SUMMARY_TOKENS
+from app.chat import MESSAGE_TOKEN_OVERHEAD
+from app.utils import count_tokens, get_encoding
+
+# Context of a tool-calling agent run. Resending every raw tool result on
+# every step makes prompts (and latency) grow with the length of the run, so
+# once the context passes its token budget the oldest turns (an assistant
+# tool-call message plus its tool results) are folded into a scratch-pad: one
+# short summary per tool call, sent as a single system message. The system
+# prompt, the user's request and the most recent turns stay verbatim. The
+# scratch-pad has a budget of its own (a quarter of the context's by
+# default); past it the oldest summaries are dropped.
+
+def _truncate(text: str, max_tokens: int) -> str:
+    encoding = get_encoding()
+    tokens = encoding.encode(text)
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens]) + "…"
+
+def summarize_result(content: str, max_tokens: int = AGENT_SUMMARY_TOKENS) -> str:
+    """
+    Short form of a tool result: compact JSON (a list is prefixed with its
+    length, so the model knows there was more), or the text, truncated to
+    `max_tokens`.
+    """
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return _truncate(" ".join(str(content).split()), max_tokens)
+    compact = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    if isinstance(data, list):
+        compact = f"{len(data)} results: {compact}"
+    return _truncate(compact, max_tokens)
+
+def _assistant_dict(msg) -> Dict:
+    """Chat-completion message object (or dict) as a plain assistant message."""
+    if isinstance(msg, dict):
+        return msg
+    message = {"role": "assistant", "content": msg.content}
+    if msg.tool_calls:
+        message["tool_calls"] = [
+            {"id": tc.id, "type": "function", "function": {"name": tc.function.name, "arguments": tc.function.arguments}}
+            for tc in msg.tool_calls
+        ]
+    return message
+
+class AgentContext:
+    """Messages of an agent run, with per-message token counts and compaction into a scratch-pad."""
+
+    def __init__(self, system_prompt: str, prompt: str, max_tokens: int = AGENT_CONTEXT_TOKENS,
+                 keep_turns: int = AGENT_KEEP_TURNS, summary_tokens: int = AGENT_SUMMARY_TOKENS,
+                 scratchpad_tokens: int = None, count: Callable[[str], int] = count_tokens):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.scratchpad_tokens = scratchpad_tokens or max_tokens // 4
+        self.count = count
+        self.pinned = [self._entry({"role": "system", "content": system_prompt}),
+                       self._entry({"role": "user", "content": prompt})]
+        self.turns: List[List[Dict]] = []  # each: assistant tool-call entry, then its tool result entries
+        self.notes: Dict[str, str] = {}  # scratch-pad: "tool(args)" -> summary, latest call wins
+        self.compacted_turns = 0
+        self.dropped_notes = 0
+        self._scratchpad: Optional[Dict] = None
+
+    def _entry(self, message: Dict) -> Dict:
+        tokens = MESSAGE_TOKEN_OVERHEAD + self.count(message.get("content") or "")
+        for tc in message.get("tool_calls") or []:
+            tokens += self.count(tc["function"]["name"]) + self.count(tc["function"]["arguments"])
+        return {"message": message, "tokens": tokens}
+
+    def add_turn(self, assistant_msg, tool_results: List[Dict]):
+        """Record a step's tool-call message and its results (app.tools results), compacting if over budget."""
+        assistant = _assistant_dict(assistant_msg)
+        turn = [self._entry(assistant)]
+        for result in tool_results:
+            entry = self._entry({"role": "tool", "tool_call_id": result["id"], "content": result["content"]})
+            entry["call"] = f"{result['name']}({json.dumps(result['args'], separators=(',', ':'), sort_keys=True)})"
+            turn.append(entry)
+        self.turns.append(turn)
+        self._compact()
+
+    def _compact(self):
+        """Fold the oldest turns into the scratch-pad until under budget, always keeping `keep_turns` verbatim."""
+        while self.tokens() > self.max_tokens and len(self.turns) > self.keep_turns:
+            assistant, *results = self.turns.pop(0)
+            thought = assistant["message"].get("content")
+            if thought:
+                self.notes[f"note {self.compacted_turns + 1}"] = _truncate(thought, self.summary_tokens)
+            for entry in results:
+                self.notes.pop(entry["call"], None)  # re-insert, so the scratch-pad stays in call order
+                self.notes[entry["call"]] = summarize_result(entry["message"]["content"], self.summary_tokens)
+            self.compacted_turns += 1
+            self._scratchpad = self._entry({"role": "system", "content": self._render_notes()})
+            while self._scratchpad["tokens"] > self.scratchpad_tokens and len(self.notes) > 1:
+                del self.notes[next(iter(self.notes))]
+                self.dropped_notes += 1
+                self._scratchpad = self._entry({"role": "system", "content": self._render_notes()})
+
+    def _render_notes(self) -> str:
+        lines = [f"- {key}: {summary}" for key, summary in self.notes.items()]
+        if self.dropped_notes:
+            lines.insert(0, f"- ({self.dropped_notes} older entries dropped)")
+        return "Scratch-pad (summaries of earlier tool calls in this run; call a tool again if you need the full result):\n" + "\n".join(lines)
+
+    def _entries(self) -> List[Dict]:
+        scratchpad = [self._scratchpad] if self._scratchpad else []
+        return self.pinned + scratchpad + [entry for turn in self.turns for entry in turn]
+
+    def messages(self) -> List[Dict]:
+        """The messages to send: system prompt, request, scratch-pad, then the recent turns verbatim."""
+        return [entry["message"] for entry in self._entries()]
+
+    def tokens(self) -> int:
+        return sum(entry["tokens"] for entry in self._entries())
+
+    def stats(self) -> Dict:
+        return {
+            "context_tokens": self.tokens(),
+            "scratchpad_tokens": self._scratchpad["tokens"] if self._scratchpad else 0,
+            "verbatim_turns": len(self.turns),
+            "compacted_turns": self.compacted_turns
+        }
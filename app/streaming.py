@@ -0,0 +1,102 @@
+import json
+import time
+import asyncio
+from typing import AsyncIterator, Dict
+from fastapi.responses import StreamingResponse
+from app.config import STREAM_FLUSH_MS, STREAM_FLUSH_BYTES
+
+# Streamed events are dicts of the form {"type": ..., "data": ...}. Consecutive
+# "content" events are coalesced into one frame before being serialized.
+
+async def coalesce(events: AsyncIterator[Dict], flush_ms: float = STREAM_FLUSH_MS, flush_bytes: int = STREAM_FLUSH_BYTES) -> AsyncIterator[Dict]:
+    """
+    Merge consecutive content events, flushing every `flush_ms` or once
+    `flush_bytes` are buffered. Any other event flushes the buffer first so
+    ordering is preserved.
+    """
+    iterator = events.__aiter__()
+    buffer = []
+    size = 0
+    deadline = None
+    pending = None
+
+    def flush():
+        nonlocal buffer, size, deadline
+        frame = {"type": "content", "data": "".join(buffer)}
+        buffer, size, deadline = [], 0, None
+        return frame
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # Flush window elapsed while the producer is still thinking
+                yield flush()
+                continue
+
+            task, pending = pending, None
+            try:
+                event = task.result()
+            except StopAsyncIteration:
+                break
+
+            if event["type"] == "content":
+                if not buffer:
+                    deadline = time.perf_counter() + flush_ms / 1000
+                buffer.append(event["data"])
+                size += len(event["data"])
+                if size >= flush_bytes:
+                    yield flush()
+            else:
+                if buffer:
+                    yield flush()
+                yield event
+
+        if buffer:
+            yield flush()
+    finally:
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration, Exception):
+                pass
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+def encode_ndjson(event: Dict) -> str:
+    return json.dumps(event) + "\n"
+
+def encode_sse(event: Dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+def encode_text(event: Dict) -> str:
+    return event["data"] if event["type"] == "content" else json.dumps(event) + "\n"
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", encode_ndjson),
+    "sse": ("text/event-stream", encode_sse),
+    "text": ("text/plain", encode_text),
+}
+
+def negotiate_format(requested: str, accept: str, default: str = "ndjson") -> str:
+    """Pick a stream format from an explicit ?stream_format= or the Accept header."""
+    if requested in FORMATS:
+        return requested
+    if accept and "text/event-stream" in accept:
+        return "sse"
+    return default
+
+def streaming_response(events: AsyncIterator[Dict], fmt: str = "ndjson") -> StreamingResponse:
+    """Coalesce an event stream and serialize it as NDJSON, SSE or plain text."""
+    media_type, encode = FORMATS[fmt]
+
+    async def body():
+        async for event in coalesce(events):
+            yield encode(event)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} if fmt == "sse" else None
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
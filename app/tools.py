@@ -0,0 +1,175 @@
+import json
+import time
+import types
+import typing
+import asyncio
+import inspect
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import AGENT_TOOL_TIMEOUT, AGENT_TOOL_CACHE_TTL, AGENT_TOOL_CACHE_SIZE
+from app.cache import LRUCache
+from app.utils import run_blocking
+
+# Tool registry for tool-calling agents. Tools are plain functions, sync or
+# async, registered with a decorator; their JSON schemas are generated from
+# the signature (type hints) and docstring. All tool calls of a turn run
+# concurrently, each under its own timeout, so a turn takes as long as its
+# slowest call. Sync tools run in the shared blocking pool.
+#
+# Tools registered with a cache TTL memoize their results per process (so
+# across runs and users), keyed by the canonicalized arguments, and
+# concurrent identical calls share one execution (single flight). Only
+# successful results are cached.
+
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", dict: "object", list: "array"}
+
+def _json_schema(annotation) -> Dict:
+    """JSON schema of a type hint (str, int, float, bool, list[...], dict, Literal[...], Optional[...])."""
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin is typing.Literal:
+        return {"type": _JSON_TYPES.get(type(args[0]), "string"), "enum": list(args)}
+    if origin in (typing.Union, getattr(types, "UnionType", None)):
+        options = [a for a in args if a is not type(None)]
+        return _json_schema(options[0]) if len(options) == 1 else {"anyOf": [_json_schema(a) for a in options]}
+    if origin in (list, tuple, set):
+        return {"type": "array", "items": _json_schema(args[0])} if args else {"type": "array"}
+    if origin is dict:
+        return {"type": "object"}
+    if annotation in _JSON_TYPES:
+        return {"type": _JSON_TYPES[annotation]}
+    raise TypeError(f"Unsupported tool parameter type: {annotation!r}")
+
+def function_schema(func: Callable, name: str = None, description: str = None) -> Dict:
+    """OpenAI function-tool schema of a function. Parameters without a default are required."""
+    hints = typing.get_type_hints(func)
+    properties, required = {}, []
+    for param in inspect.signature(func).parameters.values():
+        properties[param.name] = _json_schema(hints.get(param.name, str))
+        if param.default is inspect.Parameter.empty:
+            required.append(param.name)
+    return {
+        "type": "function",
+        "function": {
+            "name": name or func.__name__,
+            "description": description or inspect.cleandoc(func.__doc__ or "").split("\n\n")[0],
+            "parameters": {"type": "object", "properties": properties, "required": required}
+        }
+    }
+
+_MISSING = object()
+
+class Tool:
+    def __init__(self, func: Callable, name: str, description: str, timeout: float, cache_ttl: float, cache_size: int):
+        self.func = func
+        self.name = name
+        self.timeout = timeout
+        self.schema = function_schema(func, name, description)
+        self.is_async = inspect.iscoroutinefunction(func)
+        self.signature = inspect.signature(func)
+        self.cache = LRUCache(cache_size, cache_ttl) if cache_ttl > 0 else None
+        self.shared = 0
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    def cache_key(self, kwargs: Dict) -> str:
+        """Canonical form of the arguments: bound to the signature, defaults filled in, keys sorted."""
+        bound = self.signature.bind(**kwargs)
+        bound.apply_defaults()
+        return json.dumps(bound.arguments, sort_keys=True, separators=(",", ":"), default=str)
+
+    async def _execute(self, kwargs: Dict) -> Any:
+        if self.is_async:
+            return await asyncio.wait_for(self.func(**kwargs), self.timeout)
+        # A timed-out sync tool keeps its thread until it returns; its result is discarded
+        return await asyncio.wait_for(run_blocking(self.func, **kwargs), self.timeout)
+
+    async def __call__(self, **kwargs) -> Tuple[Any, Optional[str]]:
+        """Run the tool. Returns (output, cache): cache is hit | shared | miss, or None for uncached tools."""
+        if self.cache is None:
+            return await self._execute(kwargs), None
+        key = self.cache_key(kwargs)
+        output = self.cache.get(key, _MISSING)
+        if output is not _MISSING:
+            return output, "hit"
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.shared += 1
+            return await asyncio.shield(task), "shared"
+        # Its own task, so a cancelled caller doesn't fail the others waiting on it
+        task = asyncio.ensure_future(self._execute(kwargs))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task), "miss"
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.cache.set(key, task.result())
+
+    def cache_stats(self) -> Dict:
+        """
+        Cache hits, misses, calls that joined an identical in-flight call, and
+        size. The hit rate counts joined calls as hits: neither reached the backend.
+        """
+        stats = self.cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        return {**stats, "shared": self.shared,
+                "hit_rate": round((stats["hits"] + self.shared) / lookups, 3) if lookups else 0.0}
+
+class ToolRegistry:
+    def __init__(self):
+        self.tools: Dict[str, Tool] = {}
+
+    def register(self, func: Callable = None, *, name: str = None, description: str = None,
+                 timeout: float = AGENT_TOOL_TIMEOUT, cache_ttl: float = 0, cache_size: int = 1024):
+        """
+        Decorator registering a tool: @registry.register or
+        @registry.register(timeout=5, cache_ttl=300). AGENT_TOOL_CACHE_TTL and
+        AGENT_TOOL_CACHE_SIZE override the cache settings per tool name.
+        """
+        def decorator(f: Callable) -> Callable:
+            tool_name = name or f.__name__
+            tool = Tool(f, tool_name, description, timeout,
+                        AGENT_TOOL_CACHE_TTL.get(tool_name, cache_ttl), AGENT_TOOL_CACHE_SIZE.get(tool_name, cache_size))
+            self.tools[tool_name] = tool
+            return f
+        return decorator(func) if func else decorator
+
+    def schemas(self) -> List[Dict]:
+        """Schemas of every tool, in the form chat completions take as `tools`."""
+        return [tool.schema for tool in self.tools.values()]
+
+    async def call(self, name: str, arguments: str, call_id: Optional[str] = None) -> Dict:
+        """
+        Run one tool call (arguments as the model's JSON string). Failures are
+        reported in the result, not raised, so the model can see them and recover.
+        Returns {"id", "name", "args", "content", "status": ok | error | timeout,
+        "cache": hit | shared | miss | None, "latency_ms"}.
+        """
+        start = time.perf_counter()
+        result = {"id": call_id, "name": name, "args": None, "status": "error", "cache": None}
+        try:
+            result["args"] = args = json.loads(arguments or "{}")
+            tool = self.tools.get(name)
+            if tool is None:
+                result["content"] = f"Error: Tool '{name}' not found"
+            else:
+                output, result["cache"] = await tool(**args)
+                result["content"] = output if isinstance(output, str) else json.dumps(output)
+                result["status"] = "ok"
+        except asyncio.TimeoutError:
+            result["status"] = "timeout"
+            result["content"] = f"Error: Tool '{name}' timed out after {self.tools[name].timeout:g}s"
+        except Exception as e:
+            result["content"] = f"Error: {type(e).__name__}: {e}"
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    def cache_stats(self) -> Dict[str, Dict]:
+        """Cache statistics of every cached tool."""
+        return {name: tool.cache_stats() for name, tool in self.tools.items() if tool.cache}
+
+    async def call_all(self, tool_calls) -> List[Dict]:
+        """Run a turn's tool calls (chat completion tool_calls) concurrently; results are in call order."""
+        return await asyncio.gather(*(
+            self.call(tc.function.name, tc.function.arguments, tc.id) for tc in tool_calls
+        ))
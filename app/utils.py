@@ -1,6 +1,10 @@
 import time
+import asyncio
+import functools
 import tiktoken
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from app.config import BLOCKING_WORKERS
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO)
@@ -10,13 +14,24 @@ logger = logging.getLogger("data_ai")
 INPUT_COST_PER_1M = 5.00
 OUTPUT_COST_PER_1M = 15.00
 
-def count_tokens(text: str, model: str = "gpt-4o") -> int:
+# Dedicated pool for blocking / CPU-bound work so it never runs on the event loop
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking function in the shared executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4o") -> tiktoken.Encoding:
+    """Load a tiktoken encoder once per process."""
     try:
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
+        return tiktoken.encoding_for_model(model)
     except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
-        return len(encoding.encode(text))
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    return len(get_encoding(model).encode(text))
 
 def calculate_cost(prompt_tokens: int, completion_tokens: int) -> float:
     p_cost = (prompt_tokens / 1_000_000) * INPUT_COST_PER_1M
@@ -35,3 +50,46 @@ class Timer:
         """Returns elapsed time in milliseconds"""
         self.end_time = time.perf_counter()
         return (self.end_time - self.start_time) * 1000
+
+    def elapsed_ms(self) -> float:
+        """Milliseconds since start(), without stopping"""
+        return (time.perf_counter() - self.start_time) * 1000
+
+def percentile(values, p: float) -> float:
+    """Linear-interpolated percentile (p in 0-100) of a list of numbers; 0.0 if empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+class StreamTimer(Timer):
+    """Timer that also records time-to-first-token and the gaps between streamed chunks."""
+
+    def __init__(self):
+        super().__init__()
+        self.first_chunk_time = None
+        self.last_chunk_time = None
+        self.gaps_ms = []
+
+    def mark_chunk(self):
+        now = time.perf_counter()
+        if self.first_chunk_time is None:
+            self.first_chunk_time = now
+        else:
+            self.gaps_ms.append((now - self.last_chunk_time) * 1000)
+        self.last_chunk_time = now
+
+    def stream_metrics(self, completion_tokens: int) -> dict:
+        """TTFT, decode throughput and p50/p95 inter-chunk gap. Call after stop()."""
+        if self.first_chunk_time is None:
+            return {"ttft_ms": None, "tokens_per_sec": 0.0, "inter_chunk_p50_ms": 0.0, "inter_chunk_p95_ms": 0.0}
+        generation_s = self.end_time - self.first_chunk_time
+        return {
+            "ttft_ms": round((self.first_chunk_time - self.start_time) * 1000),
+            "tokens_per_sec": round(completion_tokens / generation_s, 1) if generation_s > 0 else 0.0,
+            "inter_chunk_p50_ms": round(percentile(self.gaps_ms, 50), 1),
+            "inter_chunk_p95_ms": round(percentile(self.gaps_ms, 95), 1)
+        }
@@ -0,0 +1,261 @@
+import os
+import json
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from app.db import ConnectionPool
+
+# Vector stores behind app.rag. Both take precomputed embeddings and return
+# hits as {"id", "document", "metadata", "score"}, best (highest score) first.
+#   chroma - a Chroma collection (approximate HNSW search)
+#   numpy  - exact search over a memory-mapped matrix of normalized embeddings
+BACKENDS = ("chroma", "numpy")
+
+class ChromaStore:
+    """Adapter over a Chroma collection. Scores are 1 / (1 + L2 distance)."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def add(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        self.collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+
+    def delete_source(self, source: str):
+        self.collection.delete(where={"source": source})
+
+    def source_metadatas(self, source: str) -> Dict[str, Dict]:
+        """Chunk ID -> metadata of every chunk of a source (no documents or embeddings)."""
+        existing = self.collection.get(where={"source": source}, include=["metadatas"])
+        return dict(zip(existing["ids"], existing["metadatas"]))
+
+    def get(self, ids: List[str]) -> Dict[str, Dict]:
+        page = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            id_: {"id": id_, "document": doc, "metadata": metadata}
+            for id_, doc, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+        }
+
+    def scan(self, page_size: int = 5000) -> Iterator[Tuple[List[str], List[str], List[Dict]]]:
+        """Every chunk, as pages of (ids, documents, metadatas)."""
+        offset = 0
+        while True:
+            page = self.collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield page["ids"], page["documents"], page["metadatas"]
+            offset += len(page["ids"])
+
+    def query(self, embeddings, n_results: int) -> List[List[Dict]]:
+        """One HNSW query for a whole batch of embeddings."""
+        results = self.collection.query(
+            query_embeddings=embeddings,
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            [
+                {"id": id_, "document": doc, "metadata": metadata, "score": 1 / (1 + distance)}
+                for id_, doc, metadata, distance in zip(ids, docs, metadatas, distances)
+            ]
+            for ids, docs, metadatas, distances in zip(
+                results["ids"], results["documents"], results["metadatas"], results["distances"]
+            )
+        ]
+
+def _normalize(embeddings) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+class NumpyStore:
+    """
+    Exact nearest-neighbour search (cosine similarity scores) over
+    L2-normalized embeddings in a memory-mapped file. Worker processes map
+    the same file, so they share one copy in the page cache, and a cold start
+    only opens files. Chunk text and metadata are rows of a SQLite table next
+    to it: table row i is matrix row i. Writers append rows; deleted rows are
+    masked out of searches until the file is compacted.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS chunks (
+        row INTEGER PRIMARY KEY,
+        id TEXT UNIQUE NOT NULL,
+        source TEXT,
+        document TEXT,
+        metadata TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (source);
+    CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value);
+    """
+    # Compact once deleted rows outnumber live ones (and at least this many)
+    COMPACT_MIN_DEAD = 1024
+
+    def __init__(self, path: str, dtype: str = "float32", pool_size: int = 4):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.db = ConnectionPool(os.path.join(path, "chunks.db"), pool_size)
+        with self.db.connection() as conn:
+            conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+        self._view = (None, None, None)  # (version, matrix, live-row mask)
+
+    @staticmethod
+    def _state(conn) -> Dict:
+        return dict(conn.execute("SELECT key, value FROM state").fetchall())
+
+    @staticmethod
+    def _set_state(conn, **values):
+        conn.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", values.items())
+
+    def _matrix(self, conn) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """The memory-mapped matrix and live-row mask of the current version (cached per version)."""
+        state = self._state(conn)
+        with self._lock:
+            if self._view[0] != state.get("version"):
+                matrix = alive = None
+                if state.get("rows"):
+                    matrix = np.memmap(os.path.join(self.path, state["file"]), dtype=state["dtype"], mode="r",
+                                       shape=(state["rows"], state["dim"]))
+                    alive = np.zeros(state["rows"], dtype=bool)
+                    alive[np.fromiter((r for (r,) in conn.execute("SELECT row FROM chunks")), dtype=np.int64)] = True
+                self._view = (state.get("version"), matrix, alive)
+            return self._view[1], self._view[2]
+
+    def count(self) -> int:
+        with self.db.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        vectors = _normalize(embeddings)
+        with self.db.connection() as conn:
+            # Serializes writers (across processes too) while the file is appended to
+            conn.execute("BEGIN IMMEDIATE")
+            state = self._state(conn)
+            if "dim" not in state:
+                state = {"dim": vectors.shape[1], "dtype": self.dtype.name, "file": "vectors-0.bin", "rows": 0, "version": 0}
+            elif vectors.shape[1] != state["dim"]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} doesn't match the store's {state['dim']}")
+            data = vectors.astype(state["dtype"])
+            start = state["rows"]
+            fd = os.open(os.path.join(self.path, state["file"]), os.O_RDWR | os.O_CREAT)
+            try:
+                os.pwrite(fd, data.tobytes(), start * data.shape[1] * data.itemsize)
+            finally:
+                os.close(fd)
+            conn.executemany(
+                "INSERT INTO chunks (row, id, source, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (start + i, id_, metadata.get("source"), doc, json.dumps(metadata))
+                    for i, (id_, doc, metadata) in enumerate(zip(ids, documents, metadatas))
+                ]
+            )
+            self._set_state(conn, dim=state["dim"], dtype=state["dtype"], file=state["file"],
+                            rows=start + len(ids), version=state["version"] + 1)
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        with self.db.connection() as conn:
+            conn.executemany(
+                "UPDATE chunks SET source = ?, metadata = ? WHERE id = ?",
+                [(metadata.get("source"), json.dumps(metadata), id_) for id_, metadata in zip(ids, metadatas)]
+            )
+
+    def _delete_where(self, clause: str, params: Sequence):
+        with self.db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if not conn.execute(f"DELETE FROM chunks WHERE {clause}", params).rowcount:
+                return
+            state = self._state(conn)
+            self._set_state(conn, version=state["version"] + 1)
+            live = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            if state["rows"] - live >= max(self.COMPACT_MIN_DEAD, live):
+                self._compact(conn, state)
+
+    def delete(self, ids: List[str]):
+        for start in range(0, len(ids), 500):
+            batch = list(ids[start:start + 500])
+            self._delete_where(f"id IN ({', '.join('?' * len(batch))})", batch)
+
+    def delete_source(self, source: str):
+        self._delete_where("source = ?", (source,))
+
+    def _compact(self, conn, state: Dict):
+        """Rewrite the live rows into a new file. The previous file is kept for readers still mapping it."""
+        rows = [r for (r,) in conn.execute("SELECT row FROM chunks ORDER BY row")]
+        old = np.memmap(os.path.join(self.path, state["file"]), dtype=state["dtype"], mode="r",
+                        shape=(state["rows"], state["dim"]))
+        version = state["version"] + 2
+        new_file = f"vectors-{version}.bin"
+        np.asarray(old[rows]).tofile(os.path.join(self.path, new_file))
+        del old
+        # Renumber in ascending order: a row only ever moves down, onto a number already freed
+        conn.executemany("UPDATE chunks SET row = ? WHERE row = ?", [(new, old_row) for new, old_row in enumerate(rows)])
+        self._set_state(conn, file=new_file, rows=len(rows), version=version)
+        for name in os.listdir(self.path):
+            if name.startswith("vectors-") and name not in (new_file, state["file"]):
+                os.remove(os.path.join(self.path, name))
+
+    @staticmethod
+    def _hits(rows) -> Dict:
+        return {row: {"id": id_, "document": doc, "metadata": json.loads(metadata)} for row, id_, doc, metadata in rows}
+
+    def source_metadatas(self, source: str) -> Dict[str, Dict]:
+        with self.db.connection() as conn:
+            rows = conn.execute("SELECT id, metadata FROM chunks WHERE source = ?", (source,)).fetchall()
+        return {id_: json.loads(metadata) for id_, metadata in rows}
+
+    def get(self, ids: List[str]) -> Dict[str, Dict]:
+        ids = list(ids)
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                f"SELECT row, id, document, metadata FROM chunks WHERE id IN ({', '.join('?' * len(ids))})", ids
+            ).fetchall()
+        return {hit["id"]: hit for hit in self._hits(rows).values()}
+
+    def scan(self, page_size: int = 5000) -> Iterator[Tuple[List[str], List[str], List[Dict]]]:
+        last = -1
+        while True:
+            with self.db.connection() as conn:
+                rows = conn.execute(
+                    "SELECT row, id, document, metadata FROM chunks WHERE row > ? ORDER BY row LIMIT ?", (last, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield [r[1] for r in rows], [r[2] for r in rows], [json.loads(r[3]) for r in rows]
+
+    def query(self, embeddings, n_results: int) -> List[List[Dict]]:
+        """Exact top-k for a batch of embeddings: one matrix product, then argpartition per query."""
+        queries = _normalize(embeddings)
+        with self.db.connection() as conn:
+            # One read transaction, so the matrix and the rows it points to are the same version
+            conn.execute("BEGIN")
+            matrix, alive = self._matrix(conn)
+            if matrix is None:
+                return [[] for _ in queries]
+            scores = queries @ matrix.T
+            if not alive.all():
+                scores[:, ~alive] = -np.inf
+            k = min(n_results, int(alive.sum()))
+            if k == 0:
+                return [[] for _ in queries]
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            wanted = np.unique(top).tolist()
+            rows = conn.execute(
+                f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({', '.join('?' * len(wanted))})", wanted
+            ).fetchall()
+        hits = self._hits(rows)
+        return [[{**hits[r], "score": float(scores[i, r])} for r in top[i]] for i in range(len(top))]
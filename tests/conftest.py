@@ -0,0 +1,20 @@
+import pytest
+import tiktoken
+
+from app import chunking, scratchpad, utils
+
+# Byte-level encoding: works offline (tiktoken can't always download its
+# encodings) and makes token counts easy to reason about
+ENCODING = tiktoken.Encoding(
+    name="bytes",
+    pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={}
+)
+
+@pytest.fixture
+def encoding(monkeypatch):
+    """The byte-level encoding, also returned by get_encoding everywhere it is used."""
+    for module in (utils, chunking, scratchpad):
+        monkeypatch.setattr(module, "get_encoding", lambda *args, **kwargs: ENCODING)
+    return ENCODING
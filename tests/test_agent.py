@@ -0,0 +1,117 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app import agent, scratchpad
+
+pytestmark = pytest.mark.usefixtures("encoding")
+
+def _call(name, args, call_id):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+
+FLIGHTS = _call("search_flights", {"origin": "AKL", "destination": "WLG", "date": "2025-01-01"}, "f")
+WEATHER = _call("get_weather", {"location": "WLG", "date": "2025-01-01"}, "w")
+
+def fake_llm(monkeypatch, messages, delay=0.0, prompt_tokens=100):
+    """Replies with the given assistant messages in turn (the last one repeats); records the requests."""
+    requests = []
+
+    async def chat_completion(**kwargs):
+        requests.append(kwargs)
+        await asyncio.sleep(delay)
+        msg = messages[min(len(requests), len(messages)) - 1]
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=10)
+        return SimpleNamespace(choices=[SimpleNamespace(message=msg)], usage=usage)
+
+    monkeypatch.setattr(agent.llm, "chat_completion", chat_completion)
+    return requests
+
+def _collect(**kwargs):
+    async def run():
+        return [event async for event in agent.stream_planning_agent("Trip to Wellington", **kwargs)]
+    return asyncio.run(run())
+
+def test_events_and_logs(monkeypatch):
+    turns = [
+        SimpleNamespace(tool_calls=[FLIGHTS, WEATHER], content=None),
+        SimpleNamespace(tool_calls=None, content='{"itinerary": []}')
+    ]
+    requests = fake_llm(monkeypatch, turns)
+    plan, logs = asyncio.run(agent.run_planning_agent("Trip to Wellington"))
+    assert plan == '{"itinerary": []}'
+    assert logs[0].startswith("🧠 Step 1:")
+    assert {line.split(" | ")[0] for line in logs[1:3]} == {"🛠 Tool Call: search_flights", "🛠 Tool Call: get_weather"}
+    assert logs[3].startswith("⏱ 2 tools in parallel")
+    assert logs[-1].startswith("📦 Tool cache:")
+    # Tool results go back to the model in call order
+    assert [m["tool_call_id"] for m in requests[1]["messages"] if isinstance(m, dict) and m["role"] == "tool"] == ["f", "w"]
+
+    fake_llm(monkeypatch, turns)
+    events = _collect()
+    assert [e["type"] for e in events] == ["step", "tool", "tool", "tools", "step", "plan"]
+    assert events[0]["data"]["tool_calls"][0]["name"] == "search_flights"
+    final = events[-1]["data"]
+    assert final["status"] == "complete" and final["steps"] == 2 and final["prompt_tokens"] == 200
+    # Second run: both tools served from the cache
+    assert all(e["data"]["cache"] == "hit" for e in events if e["type"] == "tool")
+
+def test_step_budget_forces_an_answer_then_stops(monkeypatch):
+    requests = fake_llm(monkeypatch, [SimpleNamespace(tool_calls=[WEATHER], content=None)])
+    final = _collect(max_steps=3)[-1]["data"]
+    assert [r["tool_choice"] for r in requests] == ["auto", "auto", "none"]
+    # The model kept calling tools regardless: partial result from the tool outputs
+    assert final["status"] == "partial" and final["stop_reason"] == "max_steps" and final["steps"] == 3
+    assert json.loads(final["plan"])["tool_results"][0]["name"] == "get_weather"
+
+def test_prompt_token_budget(monkeypatch):
+    requests = fake_llm(monkeypatch, [SimpleNamespace(tool_calls=[WEATHER], content="Checking the weather")], prompt_tokens=400)
+    final = _collect(max_prompt_tokens=1000)[-1]["data"]
+    # After one 400-token call there is no room for two more: the second call has to answer
+    assert [r["tool_choice"] for r in requests] == ["auto", "none"]
+    assert final["stop_reason"] == "max_prompt_tokens" and final["plan"] == "Checking the weather"
+
+def test_deadline(monkeypatch):
+    fake_llm(monkeypatch, [SimpleNamespace(tool_calls=[WEATHER], content=None)], delay=0.1)
+    final = _collect(deadline_s=0.25)[-1]["data"]
+    assert final["stop_reason"] == "deadline" and final["steps"] == 2
+    assert final["latency_ms"] < 400
+
+def test_deadline_during_tools_keeps_finished_results(monkeypatch):
+    async def slow_flights(origin, destination, date):
+        await asyncio.sleep(5)
+
+    flights = agent.registry.tools["search_flights"]
+    monkeypatch.setattr(flights, "func", slow_flights)
+    monkeypatch.setattr(flights, "is_async", True)
+    monkeypatch.setattr(flights, "cache", None)
+    fake_llm(monkeypatch, [SimpleNamespace(tool_calls=[FLIGHTS, WEATHER], content=None)])
+    events = _collect(deadline_s=0.3)
+    assert [e["type"] for e in events] == ["step", "tool", "plan"]
+    final = events[-1]["data"]
+    assert final["stop_reason"] == "deadline"
+    # The weather result was streamed before the deadline, so the partial plan has it
+    assert [r["name"] for r in json.loads(final["plan"])["tool_results"]] == ["get_weather"]
+
+def test_long_runs_keep_the_context_bounded(monkeypatch):
+    # Every step asks for another day's weather; each raw result is ~300 tokens
+    big = json.dumps([{"hour": h, "condition": "Partly Cloudy", "temperature": 18} for h in range(6)])
+    monkeypatch.setattr(agent.registry.tools["get_weather"], "func", lambda location, date: big)
+    monkeypatch.setattr(agent.registry.tools["get_weather"], "cache", None)
+    turns = [SimpleNamespace(tool_calls=[_call("get_weather", {"location": "WLG", "date": f"2025-01-{d:02}"}, f"w{d}")], content=None)
+             for d in range(1, 12)]
+    requests = fake_llm(monkeypatch, turns + [SimpleNamespace(tool_calls=None, content="done")])
+    monkeypatch.setattr(agent, "AgentContext", lambda *args: scratchpad.AgentContext(*args, max_tokens=1500, keep_turns=2))
+    events = _collect(max_steps=20, max_prompt_tokens=10**6)
+    steps = [e["data"] for e in events if e["type"] == "step"]
+    assert len(steps) == 12
+    # Uncompacted, the last prompt would be ~4000 tokens
+    assert max(s["context_tokens"] for s in steps) <= 1500
+    assert steps[-1]["compacted_turns"] > 0
+    last_request = requests[-1]["messages"]
+    assert last_request[2]["role"] == "system" and last_request[2]["content"].startswith("Scratch-pad")
+    # The newest compacted call (the one before the verbatim turns) is summarized
+    assert 'get_weather({"date":"2025-01-09"' in last_request[2]["content"]
+    # Two turns (assistant + tool message each) verbatim after the pinned messages and the scratch-pad
+    assert [m["role"] for m in last_request[3:]] == ["assistant", "tool"] * 2
@@ -0,0 +1,33 @@
+from app.bench import first_relevant_ranks, score, compare, parse_hnsw
+
+def _hit(source, text):
+    return {"document": text, "metadata": {"source": source}}
+
+def test_first_relevant_rank_respects_source():
+    qa = [
+        {"question": "What is Sting?", "answer": "sword"},
+        {"question": "What is Sting?", "answer": "sword", "source": "B"},
+        {"question": "Who is Gimli?", "answer": "Dwarf"}
+    ]
+    hits = [_hit("A", "The hobbits left."), _hit("A", "Sting is a SWORD."), _hit("B", "A sword called Sting.")]
+    assert first_relevant_ranks(qa, [hits, hits, hits]) == [2, 3, None]
+
+def test_recall_at_k_and_mrr():
+    metrics = score([1, 3, None, 10], ks=(1, 5, 10))
+    assert metrics == {"recall@1": 0.25, "recall@5": 0.5, "recall@10": 0.75, "mrr": round((1 + 1 / 3 + 1 / 10) / 4, 4)}
+
+def _run(recall, p95):
+    return {"recall@1": recall, "recall@5": recall, "recall@10": recall, "mrr": recall,
+            "retrieval_ms": {"p95": p95}, "end_to_end_ms": {"p95": p95}}
+
+def test_compare_flags_regressions_only_beyond_tolerance():
+    baseline = {"runs": {"a": _run(0.8, 10.0), "b": _run(0.8, 10.0)}}
+    current = {"runs": {"a": _run(0.79, 11.0), "b": _run(0.7, 20.0), "new": _run(0.1, 1.0)}}
+    result = compare(current, baseline, max_recall_drop=0.02, max_latency_increase=0.25)
+    assert set(result["deltas"]) == {"a", "b"}
+    assert {r["run"] for r in result["regressions"]} == {"b"}
+    assert {r["metric"] for r in result["regressions"]} == {"recall@1", "recall@5", "recall@10", "mrr", "retrieval_ms.p95", "end_to_end_ms.p95"}
+
+def test_parse_hnsw():
+    assert parse_hnsw("default") == {}
+    assert parse_hnsw("max_neighbors=16, ef_search=100") == {"max_neighbors": 16, "ef_search": 100}
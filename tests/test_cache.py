@@ -0,0 +1,44 @@
+import time
+from app.cache import LRUCache, SemanticCache
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+def test_lru_ttl():
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+def test_semantic_cache_threshold_and_version():
+    cache = SemanticCache(maxsize=10, ttl=60, threshold=0.9)
+    cache.store("q", [1.0, 0.0], "answer", version=1)
+    assert cache.lookup([0.99, 0.05], version=1)[0] == "answer"
+    assert cache.lookup([0.0, 1.0], version=1) is None
+    # A corpus change invalidates everything
+    assert cache.lookup([1.0, 0.0], version=2) is None
+    assert len(cache) == 0
+
+def test_semantic_cache_size_eviction():
+    cache = SemanticCache(maxsize=2, ttl=60, threshold=0.99)
+    for i, vector in enumerate([[1, 0, 0], [0, 1, 0], [0, 0, 1]]):
+        cache.store(i, vector, i)
+    assert cache.lookup([1, 0, 0]) is None
+    assert cache.lookup([0, 0, 1])[0] == 2
+
+def test_semantic_cache_scopes_dont_evict_each_other():
+    cache = SemanticCache(maxsize=10, ttl=60, threshold=0.9)
+    cache.store("q", [1.0, 0.0], "hybrid answer", version=1, scope=("hybrid", 5))
+    assert cache.lookup([1.0, 0.0], version=1, scope=("dense", 5)) is None
+    assert cache.lookup([1.0, 0.0], version=1, scope=("hybrid", 3)) is None
+    cache.store("q", [1.0, 0.0], "dense answer", version=1, scope=("dense", 5))
+    assert cache.lookup([1.0, 0.0], version=1, scope=("hybrid", 5))[0] == "hybrid answer"
+    assert cache.lookup([1.0, 0.0], version=1, scope=("dense", 5))[0] == "dense answer"
+    assert len(cache) == 2
@@ -0,0 +1,73 @@
+import asyncio
+import sqlite3
+import threading
+from app import chat, db
+from app.chat import save_message, get_history, get_context_window, prune_history, MESSAGE_TOKEN_OVERHEAD
+
+def test_legacy_db_is_migrated(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, role TEXT, content TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+        conn.execute("INSERT INTO messages (role, content) VALUES ('user', 'old')")
+    db.init_db(path)
+    assert get_history() == [{"role": "user", "content": "old"}]
+    with db.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_history_is_per_session_and_windowed(tmp_path):
+    db.init_db(str(tmp_path / "chat.db"))
+    for i in range(15):
+        save_message("user", f"a{i}", "alice", token_count=1)
+    save_message("user", "b0", "bob", token_count=1)
+    history = get_history("alice", limit=10)
+    assert [m["content"] for m in history] == [f"a{i}" for i in range(5, 15)]
+    assert get_history("bob") == [{"role": "user", "content": "b0"}]
+    assert prune_history(keep=3) == 12
+    assert [m["content"] for m in get_history("alice")] == ["a12", "a13", "a14"]
+
+def test_context_window_is_token_budgeted(tmp_path):
+    db.init_db(str(tmp_path / "window.db"))
+    for i, tokens in enumerate([50, 10, 20, 30]):
+        save_message("user", f"m{i}", "s", token_count=tokens)
+    budget = (10 + 20 + 30) + 3 * MESSAGE_TOKEN_OVERHEAD
+    assert [m["content"] for m in get_context_window("s", max_tokens=budget)] == ["m1", "m2", "m3"]
+    # The newest message is always sent, even if it alone exceeds the budget
+    save_message("user", "huge", "s", token_count=10_000)
+    assert [m["content"] for m in get_context_window("s", max_tokens=budget)] == ["huge"]
+
+def test_concurrent_migrations_apply_once(tmp_path):
+    path = str(tmp_path / "fresh.db")
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def start():
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            barrier.wait()
+            db.migrate(conn)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=start) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(db.MIGRATIONS)
+
+def test_tokenizer_failure_is_an_error_frame(tmp_path, monkeypatch):
+    db.init_db(str(tmp_path / "chat.db"))
+
+    def offline(text):
+        raise OSError("encoding download failed")
+
+    monkeypatch.setattr(chat, "count_tokens", offline)
+
+    async def run():
+        return [event async for event in chat.stream_chat("Hello")]
+
+    assert asyncio.run(run()) == [{"type": "error", "data": "encoding download failed"}]
@@ -0,0 +1,46 @@
+import random
+import pytest
+from app.chunking import chunk_pages, char_windows, token_windows
+
+PAGES = [
+    "The Fellowship set out from Rivendell. Gandalf led the way! Did Frodo carry the Ring?",
+    "Sting glowed blue when orcs were near.\n\nGimli was a dwarf. Legolas was an elf of Mirkwood — swift and keen.",
+    "",
+    "Ünïcödé text ensures offsets are counted in chars, not bytes.",
+]
+FULL = "".join(p + "\n" for p in PAGES)
+
+def test_char_windows_match_slicing(encoding):
+    random.seed(0)
+    for _ in range(50):
+        size = random.randint(5, 120)
+        overlap = random.randint(0, size - 1)
+        expected = [(FULL[i:i + size], i) for i in range(0, len(FULL), size - overlap)]
+        got = [(c.text, c.start) for c in char_windows(PAGES, size, overlap, encoding=encoding)]
+        assert got == expected
+
+@pytest.mark.parametrize("strategy", ["token", "sentence", "recursive"])
+@pytest.mark.parametrize("block_chars", [16, 65536])
+def test_token_strategies_record_offsets_and_fit_budget(strategy, block_chars, encoding):
+    chunks = list(chunk_pages(PAGES, strategy, size=40, overlap=8, encoding=encoding, block_chars=block_chars))
+    assert chunks
+    for chunk in chunks:
+        assert FULL[chunk.start:chunk.end] == chunk.text
+        assert chunk.token_count <= 40
+    # Together the chunks cover the whole document
+    assert chunks[0].start == 0 and chunks[-1].end == len(FULL)
+    assert all(b.start <= a.end for a, b in zip(chunks, chunks[1:]))
+
+def test_token_windows_have_exact_sizes(encoding):
+    chunks = list(token_windows(PAGES, size=30, overlap=10, encoding=encoding))
+    assert all(c.token_count == len(encoding.encode_ordinary(c.text)) for c in chunks)
+    assert all(c.token_count == 30 for c in chunks[:-1])
+
+def test_sentence_chunks_end_on_sentence_boundaries(encoding):
+    chunks = list(chunk_pages(PAGES, "sentence", size=40, overlap=0, encoding=encoding))
+    for chunk in chunks[:-1]:
+        assert chunk.text.rstrip()[-1] in ".!?" or chunk.token_count == 40 or chunk.text.endswith("\n")
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        chunk_pages(PAGES, "nope")
@@ -0,0 +1,82 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.embedder import Histogram, MicroBatcher, RemoteEmbedder, make_server
+
+class SlowModel:
+    """Embeds a text as [len(text), 1], taking a fixed time per forward pass."""
+
+    def __init__(self, delay: float = 0.02):
+        self.delay = delay
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        time.sleep(self.delay)
+        return [np.array([len(t), 1.0], dtype=np.float32) for t in texts]
+
+def test_histogram_buckets():
+    h = Histogram((1, 10))
+    for value in (0.5, 1, 5, 50):
+        h.observe(value)
+    snapshot = h.snapshot()
+    assert snapshot["buckets"] == {"<=1": 2, "<=10": 1, ">10": 1}
+    assert snapshot["count"] == 4 and snapshot["max"] == 50
+
+def test_concurrent_calls_are_coalesced():
+    model = SlowModel()
+    batcher = MicroBatcher(model, max_batch=64, max_wait_ms=5)
+    texts = ["x" * i for i in range(1, 33)]
+    with ThreadPoolExecutor(32) as pool:
+        results = list(pool.map(lambda t: batcher([t])[0], texts))
+    assert [int(r[0]) for r in results] == list(range(1, 33))
+    assert len(model.batches) < len(texts)
+    stats = batcher.stats()
+    assert stats["batch_size"]["count"] == len(model.batches)
+    assert stats["queue_wait_ms"]["count"] == len(texts)
+
+def test_large_calls_are_split_into_max_batch():
+    model = SlowModel(delay=0)
+    batcher = MicroBatcher(model, max_batch=4, max_wait_ms=0)
+    result = batcher([str(i) * (i + 1) for i in range(10)])
+    assert [int(r[0]) for r in result] == list(range(1, 11))
+    assert max(len(b) for b in model.batches) <= 4
+
+def test_query_waits_behind_one_slice_of_a_large_call():
+    model = SlowModel(delay=0.1)
+    batcher = MicroBatcher(model, max_batch=4, max_wait_ms=0)
+    ingestion = threading.Thread(target=batcher, args=(["doc"] * 16,))
+    ingestion.start()
+    time.sleep(0.05)
+    start = time.perf_counter()
+    assert int(batcher(["query"])[0][0]) == 5
+    # The slice in progress, then the query's own pass (not the three slices queued after it)
+    assert time.perf_counter() - start < 0.25
+    ingestion.join()
+    assert model.batches[1] == ["query"]
+
+def test_errors_reach_every_caller_in_the_batch():
+    def broken(texts):
+        raise ValueError("model crashed")
+    batcher = MicroBatcher(broken, max_wait_ms=0)
+    with pytest.raises(ValueError):
+        batcher(["a"])
+
+def test_service_round_trip(tmp_path):
+    path = str(tmp_path / "embedder.sock")
+    server = make_server(path, MicroBatcher(SlowModel(delay=0), max_wait_ms=1))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = RemoteEmbedder(path)
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda t: client([t, t + t]), ["a", "bb", "ccc"] * 4))
+        assert [[int(e[0]) for e in r] for r in results] == [[1, 2], [2, 4], [3, 6]] * 4
+        assert client([]) == []
+        assert client.stats()["requests"] == 12
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,14 @@
+import pytest
+from app import health
+
+def test_track_marks_ready_and_failed():
+    with health.track("embeddings"):
+        assert health.snapshot()["subsystems"]["embeddings"]["state"] == "starting"
+    assert health.is_ready(["embeddings"])
+
+    with pytest.raises(RuntimeError):
+        with health.track("corpus"):
+            raise RuntimeError("download failed")
+    corpus = health.snapshot()["subsystems"]["corpus"]
+    assert corpus == {"state": "failed", "error": "download failed"}
+    assert not health.is_ready(["embeddings", "corpus"])
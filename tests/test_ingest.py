@@ -0,0 +1,123 @@
+import hashlib
+import random
+
+import numpy as np
+import pytest
+
+from app import chunking, db, rag
+from app.ingest import Download, chunk_ids
+from app.vectorstore import NumpyStore
+
+random.seed(1)
+_WORDS = "ring hobbit shire wizard orc elf dwarf mountain river road forest tower".split()
+_SENTENCES = [" ".join(random.choice(_WORDS) for _ in range(random.randint(4, 14))).capitalize() + "." for _ in range(300)]
+PAGES = [" ".join(_SENTENCES[i:i + 30]) for i in range(0, 300, 30)]
+
+class FakeEmbedder:
+    def __init__(self):
+        self.embedded = 0
+
+    def __call__(self, texts):
+        self.embedded += len(texts)
+        return [np.frombuffer(hashlib.sha256(t.encode()).digest()[:16], dtype=np.uint8).astype(np.float32) + 1 for t in texts]
+
+@pytest.fixture
+def knowledge_base(tmp_path, monkeypatch, encoding):
+    """Ingestion against a temp registry and NumPy store; "downloads" serve the pages in `served`."""
+    db.init_db(str(tmp_path / "kb.db"))
+    store = NumpyStore(str(tmp_path / "vectors"))
+    embedder = FakeEmbedder()
+    served = {"pages": PAGES}
+
+    def fake_download(url, etag=None, last_modified=None):
+        path = tmp_path / "doc.pdf"
+        path.write_text("\f".join(served["pages"]))
+        return Download(str(path), hashlib.sha256(path.read_bytes()).hexdigest(), path.stat().st_size, None, None)
+
+    monkeypatch.setattr(rag, "download", fake_download)
+    monkeypatch.setattr(rag, "extract_pages", lambda path: open(path).read().split("\f"))
+    monkeypatch.setattr(rag, "get_store", lambda: store)
+    monkeypatch.setattr(rag, "get_embed_fn", lambda: embedder)
+    monkeypatch.setattr(rag, "rebuild_lexical_index", lambda: None)
+    yield served, store, embedder
+    store.db.close()
+
+def test_chunk_ids_are_stable_and_distinct_for_repeats():
+    seen = {}
+    first = chunk_ids("A", ["x", "y", "x"], seen)
+    assert first[0] != first[2] and first[2] == f"{first[0]}-1"
+    assert chunk_ids("A", ["x", "y", "x"], {}) == first
+    assert chunk_ids("B", ["x"], {})[0] != first[0]
+
+def test_reingesting_an_edit_only_touches_affected_chunks(knowledge_base):
+    served, store, embedder = knowledge_base
+    result = rag.ingest_document("http://x/doc.pdf", "Doc", "sentence")
+    assert result["status"] == "success" and result["added"] == result["chunks_count"]
+    assert rag.ingest_document("http://x/doc.pdf", "Doc", "sentence")["status"] == "unchanged"
+
+    # A sentence inserted near the start: sentence packing realigns within a few chunks
+    served["pages"] = [PAGES[0].replace(_SENTENCES[2], _SENTENCES[2] + " Gandalf arrived late.", 1)] + PAGES[1:]
+    embedded = embedder.embedded
+    result = rag.ingest_document("http://x/doc.pdf", "Doc", "sentence")
+    assert result["status"] == "success"
+    assert 0 < result["added"] <= 3 and result["deleted"] <= 3
+    assert embedder.embedded - embedded == result["added"]
+    assert result["chunks_count"] > 20 * result["added"]
+    assert sorted(m["index"] for m in store.source_metadatas("Doc").values()) == [
+        c.start for c in chunking.chunk_pages(served["pages"], "sentence")
+    ]
+
+def test_fixed_windows_reembed_everything_after_an_edit(knowledge_base):
+    # The documented limitation of the char and token strategies: window boundaries are offsets
+    served, _, _ = knowledge_base
+    rag.ingest_document("http://x/doc.pdf", "Doc", "token")
+    served["pages"] = [PAGES[0].replace(_SENTENCES[2], _SENTENCES[2] + " Gandalf arrived late.", 1)] + PAGES[1:]
+    result = rag.ingest_document("http://x/doc.pdf", "Doc", "token")
+    assert result["added"] == result["chunks_count"]
+
+    # Appending only touches the tail
+    served["pages"] = served["pages"] + ["A new closing page about the shire."]
+    result = rag.ingest_document("http://x/doc.pdf", "Doc", "token")
+    assert result["added"] <= 2 and result["deleted"] <= 1
+
+class _CancelAfter:
+    """A cancel flag that trips once `batches` progress callbacks have been made."""
+    def __init__(self, batches):
+        self.batches = batches
+
+    def __call__(self, pages, chunks):
+        self.batches -= 1
+
+    def is_set(self):
+        return self.batches <= 0
+
+def test_cancelled_ingestion_leaves_no_orphan_chunks(knowledge_base, monkeypatch):
+    _, store, _ = knowledge_base
+    monkeypatch.setattr(rag, "INGEST_BATCH_SIZE", 8)
+    cancel = _CancelAfter(2)
+    result = rag.ingest_document("http://x/doc.pdf", "Doc", "sentence", progress=cancel, cancel=cancel)
+    assert result["status"] == "cancelled" and result["added"] > 0
+    assert store.source_metadatas("Doc") == {}
+    assert rag.registry.list_documents() == []
+
+def test_failed_reingestion_restores_the_previous_version(knowledge_base, monkeypatch):
+    served, store, embedder = knowledge_base
+    monkeypatch.setattr(rag, "INGEST_BATCH_SIZE", 8)
+    rag.ingest_document("http://x/doc.pdf", "Doc", "sentence")
+    before = store.source_metadatas("Doc")
+
+    # An edit near the start shifts every later chunk's offsets; the embedder fails on a later batch
+    served["pages"] = [PAGES[0].replace(_SENTENCES[2], _SENTENCES[2] + " Gandalf arrived late.", 1)] + PAGES[1:-1] + ["Brand new page."]
+    calls = {"n": 0}
+
+    def flaky(texts):
+        calls["n"] += 1
+        if calls["n"] > 1:
+            raise RuntimeError("embedding service down")
+        return embedder(texts)
+
+    monkeypatch.setattr(rag, "get_embed_fn", lambda: flaky)
+    result = rag.ingest_document("http://x/doc.pdf", "Doc", "sentence")
+    assert result == {"status": "error", "message": "embedding service down"}
+    assert store.source_metadatas("Doc") == before
+    assert [d["source"] for d in rag.registry.list_documents()] == ["Doc"]
@@ -0,0 +1,82 @@
+import threading
+from app import db, jobs, rag
+
+def test_submit_dedupes_and_cancels_queued_jobs(tmp_path):
+    db.init_db(str(tmp_path / "jobs.db"))
+    first = jobs.submit("http://x/a.pdf", "A")
+    assert first["status"] == "queued"
+    assert jobs.submit("http://x/a.pdf", "A")["id"] == first["id"]
+    other = jobs.submit("http://x/b.pdf", "B", priority=5)
+
+    assert jobs.cancel(first["id"])["status"] == "cancelled"
+    jobs._run(first["id"])  # a worker popping a cancelled job skips it
+    assert jobs.get_job(first["id"])["status"] == "cancelled"
+    assert [j["id"] for j in jobs.list_jobs("queued")] == [other["id"]]
+    assert jobs.cancel("missing") is None
+
+def test_running_job_reports_progress_and_stops_on_cancel(tmp_path, monkeypatch):
+    db.init_db(str(tmp_path / "jobs.db"))
+    started, release = threading.Event(), threading.Event()
+
+    def fake_ingest(url, source, chunking, progress, cancel):
+        progress(3, 256)
+        started.set()
+        release.wait(5)
+        return {"status": "cancelled" if cancel.is_set() else "success", "chunks_count": 256}
+
+    monkeypatch.setattr(rag, "ingest_document", fake_ingest)
+    job = jobs.submit("http://x/a.pdf", "A")
+    worker = threading.Thread(target=jobs._run, args=(job["id"],))
+    worker.start()
+    assert started.wait(5)
+    running = jobs.get_job(job["id"])
+    assert (running["status"], running["pages"], running["chunks"]) == ("running", 3, 256)
+
+    # Only the job row is flagged, as when the job runs in another process
+    assert jobs.cancel(job["id"])["status"] == "cancelling"
+    # Still active until its ingestion stops: resubmitting doesn't start a second one alongside it
+    assert jobs.submit("http://x/a.pdf", "A")["id"] == job["id"]
+    release.set()
+    worker.join(5)
+    finished = jobs.get_job(job["id"])
+    assert finished["status"] == "cancelled"
+    assert finished["result"]["chunks_count"] == 256
+    assert jobs.submit("http://x/a.pdf", "A")["id"] != job["id"]
+
+def test_only_jobs_with_expired_leases_are_reclaimed(tmp_path, monkeypatch):
+    db.init_db(str(tmp_path / "jobs.db"))
+    live = jobs.submit("http://x/a.pdf", "A")
+    orphan = jobs.submit("http://x/b.pdf", "B")
+    with db.connection() as conn:
+        # Running in another live process, and in one that died two minutes ago
+        conn.execute("UPDATE jobs SET status = 'running', owner = 'other:1', heartbeat_at = CURRENT_TIMESTAMP WHERE id = ?", (live["id"],))
+        conn.execute("UPDATE jobs SET status = 'running', owner = 'gone:2', heartbeat_at = datetime('now', '-120 seconds') WHERE id = ?", (orphan["id"],))
+    assert jobs.reclaim_expired(lease_s=60) == [orphan["id"]]
+    assert jobs.get_job(live["id"])["status"] == "running"
+    assert jobs.get_job(orphan["id"])["status"] == "queued"
+
+    # A process that lost its lease mid-run (and the job was requeued) doesn't record a result
+    def stalled_ingest(url, source, chunking, progress, cancel):
+        jobs.reclaim_expired(lease_s=-60)
+        return {"status": "success", "chunks_count": 1}
+
+    monkeypatch.setattr(rag, "ingest_document", stalled_ingest)
+    jobs._run(orphan["id"])
+    assert jobs.get_job(orphan["id"])["status"] == "queued"
+
+def test_concurrent_submits_create_one_job(tmp_path):
+    db.init_db(str(tmp_path / "jobs.db"))
+    barrier = threading.Barrier(4)
+    ids = []
+
+    def submit():
+        barrier.wait()
+        ids.append(jobs.submit("http://x/a.pdf", "A")["id"])
+
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == 1
+    assert len(jobs.list_jobs("queued")) == 1
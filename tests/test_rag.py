@@ -0,0 +1,61 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from app import rag
+from app.lexical import LexicalStore
+
+def _collect(events):
+    async def run():
+        return [e async for e in events]
+    return asyncio.run(run())
+
+def _fail(*args, **kwargs):
+    raise RuntimeError("vector store not ready")
+
+def test_batch_reports_retrieval_failure_and_closes(monkeypatch):
+    monkeypatch.setattr(rag, "embed_queries", lambda queries: ([[float(len(q)), 1.0] for q in queries], [False] * len(queries)))
+    monkeypatch.setattr(rag.registry, "corpus_version", lambda: 0)
+    monkeypatch.setattr(rag, "retrieve_many", _fail)
+    events = _collect(rag.query_knowledge_base_batch(["Who is Frodo?", "What is Sting?"]))
+    assert [e["type"] for e in events] == ["error", "metrics"]
+    assert "vector store not ready" in events[0]["data"]
+    assert events[1]["data"]["errors"] == 2
+
+    monkeypatch.setattr(rag, "embed_queries", _fail)
+    events = _collect(rag.query_knowledge_base_batch(["Who is Frodo?"]))
+    assert [e["type"] for e in events] == ["error", "metrics"]
+    assert events[1]["data"]["embedding_cache_hits"] == 0
+
+def test_stream_reports_retrieval_failure(monkeypatch):
+    monkeypatch.setattr(rag, "embed_query", _fail)
+    events = _collect(rag.stream_query_knowledge_base("Who is Frodo?"))
+    assert events == [{"type": "error", "data": "vector store not ready"}]
+
+    monkeypatch.setattr(rag, "embed_query", lambda query: ([1.0, 0.0], False))
+    monkeypatch.setattr(rag.registry, "corpus_version", lambda: 0)
+    monkeypatch.setattr(rag, "retrieve", _fail)
+    events = _collect(rag.stream_query_knowledge_base("Who is Frodo?"))
+    assert events == [{"type": "error", "data": "vector store not ready"}]
+
+def test_queries_never_rebuild_the_lexical_index(tmp_path, monkeypatch):
+    scans = []
+
+    class Store:
+        def scan(self, page_size):
+            scans.append(page_size)
+            yield ["a", "b"], ["Frodo carried the Ring.", "Sting glows blue."], [{}, {}]
+
+    version = {"n": 1}
+    monkeypatch.setattr(rag, "lexical_store", LexicalStore(str(tmp_path / "bm25.joblib")))
+    monkeypatch.setattr(rag, "get_store", lambda: Store())
+    monkeypatch.setattr(rag.registry, "corpus_version", lambda: version["n"])
+    assert rag.get_lexical_index().version == 1  # no index yet: built once
+    assert rag.rebuild_lexical_index().version == 1  # already current
+    assert len(scans) == 1
+
+    # An ingestion started: queries keep using the last index until it rebuilds
+    version["n"] = 2
+    with ThreadPoolExecutor(8) as pool:
+        indexes = list(pool.map(lambda _: rag.get_lexical_index(), range(8)))
+    assert {index.version for index in indexes} == {1} and len(scans) == 1
+    assert rag.rebuild_lexical_index().version == 2 and len(scans) == 2
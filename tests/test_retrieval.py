@@ -0,0 +1,40 @@
+from app.lexical import BM25Index, reciprocal_rank_fusion
+from app.context import merge_spans, assemble_context
+
+def test_bm25_ranks_exact_terms_first():
+    index = BM25Index(
+        ["a", "b", "c"],
+        ["Frodo carried the Ring to Mordor.", "Sting is an elvish sword that glows blue.", "The hobbits left the Shire."]
+    )
+    results = index.search("What is Sting?", n_results=3)
+    assert [id_ for id_, _ in results] == ["b"]
+    assert index.search("unrelated", n_results=3) == []
+
+def test_bm25_empty_index():
+    assert BM25Index([], []).search("anything", 5) == []
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]])
+    assert fused[0][0] == "y"
+    assert {id_ for id_, _ in fused} == {"x", "y", "z", "w"}
+
+def _hit(source, index, text):
+    return {"document": text, "metadata": {"source": source, "index": index}}
+
+def _words(text):
+    return len(text.split())
+
+def test_overlapping_chunks_are_merged():
+    full = "one two three four five six seven eight nine ten"
+    hits = [_hit("A", 8, full[8:28]), _hit("A", 0, full[0:18]), _hit("B", 0, "other book")]
+    spans = merge_spans(hits)
+    assert [(s["source"], s["text"]) for s in spans] == [("A", full[0:28]), ("B", "other book")]
+    assert spans[0]["chunks"] == 2 and spans[0]["rank"] == 0
+
+def test_context_dedupes_and_respects_budget():
+    hits = [_hit("A", 0, "alpha beta gamma"), _hit("B", 0, "alpha  beta gamma"), _hit("C", 0, "delta epsilon")]
+    assembled = assemble_context(hits, max_tokens=4, count=_words)
+    assert assembled["spans"] == 1
+    assert "Source: A" in assembled["context"] and "Source: B" not in assembled["context"]
+    assert assembled["context_tokens"] == 3
+    assert assembled["tokens_saved"] == 5
@@ -0,0 +1,94 @@
+import os
+import time
+import signal
+import asyncio
+
+import pytest
+
+from app.config import CODE_ENV_PATH
+from app import sandbox
+from app.sandbox import SandboxPool, SandboxBusyError
+
+def _runs_left():
+    return [name for name in os.listdir(CODE_ENV_PATH) if name.startswith("run-")]
+
+def test_passing_and_failing_scripts():
+    async def main():
+        pool = SandboxPool(concurrency=2, max_queue=4)
+        passed = await pool.run_python("import os; print(os.getcwd())")
+        failed = await pool.run_python("raise SystemExit('boom')")
+        return pool, passed, failed
+
+    before = _runs_left()
+    pool, passed, failed = asyncio.run(main())
+    assert passed["status"] == "passed" and passed["returncode"] == 0
+    # Each run gets its own directory, removed afterwards
+    assert os.path.basename(passed["stdout"].strip()).startswith("run-")
+    assert failed["status"] == "failed" and failed["returncode"] == 1 and "boom" in failed["stderr"]
+    assert _runs_left() == before
+    assert pool.metrics()["statuses"] == {"passed": 1, "failed": 1}
+
+def test_infinite_loop_times_out():
+    async def main():
+        return await SandboxPool().run_python("import subprocess, sys\n"
+                                              "subprocess.Popen([sys.executable, '-c', 'while True: pass'])\n"
+                                              "while True: pass", timeout=1)
+
+    start = time.perf_counter()
+    result = asyncio.run(main())
+    assert result["status"] == "timeout"
+    assert time.perf_counter() - start < 5
+
+def test_output_is_capped():
+    async def main():
+        return await SandboxPool().run_python("print('x' * 100000)", output_bytes=1000)
+
+    result = asyncio.run(main())
+    assert result["status"] == "passed"
+    assert len(result["stdout"]) == 1000 and result["stdout_truncated"]
+    assert not result["stderr_truncated"]
+
+def test_memory_limit():
+    async def main():
+        return await SandboxPool().run_python("blob = bytearray(1024 * 1024 * 1024)", memory_mb=256)
+
+    result = asyncio.run(main())
+    assert result["status"] == "failed" and "MemoryError" in result["stderr"]
+
+def test_concurrency_is_bounded_and_queue_rejects():
+    async def main():
+        pool = SandboxPool(concurrency=2, max_queue=1)
+        runs = [asyncio.ensure_future(pool.run_python("import time; time.sleep(0.5)")) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        assert pool.metrics()["running"] == 2 and pool.metrics()["queue_depth"] == 1
+        with pytest.raises(SandboxBusyError):
+            await pool.run_python("pass")
+        results = await asyncio.gather(*runs)
+        return pool, results
+
+    pool, results = asyncio.run(main())
+    assert [r["status"] for r in results] == ["passed"] * 3
+    assert max(r["queue_ms"] for r in results) >= 300
+    metrics = pool.metrics()
+    assert metrics["runs"] == 3 and metrics["rejected"] == 1 and metrics["max_queue_depth"] == 1
+
+def test_timeout_with_an_escaped_process_holding_the_pipes(monkeypatch):
+    monkeypatch.setattr(sandbox, "_PIPE_GRACE_S", 0.5)
+    code = ("import os, time\n"
+            "if os.fork() == 0:\n"
+            "    os.setsid()\n"
+            "    print(os.getpid(), flush=True)\n"
+            "    time.sleep(30)\n"
+            "    os._exit(0)\n"
+            "while True: pass")
+
+    async def main():
+        return await SandboxPool().run_python(code, timeout=1)
+
+    start = time.perf_counter()
+    result = asyncio.run(main())
+    assert result["status"] == "timeout"
+    assert time.perf_counter() - start < 4
+    # Output captured before the pipes were abandoned is kept
+    escaped = int(result["stdout"].split()[0])
+    os.kill(escaped, signal.SIGKILL)
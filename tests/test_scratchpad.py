@@ -0,0 +1,55 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.scratchpad import AgentContext, summarize_result
+from app.utils import count_tokens as count
+
+pytestmark = pytest.mark.usefixtures("encoding")
+
+def _turn(context, n, content="x" * 200, thought=None):
+    call = SimpleNamespace(id=f"c{n}", function=SimpleNamespace(name="lookup", arguments=json.dumps({"n": n})))
+    msg = SimpleNamespace(content=thought, tool_calls=[call])
+    context.add_turn(msg, [{"id": f"c{n}", "name": "lookup", "args": {"n": n}, "content": content}])
+
+def test_summaries_are_compact_and_bounded():
+    assert summarize_result('[{"a": 1}, {"a": 2}]') == '2 results: [{"a":1},{"a":2}]'
+    assert summarize_result("plain   text\nresult") == "plain text result"
+    assert summarize_result(json.dumps({"k": "v" * 500}), max_tokens=20).endswith("…")
+
+def test_recent_turns_stay_verbatim_until_over_budget():
+    context = AgentContext("system", "plan a trip", max_tokens=10_000, count=count)
+    for n in range(3):
+        _turn(context, n)
+    assert context.stats()["compacted_turns"] == 0
+    assert [m["role"] for m in context.messages()] == ["system", "user"] + ["assistant", "tool"] * 3
+
+def test_old_turns_are_folded_into_the_scratchpad():
+    context = AgentContext("system", "plan a trip", max_tokens=1000, keep_turns=2, summary_tokens=10, count=count)
+    for n in range(5):
+        _turn(context, n, thought="checking" if n == 0 else None)
+    assert context.stats()["compacted_turns"] >= 1
+    pad = context.messages()[2]["content"]
+    assert pad.startswith("Scratch-pad") and '- lookup({"n":0}): xxxxxxxxxx…' in pad and "note 1: checking" in pad
+    sizes = []
+    for n in range(5, 30):
+        _turn(context, n)
+        sizes.append(context.tokens())
+    assert max(sizes) <= 1000
+    stats = context.stats()
+    assert stats["verbatim_turns"] >= 2 and stats["compacted_turns"] == 30 - stats["verbatim_turns"]
+    messages = context.messages()
+    assert messages[0]["content"] == "system" and messages[1]["content"] == "plan a trip"
+    # The scratch-pad keeps within its own budget by dropping the oldest summaries
+    assert context.stats()["scratchpad_tokens"] <= 250 and "older entries dropped" in messages[2]["content"]
+    # Each verbatim tool message still follows its assistant tool-call message
+    tail = messages[3:]
+    assert [m["role"] for m in tail] == ["assistant", "tool"] * stats["verbatim_turns"]
+    assert tail[-1]["tool_call_id"] == "c29"
+
+def test_keep_turns_wins_over_the_budget():
+    context = AgentContext("system", "plan", max_tokens=10, keep_turns=2, count=count)
+    for n in range(3):
+        _turn(context, n)
+    assert context.stats()["verbatim_turns"] == 2
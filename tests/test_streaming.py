@@ -0,0 +1,36 @@
+import asyncio
+from app.streaming import coalesce, encode_sse
+
+async def _events(items, delay=0.0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+def _collect(events, **kwargs):
+    async def run():
+        return [e async for e in coalesce(events, **kwargs)]
+    return asyncio.run(run())
+
+def test_content_is_coalesced_and_order_preserved():
+    items = [{"type": "content", "data": c} for c in "abc"]
+    items += [{"type": "metrics", "data": {"n": 1}}, {"type": "content", "data": "d"}]
+    frames = _collect(_events(items), flush_ms=1000, flush_bytes=1000)
+    assert frames == [
+        {"type": "content", "data": "abc"},
+        {"type": "metrics", "data": {"n": 1}},
+        {"type": "content", "data": "d"},
+    ]
+
+def test_flushes_on_byte_threshold():
+    items = [{"type": "content", "data": "xx"} for _ in range(5)]
+    frames = _collect(_events(items), flush_ms=1000, flush_bytes=4)
+    assert [f["data"] for f in frames] == ["xxxx", "xxxx", "xx"]
+
+def test_flushes_on_time_window():
+    items = [{"type": "content", "data": "x"} for _ in range(3)]
+    frames = _collect(_events(items, delay=0.05), flush_ms=10, flush_bytes=1000)
+    assert len(frames) == 3
+
+def test_sse_frame():
+    assert encode_sse({"type": "content", "data": "hi"}) == 'event: content\ndata: {"type": "content", "data": "hi"}\n\n'
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import List, Literal, Optional
+
+from app.tools import ToolRegistry, function_schema
+
+def _call(name, arguments, call_id="call-1"):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+def test_schema_from_signature():
+    def book(city: str, nights: int, budget: Optional[float] = None, tags: List[str] = (), cabin: Literal["eco", "biz"] = "eco"):
+        """Book a hotel.
+
+        Longer notes the model doesn't need.
+        """
+    function = function_schema(book)["function"]
+    assert function["name"] == "book"
+    assert function["description"] == "Book a hotel."
+    assert function["parameters"]["required"] == ["city", "nights"]
+    assert function["parameters"]["properties"] == {
+        "city": {"type": "string"},
+        "nights": {"type": "integer"},
+        "budget": {"type": "number"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "cabin": {"type": "string", "enum": ["eco", "biz"]}
+    }
+
+def test_tool_calls_run_concurrently():
+    registry = ToolRegistry()
+
+    @registry.register
+    async def slow_async(x: int):
+        """Async tool."""
+        await asyncio.sleep(0.2)
+        return {"x": x}
+
+    @registry.register
+    def slow_sync(x: int):
+        """Sync tool."""
+        time.sleep(0.2)
+        return str(x)
+
+    calls = [_call("slow_async", '{"x": 1}', "a"), _call("slow_sync", '{"x": 2}', "b"), _call("slow_async", '{"x": 3}', "c")]
+    start = time.perf_counter()
+    results = asyncio.run(registry.call_all(calls))
+    assert time.perf_counter() - start < 0.5
+    assert [(r["id"], r["status"], r["content"]) for r in results] == [("a", "ok", '{"x": 1}'), ("b", "ok", "2"), ("c", "ok", '{"x": 3}')]
+    assert all(r["latency_ms"] >= 190 for r in results)
+
+def test_failures_are_reported_to_the_model():
+    registry = ToolRegistry()
+
+    @registry.register(timeout=0.05)
+    async def hangs():
+        """Never returns in time."""
+        await asyncio.sleep(1)
+
+    @registry.register
+    def fails(n: int):
+        """Raises."""
+        raise ValueError("bad n")
+
+    results = asyncio.run(registry.call_all([
+        _call("hangs", "{}"), _call("fails", '{"n": 1}'), _call("missing", "{}"), _call("fails", "not json")
+    ]))
+    assert [r["status"] for r in results] == ["timeout", "error", "error", "error"]
+    assert "timed out" in results[0]["content"]
+    assert results[1]["content"] == "Error: ValueError: bad n"
+    assert "not found" in results[2]["content"]
+
+def test_cache_canonicalizes_arguments_and_expires():
+    registry = ToolRegistry()
+    calls = []
+
+    @registry.register(cache_ttl=0.2)
+    def fares(origin: str, destination: str, cabin: str = "eco"):
+        """Fares."""
+        calls.append((origin, destination, cabin))
+        return f"{origin}-{destination}-{cabin}"
+
+    async def run():
+        first = await registry.call("fares", '{"origin": "AKL", "destination": "WLG"}')
+        same = await registry.call("fares", '{"destination": "WLG", "cabin": "eco", "origin": "AKL"}')
+        other = await registry.call("fares", '{"origin": "AKL", "destination": "WLG", "cabin": "biz"}')
+        await asyncio.sleep(0.25)
+        expired = await registry.call("fares", '{"origin": "AKL", "destination": "WLG"}')
+        return first, same, other, expired
+
+    first, same, other, expired = asyncio.run(run())
+    assert [r["cache"] for r in (first, same, other, expired)] == ["miss", "hit", "miss", "miss"]
+    assert same["content"] == "AKL-WLG-eco"
+    assert len(calls) == 3
+    assert registry.cache_stats()["fares"]["hits"] == 1
+
+def test_concurrent_identical_calls_share_one_execution():
+    registry = ToolRegistry()
+    executions = []
+
+    @registry.register(cache_ttl=60)
+    async def weather(location: str):
+        """Weather."""
+        executions.append(location)
+        await asyncio.sleep(0.1)
+        return location.upper()
+
+    @registry.register(cache_ttl=60)
+    async def flaky(n: int):
+        """Fails."""
+        executions.append(n)
+        raise RuntimeError("backend down")
+
+    async def run():
+        shared = await registry.call_all([_call("weather", '{"location": "wlg"}', str(i)) for i in range(5)])
+        failures = [await registry.call("flaky", '{"n": 1}') for _ in range(2)]
+        return shared, failures
+
+    shared, failures = asyncio.run(run())
+    assert sorted(r["cache"] for r in shared) == ["miss"] + ["shared"] * 4
+    assert {r["content"] for r in shared} == {"WLG"}
+    # Failures are not cached
+    assert [r["status"] for r in failures] == ["error", "error"]
+    assert executions == ["wlg", 1, 1]
+    assert registry.cache_stats()["weather"]["hit_rate"] == 0.8
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from app.vectorstore import NumpyStore
+
+def _add(store, ids, vectors, source="doc"):
+    store.add(
+        ids=ids,
+        embeddings=vectors,
+        documents=[f"text {i}" for i in ids],
+        metadatas=[{"source": source, "index": n} for n, _ in enumerate(ids)]
+    )
+
+@pytest.fixture
+def store(tmp_path):
+    s = NumpyStore(str(tmp_path))
+    _add(s, ["a", "b", "c"], [[1, 0, 0], [0.9, 0.1, 0], [0, 0, 1]])
+    yield s
+    s.db.close()
+
+def test_query_orders_by_cosine_similarity(store):
+    (hits,) = store.query([[1, 0, 0]], 2)
+    assert [h["id"] for h in hits] == ["a", "b"]
+    assert hits[0]["score"] == pytest.approx(1.0)
+    assert hits[0]["document"] == "text a"
+    assert hits[0]["metadata"] == {"source": "doc", "index": 0}
+
+def test_batched_query_returns_one_list_per_embedding(store):
+    results = store.query([[1, 0, 0], [0, 0, 2]], 1)
+    assert [[h["id"] for h in hits] for hits in results] == [["a"], ["c"]]
+
+def test_float16_store(tmp_path):
+    s = NumpyStore(str(tmp_path), dtype="float16")
+    _add(s, ["a", "b"], [[1, 0], [0, 1]])
+    (hits,) = s.query([[0.2, 1]], 2)
+    assert [h["id"] for h in hits] == ["b", "a"]
+    assert (tmp_path / "vectors-0.bin").stat().st_size == 2 * 2 * 2
+    s.db.close()
+
+def test_dimension_mismatch_is_rejected(store):
+    with pytest.raises(ValueError):
+        _add(store, ["d"], [[1, 0]])
+
+def test_get_and_metadata(store):
+    assert set(store.get(["a", "c", "missing"])) == {"a", "c"}
+    store.update_metadatas(["b"], [{"source": "other", "index": 7}])
+    assert set(store.source_metadatas("doc")) == {"a", "c"}
+    assert store.source_metadatas("other") == {"b": {"source": "other", "index": 7}}
+
+def test_deleted_rows_are_masked(store):
+    store.delete(["a"])
+    (hits,) = store.query([[1, 0, 0]], 5)
+    assert [h["id"] for h in hits] == ["b", "c"]
+    store.delete_source("doc")
+    assert store.count() == 0
+    assert store.query([[1, 0, 0]], 5) == [[]]
+
+def test_compaction_rewrites_live_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(NumpyStore, "COMPACT_MIN_DEAD", 2)
+    s = NumpyStore(str(tmp_path))
+    vectors = np.eye(6)
+    _add(s, [str(i) for i in range(6)], vectors)
+    s.delete(["0", "2", "4", "5"])
+    assert (tmp_path / "vectors-0.bin").exists()  # kept for readers still mapping it
+    assert s.count() == 2
+    for i in (1, 3):
+        (hits,) = s.query([vectors[i]], 1)
+        assert hits[0]["id"] == str(i)
+    _add(s, ["6"], [[0, 0, 0, 0, 0, 1]])
+    (hits,) = s.query([[0, 0, 0, 0, 0, 1]], 1)
+    assert hits[0]["id"] == "6"
+    s.db.close()
+
+def test_scan_pages_through_every_chunk(store):
+    pages = list(store.scan(page_size=2))
+    assert [ids for ids, _, _ in pages] == [["a", "b"], ["c"]]
+    assert pages[0][1] == ["text a", "text b"]
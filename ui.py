@@ -2,6 +2,8 @@ import streamlit as st
 import requests
 import json
 import os
+import uuid
+import time
 
 # Configuration
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
@@ -9,6 +11,14 @@ BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 st.set_page_config(layout="wide", page_title="AI Agents samples")
 st.title("AI Agents samples")
 
+# Minimum seconds between re-renders of a streaming box
+RENDER_INTERVAL = 0.05
+
+# Each browser session gets its own conversation; keep the id in the URL so it survives reloads
+if "session" not in st.query_params:
+    st.query_params["session"] = uuid.uuid4().hex
+SESSION_ID = st.query_params["session"]
+
 tabs = st.tabs(["3.1 Conversational Core", "3.2 RAG", "3.3 Planning Agent", "3.4 Self-Healing Coder"])
 
 # --- Task 3.1: Chat ---
@@ -19,7 +29,7 @@ with tabs[0]:
     if "chat_history" not in st.session_state:
         try:
             # Fetch last 10 messages from the backend
-            response = requests.get(f"{BACKEND_URL}/chat/history")
+            response = requests.get(f"{BACKEND_URL}/chat/history", params={"session_id": SESSION_ID})
             response.raise_for_status()
             st.session_state.chat_history = response.json().get("history", [])
         except requests.exceptions.RequestException as e:
@@ -41,24 +51,29 @@ with tabs[0]:
             
         with st.chat_message("assistant"):
             box = st.empty()
-            text = ""
+            parts = []
             metrics = None
+            last_render = 0.0
             
-            with requests.post(f"{BACKEND_URL}/chat", json={"message": prompt}, stream=True) as r:
+            with requests.post(f"{BACKEND_URL}/chat", json={"message": prompt, "session_id": SESSION_ID}, stream=True) as r:
                 for line in r.iter_lines():
                     if line:
                         data = json.loads(line)
                         if data["type"] == "content":
-                            text += data["data"]
-                            box.markdown(text + "▌")
+                            parts.append(data["data"])
+                            # Throttle markdown re-renders; the backend already coalesces frames
+                            if time.monotonic() - last_render >= RENDER_INTERVAL:
+                                box.markdown("".join(parts) + "▌")
+                                last_render = time.monotonic()
                         elif data["type"] == "metrics":
                             metrics = data["data"]
                         elif data["type"] == "error":
                             st.error(data["data"])
                             
+            text = "".join(parts)
             box.markdown(text)
             if metrics:
-                st.caption(f"Lat: {metrics['latency_ms']}ms | Cost: ${metrics['cost_usd']}")
+                st.caption(f"Lat: {metrics['latency_ms']}ms | TTFT: {metrics['ttft_ms']}ms | {metrics['tokens_per_sec']} tok/s | Cost: ${metrics['cost_usd']}")
                 
             st.session_state.chat_history.append({"role": "assistant", "content": text, "metrics": metrics})
 
@@ -73,6 +88,8 @@ with tabs[1]:
             docs = requests.get(f"{BACKEND_URL}/rag/ingested-docs").json()['documents']
             for doc in docs:
                 st.success(doc)
+            for job in requests.get(f"{BACKEND_URL}/rag/jobs", params={"status": "running"}).json()['jobs']:
+                st.info(f"Ingesting {job['source']}: {job['pages']} pages, {job['chunks']} chunks ({job['chunks_per_sec'] or 0} chunks/s)")
         except Exception as e:
             st.error(f"Could not load ingested documents. Is the backend running? \n\n{e}")
 
@@ -89,29 +106,75 @@ with tabs[1]:
     st.subheader("QA Endpoint")
     q = st.text_input("Ask about the document:")
     if st.button("Search"):
-        with st.spinner("Searching..."):
-            res = requests.post(f"{BACKEND_URL}/rag/query", json={"query": q}).json()
-            st.info(res['answer'])
-            st.metric("Retrieval Latency", f"{res['retrieval_latency_ms']:.1f} ms")
-            
-            with st.expander("Citations"):
-                for citation in res['citations']:
-                    st.write(citation)
+        box = st.empty()
+        retrieval_info = st.empty()
+        parts = []
+        metrics = None
+        last_render = 0.0
+        
+        with requests.post(f"{BACKEND_URL}/rag/query/stream", json={"query": q}, stream=True) as r:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data["type"] == "retrieval":
+                    # Citations arrive before the first answer token
+                    res = data["data"]
+                    with retrieval_info.container():
+                        st.metric("Retrieval Latency", f"{res['retrieval_latency_ms']:.1f} ms")
+                        with st.expander("Citations"):
+                            for citation in res['citations']:
+                                st.write(citation)
+                    box.info("▌")
+                elif data["type"] == "content":
+                    parts.append(data["data"])
+                    if time.monotonic() - last_render >= RENDER_INTERVAL:
+                        box.info("".join(parts) + "▌")
+                        last_render = time.monotonic()
+                elif data["type"] == "metrics":
+                    metrics = data["data"]
+                elif data["type"] == "error":
+                    st.error(data["data"])
+        
+        box.info("".join(parts))
+        if metrics:
+            st.caption(f"Lat: {metrics['latency_ms']}ms | TTFT: {metrics['ttft_ms']}ms | {metrics['tokens_per_sec']} tok/s | Cost: ${metrics['cost_usd']}")
 
 # --- Task 3.3: Agent ---
 with tabs[2]:
     st.header("Autonomous Planning Agent")
     goal = st.text_area("Goal", "Plan a 2-day trip to Auckland for under NZ$500")
     if st.button("Run Planner"):
-        with st.spinner("Agent is thinking (and calling tools)..."):
-            res = requests.post(f"{BACKEND_URL}/agent", json={"prompt": goal}).json()
-            
         st.subheader("Reasoning Logs")
-        for log in res['logs']:
-            st.code(log, language="text")
-            
-        st.subheader("Final Plan")
-        st.markdown(res['plan'])
+        logs = st.container()
+        plan = None
+
+        # Steps and tool results stream in as the agent works
+        with requests.post(f"{BACKEND_URL}/agent/stream", json={"prompt": goal}, stream=True) as r:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                data = event["data"]
+                if event["type"] == "step":
+                    calls = ", ".join(tc["name"] for tc in data["tool_calls"]) or "final answer"
+                    logs.code(f"🧠 Step {data['step']}: {calls} | {data['latency_ms']} ms | {data['prompt_tokens']} + {data['completion_tokens']} tokens | context {data['context_tokens']}", language="text")
+                elif event["type"] == "tool":
+                    cached = " | cached" if data["cache"] in ("hit", "shared") else ""
+                    logs.code(f"🛠 Tool Call: {data['name']} | Args: {data['args']} | {data['latency_ms']:.0f} ms | {data['status']}{cached}", language="text")
+                elif event["type"] == "tools" and data["calls"] > 1:
+                    logs.code(f"⏱ {data['calls']} tools in parallel: {data['wall_ms']:.0f} ms (sequential: {data['sequential_ms']:.0f} ms)", language="text")
+                elif event["type"] == "plan":
+                    plan = data
+                elif event["type"] == "error":
+                    st.error(data)
+
+        if plan:
+            st.subheader("Final Plan")
+            if plan["status"] == "partial":
+                st.warning(f"Stopped early ({plan['stop_reason']} budget exhausted): partial result")
+            st.markdown(plan["plan"])
+            st.caption(f"Steps: {plan['steps']} | Lat: {plan['latency_ms']}ms | Tokens: {plan['prompt_tokens']} + {plan['completion_tokens']} | Cost: ${plan['cost_usd']}")
 
 # --- Task 3.4: Coder ---
 with tabs[3]:
@@ -119,9 +182,12 @@ with tabs[3]:
     task = st.text_input("Coding Task", "Write a python function to calculate fibonacci sequence recursively and test it.")
     if st.button("Generate Code"):
         box = st.empty()
-        output = ""
+        parts = []
+        last_render = 0.0
         with requests.post(f"{BACKEND_URL}/coder", json={"prompt": task}, stream=True) as r:
-            for line in r.iter_lines():
-                if line:
-                    output += line.decode('utf-8') + "\n"
-                    box.text(output)
+            for chunk in r.iter_content(chunk_size=None, decode_unicode=True):
+                parts.append(chunk)
+                if time.monotonic() - last_render >= RENDER_INTERVAL:
+                    box.text("".join(parts))
+                    last_render = time.monotonic()
+        box.text("".join(parts))